@@ -1,13 +1,73 @@
+import atexit
 import datetime
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from contextlib import ContextDecorator
 from itertools import count
-from time import sleep
-from typing import Self
+from time import monotonic, perf_counter, time
+from typing import Callable, Iterable, Iterator, Optional, Self
+from zoneinfo import ZoneInfoNotFoundError
 
-from prometheus_client import CollectorRegistry, Counter, Gauge, write_to_textfile
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    write_to_textfile,
+)
 from pytimeparse import parse as timeparse
 
 from rv_script_lib.arguments import get_custom_parser, get_logger_from_args
-from rv_script_lib.healthchecks import HealthCheckPinger
+from rv_script_lib.budget import DEFAULT_BUDGET_FRACTION, JobBudget, iter_within_budget
+from rv_script_lib.cache import DEFAULT_CACHE_MAX_ENTRIES, CacheManager, parse_size
+from rv_script_lib.cardinality import DEFAULT_MAX_LABEL_SETS, GuardedCollectorRegistry
+from rv_script_lib.healthchecks import HEALTHCHECK_BODY_LIMIT, HealthCheckPinger
+from rv_script_lib.http_client import (
+    DEFAULT_HTTP_BACKOFF_FACTOR,
+    DEFAULT_HTTP_POOL_MAXSIZE,
+    DEFAULT_HTTP_RETRIES,
+    DEFAULT_HTTP_TIMEOUT,
+    InstrumentedSession,
+)
+from rv_script_lib.isolation import build_rlimits, run_isolated
+from rv_script_lib.locking import InstanceLock, splay_seconds
+from rv_script_lib.logging import (
+    DEFAULT_EXCEPTION_MAX_CHARS,
+    DEFAULT_EXCEPTION_MAX_FRAMES,
+    DEFAULT_EXCEPTION_WINDOW,
+    ExceptionDeduplicator,
+    LogLevelSignals,
+    get_log_level,
+    get_log_shipper,
+    log_level_command,
+)
+from rv_script_lib.multiprocess import MULTIPROC_DIR_ENV, MultiProcessMetrics
+from rv_script_lib.pipeline import (
+    DEFAULT_PIPELINE_QUEUE_SIZE,
+    Pipeline,
+    PipelineMetrics,
+)
+from rv_script_lib.schedule import parse_schedule
+from rv_script_lib.shutdown import ShutdownGraceExpired, ShutdownHandler
+from rv_script_lib.state import StateStore
+from rv_script_lib.stats import DEFAULT_STATS_WINDOW, IterationStats, StatsMetrics
+from rv_script_lib.status import StatusFile
+from rv_script_lib.tracing import Tracer, set_tracer
+from rv_script_lib.triggers import (
+    FileWatchTrigger,
+    HttpControlTrigger,
+    SocketControlTrigger,
+    TriggerSet,
+    parse_host_port,
+)
+from rv_script_lib.workqueue import (
+    DEFAULT_LEASE_SECONDS,
+    WorkQueue,
+    WorkQueueMetrics,
+)
 
 
 class ScriptBase:
@@ -16,8 +76,29 @@ class ScriptBase:
     PARSER_INCLUDE_HEALTHCHECKS = True
     PARSER_ARGPARSE_KWARGS = {}
     PARSER_INCLUDE_REPEAT_OPTIONS = False
+    PARSER_INCLUDE_STATE_OPTIONS = False
+    PARSER_INCLUDE_CACHE_OPTIONS = False
+    PARSER_INCLUDE_TRACING_OPTIONS = False
+    PARSER_INCLUDE_LOCKING_OPTIONS = False
+    PARSER_INCLUDE_ISOLATION_OPTIONS = False
+    PARSER_INCLUDE_WORK_QUEUE_OPTIONS = False
     LOG_INITIALIZATION = True
+    LOG_EXCEPTION_WINDOW = DEFAULT_EXCEPTION_WINDOW
+    LOG_EXCEPTION_MAX_FRAMES = DEFAULT_EXCEPTION_MAX_FRAMES
+    LOG_EXCEPTION_MAX_CHARS = DEFAULT_EXCEPTION_MAX_CHARS
     PROM_METRIC_PREFIX = "scriptbase"
+    PROM_MULTIPROCESS = False
+    PROM_MAX_LABEL_SETS = DEFAULT_MAX_LABEL_SETS
+    HTTP_TIMEOUT = DEFAULT_HTTP_TIMEOUT
+    HTTP_RETRIES = DEFAULT_HTTP_RETRIES
+    HTTP_BACKOFF_FACTOR = DEFAULT_HTTP_BACKOFF_FACTOR
+    HTTP_POOL_MAXSIZE = DEFAULT_HTTP_POOL_MAXSIZE
+    HTTP_HOST_POOL_SIZES = {}
+    HEALTHCHECK_BODY_LIMIT = HEALTHCHECK_BODY_LIMIT
+    TRACING_ENABLED = True
+    STATS_WINDOW = DEFAULT_STATS_WINDOW
+    STATS_SUMMARY_INTERVAL = 600
+    JOB_BUDGET_FRACTION = DEFAULT_BUDGET_FRACTION
 
     def __init__(self: Self) -> Self:
         self.parser = get_custom_parser(
@@ -26,6 +107,12 @@ class ScriptBase:
             argparse_kwargs=self.PARSER_ARGPARSE_KWARGS,
             include_healthchecks=self.PARSER_INCLUDE_HEALTHCHECKS,
             include_repeat_group=self.PARSER_INCLUDE_REPEAT_OPTIONS,
+            include_state_options=self.PARSER_INCLUDE_STATE_OPTIONS,
+            include_cache_options=self.PARSER_INCLUDE_CACHE_OPTIONS,
+            include_tracing_options=self.PARSER_INCLUDE_TRACING_OPTIONS,
+            include_locking_options=self.PARSER_INCLUDE_LOCKING_OPTIONS,
+            include_isolation_options=self.PARSER_INCLUDE_ISOLATION_OPTIONS,
+            include_work_queue_options=self.PARSER_INCLUDE_WORK_QUEUE_OPTIONS,
         )
 
         self.extraArgs()
@@ -36,41 +123,346 @@ class ScriptBase:
             args=self.args,
             log_initialization=self.LOG_INITIALIZATION,
             force_log_format=self.FORCE_LOG_FORMAT,
+            exception_formatter=ExceptionDeduplicator(
+                window_seconds=self.LOG_EXCEPTION_WINDOW,
+                max_frames=self.LOG_EXCEPTION_MAX_FRAMES,
+                max_chars=self.LOG_EXCEPTION_MAX_CHARS,
+            ),
         )
 
-        self.prom_registry = CollectorRegistry()
+        self.prom_registry = GuardedCollectorRegistry(
+            max_label_sets=self.PROM_MAX_LABEL_SETS
+        )
+
+        self.prom_multiprocess = None
+        if self.PROM_MULTIPROCESS or self.args.isolate_iterations:
+            # has to happen before any metric is created
+            self.prom_multiprocess = MultiProcessMetrics(
+                path=os.getenv(MULTIPROC_DIR_ENV, "")
+            )
+            self.prom_multiprocess.enable()
+            atexit.register(self.prom_multiprocess.disable)
+
+        self.prom_registry.bind_metrics(prefix=self.PROM_METRIC_PREFIX)
 
         self.prom_success = Gauge(
             f"{self.PROM_METRIC_PREFIX}_success",
             "1 if successful, 0 if not",
             registry=self.prom_registry,
+            multiprocess_mode="mostrecent",
         )
 
-        if self.args.repeat_interval:
-            self.repeat_interval = datetime.timedelta(
-                seconds=timeparse(self.args.repeat_interval)
+        self.prom_log_level = Gauge(
+            f"{self.PROM_METRIC_PREFIX}_log_level",
+            "Active python log level, 10 debug through 50 critical",
+            registry=self.prom_registry,
+            multiprocess_mode="mostrecent",
+        )
+        self.prom_log_level.set_function(lambda: get_log_level() or 0)
+
+        if get_log_shipper() is not None:
+            get_log_shipper().bind_metrics(
+                registry=self.prom_registry,
+                prefix=self.PROM_METRIC_PREFIX,
+            )
+
+        if self.args.repeat_interval and self.args.repeat_schedule:
+            self.parser.error("--repeat-interval and --repeat-schedule are exclusive")
+
+        self.schedule = None
+        if self.args.repeat_schedule:
+            try:
+                self.schedule = parse_schedule(
+                    self.args.repeat_schedule, self.args.schedule_timezone
+                )
+            except (ValueError, ZoneInfoNotFoundError) as e:
+                self.parser.error(f"invalid --repeat-schedule: {e}")
+            self.log.info("schedule set", schedule=str(self.schedule))
+
+        self.repeat_mode = bool(self.args.repeat_interval or self.schedule)
+
+        if self.repeat_mode:
+            if self.args.repeat_interval:
+                self.repeat_interval = datetime.timedelta(
+                    seconds=timeparse(self.args.repeat_interval)
+                )
+                self.log.info("interval set", interval=str(self.repeat_interval))
+            self.prom_next_run = Gauge(
+                f"{self.PROM_METRIC_PREFIX}_next_run_timestamp_seconds",
+                "Unix time the next repeat is due to start",
+                registry=self.prom_registry,
+                multiprocess_mode="mostrecent",
             )
-            self.log.info("interval set", interval=str(self.repeat_interval))
             self.prom_repeat_count = Counter(
                 f"{self.PROM_METRIC_PREFIX}_repeat_count",
                 "Number of times a script has been run",
                 ["status"],
                 registry=self.prom_registry,
             )
+            self.prom_trigger_latency = Histogram(
+                f"{self.PROM_METRIC_PREFIX}_trigger_latency_seconds",
+                "Time from a trigger event to the start of the repeat it caused",
+                ["trigger"],
+                registry=self.prom_registry,
+            )
 
         self.extraMetrics()
 
+        self.tracer = Tracer(
+            enabled=self.TRACING_ENABLED,
+            registry=self.prom_registry,
+            prefix=self.PROM_METRIC_PREFIX,
+            export_path=self.args.trace_file,
+            service_name=self.parser.prog,
+        )
+        set_tracer(self.tracer)
+
+        self.instance_lock = None
+        if self.args.lock_file:
+            self.instance_lock = InstanceLock(
+                path=self.args.lock_file,
+                policy=self.args.lock_policy,
+                registry=self.prom_registry,
+                prefix=self.PROM_METRIC_PREFIX,
+            )
+        self.start_splay = splay_seconds(
+            timeparse(self.args.start_splay) or 0,
+            key=self.parser.prog,
+        )
+
+        self.rlimits = build_rlimits(
+            cpu_seconds=timeparse(self.args.rlimit_cpu) or 0,
+            address_space=parse_size(self.args.rlimit_as or 0),
+        )
+
+        self.stats = IterationStats(size=self.STATS_WINDOW)
+        self.stats_metrics = StatsMetrics(
+            registry=self.prom_registry,
+            prefix=self.PROM_METRIC_PREFIX,
+        )
+        self.iteration_items = 0
+        self.__stats_logged_at = monotonic()
+
+        self.status = StatusFile(directory=self.args.status_dir, name=self.parser.prog)
+        atexit.register(self.status.close)
+
+        self.job_budget = timeparse(self.args.job_budget) or 0
+        self.budget = JobBudget()
+        self.prom_budget_exhausted = Counter(
+            f"{self.PROM_METRIC_PREFIX}_job_budget_exhausted",
+            "Iterations that stopped taking work because the job budget ran out",
+            registry=self.prom_registry,
+        )
+
+        self.state = StateStore(path=self.args.state_path)
+        self.pipeline_metrics = None
+        self.work_queue_metrics = None
+        self.work_queues = {}
+        self.work_queue_path = self.args.work_queue_path
+
+        self.cache = CacheManager(
+            directory=self.args.cache_dir,
+            max_size=parse_size(self.args.cache_max_size),
+            registry=self.prom_registry,
+            prefix=self.PROM_METRIC_PREFIX,
+        )
+
+        wakeup = threading.Event()
+        self.shutdown = ShutdownHandler(
+            grace_seconds=timeparse(self.args.shutdown_grace) or 0,
+            wakeup=wakeup,
+        )
+        self.log_level_signals = LogLevelSignals()
+        self.control_commands = {"loglevel": log_level_command}
+        self.triggers = TriggerSet(
+            debounce_seconds=timeparse(self.args.trigger_debounce) or 0,
+            wakeup=wakeup,
+            stop=self.shutdown.requested,
+        )
+        if self.repeat_mode:
+            self.__add_trigger_sources()
+
+        self.http = InstrumentedSession(
+            timeout=self.HTTP_TIMEOUT,
+            retries=self.HTTP_RETRIES,
+            backoff_factor=self.HTTP_BACKOFF_FACTOR,
+            pool_maxsize=self.HTTP_POOL_MAXSIZE,
+            host_pool_sizes=self.HTTP_HOST_POOL_SIZES,
+            registry=self.prom_registry,
+            prefix=self.PROM_METRIC_PREFIX,
+        )
+
         try:
             self.healthcheck = HealthCheckPinger(
                 uuid=self.args.healthcheck_uuid,
                 healthcheck_protocol=self.args.healthcheck_protocol,
                 healtheck_host=self.args.healthcheck_host,
+                session=self.http,
+                registry=self.prom_registry,
+                prefix=self.PROM_METRIC_PREFIX,
+                body_limit=self.HEALTHCHECK_BODY_LIMIT,
             )
         except AttributeError:
             self.healthcheck = HealthCheckPinger(
                 uuid="",
+                session=self.http,
+                registry=self.prom_registry,
+                prefix=self.PROM_METRIC_PREFIX,
+                body_limit=self.HEALTHCHECK_BODY_LIMIT,
+            )
+
+    def __add_trigger_sources(self: Self):
+        if self.args.trigger_watch:
+            self.triggers.add_source(
+                FileWatchTrigger(
+                    paths=self.args.trigger_watch,
+                    poll_seconds=timeparse(self.args.trigger_watch_poll) or 1,
+                )
+            )
+
+        if self.args.trigger_socket:
+            self.triggers.add_source(
+                SocketControlTrigger(
+                    path=self.args.trigger_socket,
+                    commands=self.control_commands,
+                )
             )
 
+        if self.args.trigger_http:
+            host, port = parse_host_port(self.args.trigger_http)
+            self.triggers.add_source(
+                HttpControlTrigger(
+                    host=host,
+                    port=port,
+                    commands=self.control_commands,
+                )
+            )
+
+    def cached(
+        self: Self,
+        ttl: float,
+        max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+        name: Optional[str] = None,
+    ) -> Callable[[Callable], Callable]:
+        """
+        decorator to cache slow lookups for ttl seconds, across iterations and,
+        with --cache-dir, across restarts.
+
+        lookup = self.cached(ttl=300)(self.fetch_reference_data)
+        """
+        return self.cache.cached(ttl=ttl, max_entries=max_entries, name=name)
+
+    def span(self: Self, name: str, **attributes) -> ContextDecorator:
+        """
+        time a phase of the job, as a context manager or a decorator
+
+        with self.span("fetch", source=url):
+            ...
+
+        Spans opened inside runJob are children of its "runJob" span. Use
+        rv_script_lib.tracing.span to decorate methods in a class body.
+        """
+        return self.tracer.span(name, **attributes)
+
+    def add_items(self: Self, count: int = 1):
+        """
+        count items processed by the current job, for the throughput statistics
+        """
+        self.iteration_items += count
+
+    @property
+    def deadline(self: Self) -> Optional[float]:
+        """
+        time.monotonic() value the current job should be done by, None if unlimited
+        """
+        return self.budget.deadline
+
+    def time_remaining(self: Self) -> float:
+        """
+        seconds left in the current job's budget, math.inf if unlimited
+        """
+        return self.budget.remaining()
+
+    def iter_within_budget(
+        self: Self,
+        items: Iterable,
+        checkpoint: Optional[Callable] = None,
+    ) -> Iterator:
+        """
+        take items until the job budget or a shutdown stops it, then call
+        checkpoint with the last item processed
+
+        for row in self.iter_within_budget(rows, checkpoint=self.save_cursor): ...
+        """
+
+        def budget_exhausted(last):
+            self.prom_budget_exhausted.inc()
+            if checkpoint is not None:
+                checkpoint(last)
+
+        return iter_within_budget(
+            items,
+            budget=self.budget,
+            checkpoint=budget_exhausted,
+            stop=self.shutdown.requested,
+        )
+
+    def pipeline(
+        self: Self,
+        name: str,
+        batch_size: int = 1,
+        queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE,
+    ) -> Pipeline:
+        """
+        create a streaming pipeline that reports into prom_registry, add stages
+        with pipeline.stage(...) and consume pipeline.run(source) inside runJob
+        """
+        if self.pipeline_metrics is None:
+            self.pipeline_metrics = PipelineMetrics(
+                registry=self.prom_registry,
+                prefix=self.PROM_METRIC_PREFIX,
+            )
+
+        return Pipeline(
+            name=name,
+            batch_size=batch_size,
+            queue_size=queue_size,
+            metrics=self.pipeline_metrics,
+        )
+
+    def work_queue(
+        self: Self,
+        name: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        wal: Optional[bool] = None,
+    ) -> WorkQueue:
+        """
+        open a named queue in the --work-queue-path database, shared with every
+        other process using the same file. Without a path the queue is in memory,
+        or with --isolate-iterations in a temporary file the children can share.
+        wal defaults to off with --work-queue-no-wal, for network filesystems.
+
+        for item in self.work_queue("urls").claim(limit=10): ...
+        """
+        if name not in self.work_queues:
+            if self.work_queue_metrics is None:
+                self.work_queue_metrics = WorkQueueMetrics(
+                    registry=self.prom_registry,
+                    prefix=self.PROM_METRIC_PREFIX,
+                )
+            if not self.work_queue_path and self.args.isolate_iterations:
+                temp_dir = tempfile.mkdtemp(prefix="rv-work-queue-")
+                atexit.register(shutil.rmtree, temp_dir, ignore_errors=True)
+                self.work_queue_path = os.path.join(temp_dir, "work.sqlite")
+            self.work_queues[name] = WorkQueue(
+                path=self.work_queue_path,
+                name=name,
+                lease_seconds=lease_seconds,
+                metrics=self.work_queue_metrics,
+                wal=self.args.work_queue_wal if wal is None else wal,
+            )
+        return self.work_queues[name]
+
     def extraArgs(self: Self):
         # override this to add additional arguments
 
@@ -87,59 +479,230 @@ class ScriptBase:
 
         raise NotImplementedError("The run method should be overriden")
 
+    def __run_job(self: Self):
+        if not self.args.isolate_iterations:
+            self.runJob()
+            return
+
+        # the child has its own copy of the state, so it sends back the result
+        result = run_isolated(self.__run_isolated_job, rlimits=self.rlimits)
+        self.state.clear()
+        self.state.update(result["state"])
+        self.iteration_items = result["items"]
+
+    def __run_isolated_job(self: Self) -> dict:
+        # pooled connections belong to the parent, the child opens its own
+        self.http.reset_pools()
+        try:
+            self.runJob()
+            return {"state": dict(self.state), "items": self.iteration_items}
+        finally:
+            self.tracer.flush()
+
     def __run_job_runner(self: Self):
         """
         internal method to send the healthcheck, run the job, and log any exceptions.
         """
         self.healthcheck.start()
 
-        if self.args.repeat_interval:
+        if self.repeat_mode:
             self.prom_repeat_count.labels("total").inc()
 
+        started = (time(), perf_counter())
+        self.iteration_items = 0
+        self.status.update(phase="running", iteration=self.stats.total + 1)
+        self.budget = JobBudget(self.__budget_seconds())
         try:
-            self.runJob()
+            with self.shutdown.job(), self.span("runJob"):
+                self.__run_job()
+            self.state.commit()
 
-        except Exception as e:
+        except (Exception, ShutdownGraceExpired) as e:
             self.log.exception(e)
+            self.state.rollback()
+            self.__record_iteration(started, success=False)
 
             self.prom_success.set(0)
-            if self.args.repeat_interval:
+            if self.repeat_mode:
                 self.prom_repeat_count.labels("fail").inc()
 
             self.healthcheck.fail()
             raise
 
+        finally:
+            self.tracer.flush()
+
         self.prom_success.set(1)
-        if self.args.repeat_interval:
+        if self.repeat_mode:
             self.prom_repeat_count.labels("success").inc()
+        self.__record_iteration(started, success=True)
 
+        self.__write_textfile()
+
+        self.healthcheck.success()
+
+    def __budget_seconds(self: Self) -> Optional[float]:
+        """
+        --job-budget if set, otherwise a share of the time until the next run
+        """
+        if self.job_budget:
+            return self.job_budget
+        if self.schedule is not None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            until_next = (self.schedule.next_fire(now) - now).total_seconds()
+            return until_next * self.JOB_BUDGET_FRACTION
+        if self.repeat_mode:
+            return self.repeat_interval.total_seconds() * self.JOB_BUDGET_FRACTION
+        return None
+
+    def __record_iteration(self: Self, started: tuple[float, float], success: bool):
+        start, timer = started
+        duration = perf_counter() - timer
+        self.stats.record(
+            start=start,
+            duration=duration,
+            success=success,
+            items=self.iteration_items,
+        )
+        self.status.update(
+            phase="idle",
+            last_duration=duration,
+            last_status="success" if success else "fail",
+        )
+        self.stats_metrics.update(self.stats)
+
+        if (
+            self.repeat_mode
+            and monotonic() - self.__stats_logged_at >= self.STATS_SUMMARY_INTERVAL
+        ):
+            self.__stats_logged_at = monotonic()
+            self.log.info("Iteration summary", **self.stats.summary())
+
+    def __run_iteration(self: Self, triggered: bool = False):
+        """
+        wait out the splay and take the instance lock around one job run
+        """
+        if self.start_splay and not triggered:
+            self.log.debug("Waiting for start splay", seconds=self.start_splay)
+            self.status.update(phase="splay")
+            if self.shutdown.requested.wait(self.start_splay):
+                return
+
+        if self.instance_lock is None:
+            self.__run_job_runner()
+            return
+
+        self.status.update(phase="locking")
+        if not self.instance_lock.acquire(stop=self.shutdown.requested):
+            self.log.info("Skipping run, another instance holds the lock")
+            self.status.update(phase="idle", last_status="skipped")
+            return
+
+        try:
+            self.__run_job_runner()
+        finally:
+            self.instance_lock.release()
+
+    def __export_registry(self: Self) -> CollectorRegistry:
+        if self.prom_multiprocess is None:
+            return self.prom_registry
+
+        # function backed gauges are not written to the mmap files on their own
+        self.prom_log_level.set(get_log_level() or 0)
+        return self.prom_multiprocess.export_registry()
+
+    def __write_textfile(self: Self):
         if self.args.prom_textfile:
             self.log.debug("Writing Prometheus textfile", path=self.args.prom_textfile)
-            write_to_textfile(self.args.prom_textfile, self.prom_registry)
+            write_to_textfile(self.args.prom_textfile, self.__export_registry())
 
-        self.healthcheck.success()
+    def __wait_for_next_run(self: Self) -> list[tuple[str, float]]:
+        """
+        sleep until the next interval or scheduled fire time, or an earlier
+        trigger, returns the triggers that fired
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if self.schedule is None:
+            next_run = now + self.repeat_interval
+        else:
+            # never before the previous fire time, in case the clock stepped back
+            next_run = self.schedule.next_fire(max(now, self.__scheduled_run or now))
+            self.__scheduled_run = next_run
+            self.log.debug("next run scheduled", at=next_run.isoformat())
+
+        self.prom_next_run.set(next_run.timestamp())
+        self.status.update(phase="sleeping", next_fire=next_run.timestamp())
+        return self.triggers.wait((next_run - now).total_seconds())
+
+    def __run_loop(self: Self):
+        if not self.repeat_mode:
+            self.__run_iteration()
+            return
+
+        if self.args.repeat_max > 0:
+            iterations = range(1, (self.args.repeat_max + 1))
+        else:
+            iterations = count(start=1, step=1)
+
+        triggered = []
+        self.__scheduled_run = None
+        if self.schedule is not None:
+            triggered = self.__wait_for_next_run()
+            if self.shutdown.requested.is_set():
+                return
+
+        for i in iterations:
+            if triggered:
+                reason, fired_at = triggered[0]
+                self.prom_trigger_latency.labels(reason).observe(monotonic() - fired_at)
+
+            self.log.debug("repeat loop", i=i, max=self.args.repeat_max)
+            self.__run_iteration(triggered=bool(triggered))
+
+            if i == self.args.repeat_max:
+                break
+
+            triggered = self.__wait_for_next_run()
+            if self.shutdown.requested.is_set():
+                break
+
+    def __finish_shutdown(self: Self, exit_code: int):
+        """
+        flush what we can after a signal, and report how the process is exiting
+        """
+        self.log.info("Shutting down", exit_code=exit_code)
+        self.__write_textfile()
+        self.healthcheck.exit_status(exit_code)
+        self.healthcheck.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
 
     def run(self: Self):
         """
         main method that should be called by the user's script.
         """
 
-        if all(
-            [
-                bool(self.args.repeat_interval),
-                self.args.repeat_max > 0,
-            ]
-        ):
-            for i in range(1, (self.args.repeat_max + 1)):
-                self.log.debug("repeat loop", i=i, max=self.args.repeat_max)
-                self.__run_job_runner()
-                sleep(self.repeat_interval.total_seconds())
+        exit_code = 0
+        self.shutdown.install()
+        self.log_level_signals.install()
+        try:
+            if self.repeat_mode:
+                self.triggers.install_sighup()
+                self.triggers.start()
+            self.__run_loop()
+        except ShutdownGraceExpired:
+            exit_code = self.shutdown.exit_code
+        finally:
+            self.triggers.close()
+            self.triggers.restore_sighup()
+            self.log_level_signals.restore()
+            self.shutdown.restore()
+            self.healthcheck.flush()
+            self.status.update(phase="done", next_fire=0.0)
 
-        elif bool(self.args.repeat_interval):
-            for i in count(start=1, step=1):
-                self.log.debug("repeat loop", i=i, max=self.args.repeat_max)
-                self.__run_job_runner()
-                sleep(self.repeat_interval.total_seconds())
+        # the handler records the signal at once, requested is set a moment later
+        if self.shutdown.signum is not None:
+            self.__finish_shutdown(exit_code)
 
-        else:
-            self.__run_job_runner()
+        if exit_code:
+            sys.exit(exit_code)
@@ -7,11 +7,16 @@ from rv_script_lib.healthchecks import (
     HEALTHCHECK_DEFAULT_PROTOCOL,
 )
 from rv_script_lib.lib_types import VerbosityConfigChoice
+from rv_script_lib.locking import DEFAULT_LOCK_POLICY, LOCK_POLICIES
 from rv_script_lib.logging import (
     DEFAULT_LOG_FORMAT,
     LOGLEVEL_FORMATTERS,
+    ExceptionDeduplicator,
     get_custom_logger,
 )
+from rv_script_lib.shutdown import DEFAULT_SHUTDOWN_GRACE
+from rv_script_lib.status import STATUS_DIR_ENV
+from rv_script_lib.triggers import DEFAULT_TRIGGER_DEBOUNCE, DEFAULT_TRIGGER_POLL
 
 
 def get_custom_parser(
@@ -20,6 +25,12 @@ def get_custom_parser(
     argparse_kwargs: Optional[dict] = {},
     include_healthchecks: Optional[bool] = True,
     include_repeat_group: Optional[bool] = False,
+    include_state_options: Optional[bool] = False,
+    include_cache_options: Optional[bool] = False,
+    include_tracing_options: Optional[bool] = False,
+    include_locking_options: Optional[bool] = False,
+    include_isolation_options: Optional[bool] = False,
+    include_work_queue_options: Optional[bool] = False,
 ) -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(**argparse_kwargs)
 
@@ -53,6 +64,14 @@ def get_custom_parser(
             help=f"Log format, default={DEFAULT_LOG_FORMAT}",
         )
 
+    log_arg_group.add_argument(
+        "--log-target",
+        dest="log_target",
+        type=str,
+        default=os.getenv("RV_SCRIPT_LOG_TARGET", ""),
+        help="Send logs to syslog, unix:///path or unixgram:///path instead of stdout. Set with env var RV_SCRIPT_LOG_TARGET",
+    )
+
     if include_healthchecks:
         hc_group = parser.add_argument_group("Healthcheck Options")
         hc_group.add_argument(
@@ -68,14 +87,14 @@ def get_custom_parser(
             dest="healthcheck_host",
             type=str,
             default=os.getenv("HEALTHCHECK_HOSTNAME", HEALTHCHECK_DEFAULT_HOSTNAME),
-            help=f"Healthcheck Hostname. Set with env var HEALTHCHECK_HOSTNAME: Default {HEALTHCHECK_DEFAULT_HOSTNAME}",
+            help=f"Healthcheck Hostname, comma separated for several. Set with env var HEALTHCHECK_HOSTNAME: Default {HEALTHCHECK_DEFAULT_HOSTNAME}",
         )
         hc_group.add_argument(
             "--healthcheck-uuid",
             dest="healthcheck_uuid",
             type=str,
             default=os.getenv("HEALTHCHECK_UUID", ""),
-            help="Healthcheck UUID, set with env var HEALTHCHECK_UUID",
+            help="Healthcheck UUID, comma separated for several, uuid@host pings only that host. Set with env var HEALTHCHECK_UUID",
         )
 
     repeat_group = parser.add_argument_group("Repeat Groups")
@@ -95,6 +114,219 @@ def get_custom_parser(
         default=-1,
         help="repeat max count" if include_repeat_group else argparse.SUPPRESS,
     )
+    repeat_group.add_argument(
+        "--repeat-schedule",
+        dest="repeat_schedule",
+        type=str,
+        default="",
+        help="Repeat on a cron schedule ('*/15 * * * *', '@daily') or calendar line ('weekdays 02:00'), instead of an interval"
+        if include_repeat_group
+        else argparse.SUPPRESS,
+    )
+    repeat_group.add_argument(
+        "--schedule-timezone",
+        dest="schedule_timezone",
+        type=str,
+        default=os.getenv("RV_SCRIPT_SCHEDULE_TIMEZONE", ""),
+        help="Time zone for --repeat-schedule, such as Europe/Berlin, defaults to the system time zone. Set with env var RV_SCRIPT_SCHEDULE_TIMEZONE"
+        if include_repeat_group
+        else argparse.SUPPRESS,
+    )
+    repeat_group.add_argument(
+        "--job-budget",
+        dest="job_budget",
+        type=str,
+        default="",
+        help="Time each job run may take (10m, 1h, etc), defaults to most of the time until the next repeat"
+        if include_repeat_group
+        else argparse.SUPPRESS,
+    )
+
+    trigger_group = parser.add_argument_group("Trigger Options")
+    trigger_group.add_argument(
+        "--trigger-watch",
+        dest="trigger_watch",
+        type=str,
+        action="append",
+        default=[],
+        help="Start the next repeat early when this file or directory changes, can be repeated"
+        if include_repeat_group
+        else argparse.SUPPRESS,
+    )
+    trigger_group.add_argument(
+        "--trigger-watch-poll",
+        dest="trigger_watch_poll",
+        type=str,
+        default=DEFAULT_TRIGGER_POLL,
+        help=f"How often watched paths are checked, default={DEFAULT_TRIGGER_POLL}"
+        if include_repeat_group
+        else argparse.SUPPRESS,
+    )
+    trigger_group.add_argument(
+        "--trigger-socket",
+        dest="trigger_socket",
+        type=str,
+        default="",
+        help="Path of a unix socket that starts the next repeat early when sent 'kick'"
+        if include_repeat_group
+        else argparse.SUPPRESS,
+    )
+    trigger_group.add_argument(
+        "--trigger-http",
+        dest="trigger_http",
+        type=str,
+        default="",
+        help="[host:]port for a local HTTP endpoint, POST /kick starts the next repeat early"
+        if include_repeat_group
+        else argparse.SUPPRESS,
+    )
+    trigger_group.add_argument(
+        "--trigger-debounce",
+        dest="trigger_debounce",
+        type=str,
+        default=DEFAULT_TRIGGER_DEBOUNCE,
+        help=f"Triggers within this window are coalesced, default={DEFAULT_TRIGGER_DEBOUNCE}"
+        if include_repeat_group
+        else argparse.SUPPRESS,
+    )
+
+    state_group = parser.add_argument_group("State Options")
+    state_group.add_argument(
+        "--state-path",
+        dest="state_path",
+        type=str,
+        default="",
+        help="Path to a sqlite file where job state is kept between runs"
+        if include_state_options
+        else argparse.SUPPRESS,
+    )
+
+    status_group = parser.add_argument_group("Status Options")
+    status_group.add_argument(
+        "--status-dir",
+        dest="status_dir",
+        type=str,
+        default=os.getenv(STATUS_DIR_ENV, ""),
+        help=f"Directory for a live status file that rv-script-status reads. Set with env var {STATUS_DIR_ENV}",
+    )
+
+    work_queue_group = parser.add_argument_group("Work Queue Options")
+    work_queue_group.add_argument(
+        "--work-queue-path",
+        dest="work_queue_path",
+        type=str,
+        default=os.getenv("RV_SCRIPT_WORK_QUEUE_PATH", ""),
+        help="Path to a sqlite file holding work queues shared between instances. Set with env var RV_SCRIPT_WORK_QUEUE_PATH"
+        if include_work_queue_options
+        else argparse.SUPPRESS,
+    )
+    work_queue_group.add_argument(
+        "--work-queue-no-wal",
+        dest="work_queue_wal",
+        action="store_false",
+        default=os.getenv("RV_SCRIPT_WORK_QUEUE_NO_WAL", "") == "",
+        help="Open the work queue database without WAL mode, needed on network filesystems. Set with env var RV_SCRIPT_WORK_QUEUE_NO_WAL"
+        if include_work_queue_options
+        else argparse.SUPPRESS,
+    )
+
+    cache_group = parser.add_argument_group("Cache Options")
+    cache_group.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        type=str,
+        default=os.getenv("RV_SCRIPT_CACHE_DIR", ""),
+        help="Directory for the on-disk cache, memory only when unset. Set with env var RV_SCRIPT_CACHE_DIR"
+        if include_cache_options
+        else argparse.SUPPRESS,
+    )
+    cache_group.add_argument(
+        "--cache-max-size",
+        dest="cache_max_size",
+        type=str,
+        default="64M",
+        help="Size limit of the on-disk cache (500k, 64M, 1G), default=64M"
+        if include_cache_options
+        else argparse.SUPPRESS,
+    )
+
+    lock_group = parser.add_argument_group("Locking Options")
+    lock_group.add_argument(
+        "--lock-file",
+        dest="lock_file",
+        type=str,
+        default="",
+        help="Path to a lock file that keeps other instances from running the job at the same time"
+        if include_locking_options
+        else argparse.SUPPRESS,
+    )
+    lock_group.add_argument(
+        "--lock-policy",
+        dest="lock_policy",
+        choices=LOCK_POLICIES,
+        default=DEFAULT_LOCK_POLICY,
+        help=f"Skip the run or wait when another instance holds the lock, default={DEFAULT_LOCK_POLICY}"
+        if include_locking_options
+        else argparse.SUPPRESS,
+    )
+    lock_group.add_argument(
+        "--start-splay",
+        dest="start_splay",
+        type=str,
+        default="",
+        help="Delay each scheduled run by a fixed per-host amount up to this long (30s, 5m, etc)"
+        if include_locking_options
+        else argparse.SUPPRESS,
+    )
+
+    isolation_group = parser.add_argument_group("Isolation Options")
+    isolation_group.add_argument(
+        "--isolate-iterations",
+        dest="isolate_iterations",
+        action="store_true",
+        default=False,
+        help="Run each job in a forked child process, so leaks do not build up"
+        if include_isolation_options
+        else argparse.SUPPRESS,
+    )
+    isolation_group.add_argument(
+        "--rlimit-cpu",
+        dest="rlimit_cpu",
+        type=str,
+        default="",
+        help="CPU time limit for each isolated job (30s, 5m, etc)"
+        if include_isolation_options
+        else argparse.SUPPRESS,
+    )
+    isolation_group.add_argument(
+        "--rlimit-as",
+        dest="rlimit_as",
+        type=str,
+        default="",
+        help="Address space limit for each isolated job (512M, 2G, etc)"
+        if include_isolation_options
+        else argparse.SUPPRESS,
+    )
+
+    shutdown_group = parser.add_argument_group("Shutdown Options")
+    shutdown_group.add_argument(
+        "--shutdown-grace",
+        dest="shutdown_grace",
+        type=str,
+        default=DEFAULT_SHUTDOWN_GRACE,
+        help=f"Time a running job gets to finish after SIGTERM/SIGINT, default={DEFAULT_SHUTDOWN_GRACE}",
+    )
+
+    tracing_group = parser.add_argument_group("Tracing Options")
+    tracing_group.add_argument(
+        "--trace-file",
+        dest="trace_file",
+        type=str,
+        default="",
+        help="Append finished spans to this file as OpenTelemetry (OTLP/JSON) lines"
+        if include_tracing_options
+        else argparse.SUPPRESS,
+    )
 
     prom_group = parser.add_argument_group("Prometheus Options")
     prom_group.add_argument(
@@ -112,6 +344,7 @@ def get_logger_from_args(
     args: argparse.Namespace,
     log_initialization: Optional[bool] = False,
     force_log_format: Optional[str] = "",
+    exception_formatter: Optional[ExceptionDeduplicator] = None,
 ):
     if force_log_format in LOGLEVEL_FORMATTERS.keys():
         use_log_format = force_log_format
@@ -124,4 +357,6 @@ def get_logger_from_args(
         log_format=use_log_format,
         loglevel_argument=args.log_verbosity,
         log_initialization=log_initialization,
+        log_target=args.log_target if "log_target" in args else "",
+        exception_formatter=exception_formatter,
     )
@@ -0,0 +1,88 @@
+import math
+import threading
+from time import monotonic
+from typing import Any, Callable, Iterable, Iterator, Optional, Self
+
+from rv_script_lib.logging import custom_logger_proxy
+
+# share of the repeat interval a job may use when no budget is given
+DEFAULT_BUDGET_FRACTION = 0.9
+
+
+class JobBudget:
+    """
+    Time one job iteration may take, measured on the monotonic clock.
+
+    The deadline is a time.monotonic() value, or None for a budget without a
+    limit, which never runs out.
+    """
+
+    def __init__(self: Self, seconds: Optional[float] = None) -> Self:
+        self.seconds = seconds
+        self.started = monotonic()
+        self.deadline = None if seconds is None else self.started + seconds
+
+    def __repr__(self: Self) -> str:
+        return f"JobBudget(seconds={self.seconds})"
+
+    def elapsed(self: Self) -> float:
+        return monotonic() - self.started
+
+    def remaining(self: Self) -> float:
+        if self.deadline is None:
+            return math.inf
+        return max(self.deadline - monotonic(), 0.0)
+
+    def exhausted(self: Self, needed: float = 0) -> bool:
+        """
+        True when less than `needed` seconds are left
+        """
+        return self.remaining() <= needed
+
+
+def iter_within_budget(
+    items: Iterable[Any],
+    budget: JobBudget,
+    checkpoint: Optional[Callable[[Any], None]] = None,
+    stop: Optional[threading.Event] = None,
+) -> Iterator[Any]:
+    """
+    Yield items until the budget runs out, then call checkpoint(last_item).
+
+    Before taking the next item it checks that the time left covers the
+    average time an item has taken so far, so an item is not started only to
+    overrun the deadline. Items are taken lazily, anything not yielded is
+    still in the source iterator. The checkpoint also runs when `stop` is set,
+    and gets None if nothing was processed. It is not called when the items
+    run out first.
+    """
+    log = custom_logger_proxy()
+    processed = 0
+    busy = 0.0
+    last = None
+
+    iterator = iter(items)
+    while True:
+        needed = busy / processed if processed else 0
+        if budget.exhausted(needed) or (stop is not None and stop.is_set()):
+            log.info(
+                "Job budget used up",
+                processed=processed,
+                remaining=round(budget.remaining(), 3),
+                shutdown=stop is not None and stop.is_set(),
+            )
+            if checkpoint is not None:
+                checkpoint(last)
+            return
+
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+
+        # time between yield and resume is what the caller spent on the item
+        handed_out = monotonic()
+        yield item
+        busy += monotonic() - handed_out
+        processed += 1
+        last = item
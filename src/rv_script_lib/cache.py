@@ -0,0 +1,288 @@
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from time import time
+from typing import Any, Callable, Optional, Self
+
+from prometheus_client import CollectorRegistry, Counter
+
+DEFAULT_CACHE_MAX_ENTRIES = 1024
+DEFAULT_CACHE_MAX_SIZE = 64 * 1024 * 1024
+
+_MISSING = object()
+
+
+def parse_size(value: str) -> int:
+    """
+    parse a size like 500, 10k, 64M or 1G into bytes
+    """
+    value = str(value).strip().upper().removesuffix("B")
+    multipliers = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    if value and value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+
+class DiskCache:
+    """
+    sqlite backed cache tier shared by every Cache in a process, and across restarts
+
+    Once the stored values grow past max_size bytes, the least recently used
+    entries are removed.
+    """
+
+    def __init__(
+        self: Self, directory: str, max_size: int = DEFAULT_CACHE_MAX_SIZE
+    ) -> Self:
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "cache.sqlite")
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self: Self):
+        self._pid = os.getpid()
+        self._conn = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, expires REAL NOT NULL, accessed REAL NOT NULL, "
+            "size INTEGER NOT NULL, value BLOB NOT NULL)"
+        )
+
+    def _check_fork(self: Self):
+        # a sqlite connection must not be used on both sides of a fork
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._connect()
+
+    def get(self: Self, key: str) -> tuple[Any, float]:
+        """
+        returns (value, expiry time), value is _MISSING if not found
+        """
+        now = time()
+        self._check_fork()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return _MISSING, 0
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return _MISSING, 0
+            self._conn.execute(
+                "UPDATE cache SET accessed = ? WHERE key = ?", (now, key)
+            )
+        return pickle.loads(row[0]), row[1]
+
+    def set(self: Self, key: str, value: Any, expires: float) -> int:
+        """
+        store a value, returns the number of entries evicted to make room
+        """
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_size:
+            return 0
+
+        self._check_fork()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, expires, accessed, size, value) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, expires, time(), len(blob), blob),
+            )
+            return self._evict()
+
+    def _evict(self: Self) -> int:
+        evicted = self._conn.execute(
+            "DELETE FROM cache WHERE expires <= ?", (time(),)
+        ).rowcount
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        if total <= self.max_size:
+            return evicted
+
+        rows = self._conn.execute("SELECT key, size FROM cache ORDER BY accessed")
+        remove = []
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            remove.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", remove)
+
+        return evicted + len(remove)
+
+    def clear(self: Self, prefix: str = ""):
+        self._check_fork()
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+            )
+
+    def close(self: Self):
+        with self._lock:
+            self._conn.close()
+
+
+class Cache:
+    """
+    In-process LRU cache with per-entry TTL, backed by an optional DiskCache.
+
+    Values found on disk are promoted into memory for the rest of their TTL.
+    """
+
+    def __init__(
+        self: Self,
+        name: str,
+        ttl: float,
+        max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+        disk: Optional[DiskCache] = None,
+        events: Optional[Counter] = None,
+    ) -> Self:
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk = disk
+        self.events = events
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count(self: Self, event: str, amount: int = 1):
+        if self.events is not None and amount:
+            self.events.labels(self.name, event).inc(amount)
+
+    def _disk_key(self: Self, key: str) -> str:
+        return f"{self.name}:{key}"
+
+    def get(self: Self, key: str, default: Any = None) -> Any:
+        now = time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._count("hit")
+                    return entry[1]
+                del self._entries[key]
+
+        if self.disk is not None:
+            value, expires = self.disk.get(self._disk_key(key))
+            if value is not _MISSING:
+                self._count("hit")
+                self._count("disk_hit")
+                self._remember(key, value, expires)
+                return value
+
+        self._count("miss")
+        return default
+
+    def set(self: Self, key: str, value: Any):
+        expires = time() + self.ttl
+        self._remember(key, value, expires)
+        if self.disk is not None:
+            self._count("eviction", self.disk.set(self._disk_key(key), value, expires))
+
+    def _remember(self: Self, key: str, value: Any, expires: float):
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        self._count("eviction", evicted)
+
+    def clear(self: Self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk is not None:
+            self.disk.clear(prefix=self._disk_key(""))
+
+    @staticmethod
+    def make_key(args: tuple, kwargs: dict) -> str:
+        return hashlib.sha256(
+            pickle.dumps((args, sorted(kwargs.items())), protocol=4)
+        ).hexdigest()
+
+    def __call__(self: Self, func: Callable) -> Callable:
+        """
+        use the cache as a decorator, keyed on the pickled arguments
+        """
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = self.make_key(args, kwargs)
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                value = func(*args, **kwargs)
+                self.set(key, value)
+            return value
+
+        wrapper.cache = self
+        return wrapper
+
+
+class CacheManager:
+    """
+    hands out named caches that share one disk tier and one set of metrics
+    """
+
+    def __init__(
+        self: Self,
+        directory: Optional[str] = "",
+        max_size: int = DEFAULT_CACHE_MAX_SIZE,
+        registry: Optional[CollectorRegistry] = None,
+        prefix: str = "scriptbase",
+    ) -> Self:
+        self.disk = DiskCache(directory, max_size=max_size) if directory else None
+        self.caches = {}
+        self.events = Counter(
+            f"{prefix}_cache_events",
+            "Cache hits, misses and evictions",
+            ["cache", "event"],
+            registry=registry,
+        )
+
+    def get_cache(
+        self: Self,
+        name: str,
+        ttl: float,
+        max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+    ) -> Cache:
+        if name not in self.caches:
+            self.caches[name] = Cache(
+                name=name,
+                ttl=ttl,
+                max_entries=max_entries,
+                disk=self.disk,
+                events=self.events,
+            )
+        return self.caches[name]
+
+    def cached(
+        self: Self,
+        ttl: float,
+        max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+        name: Optional[str] = None,
+    ) -> Callable[[Callable], Callable]:
+        """
+        decorator, caches the function's results for ttl seconds
+        """
+
+        def decorator(func: Callable) -> Callable:
+            cache_name = name or f"{func.__module__}.{func.__qualname__}"
+            return self.get_cache(cache_name, ttl=ttl, max_entries=max_entries)(func)
+
+        return decorator
+
+    def close(self: Self):
+        if self.disk is not None:
+            self.disk.close()
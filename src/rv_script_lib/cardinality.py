@@ -0,0 +1,125 @@
+import threading
+from typing import Self
+
+from prometheus_client import CollectorRegistry, Counter, Gauge
+from prometheus_client.metrics import MetricWrapperBase
+
+from rv_script_lib.logging import custom_logger_proxy
+
+DEFAULT_MAX_LABEL_SETS = 1000
+OVERFLOW_LABEL_VALUE = "other"
+
+
+class GuardedCollectorRegistry(CollectorRegistry):
+    """
+    CollectorRegistry that caps the number of label sets each metric can have.
+
+    Every labelled metric registered here gets a guarded labels() method. Once a
+    metric holds max_label_sets children, a call with a new label set returns
+    the child with every label set to "other" instead, and the first overflow is
+    logged with the label that has the most distinct values. The cap is checked
+    without the metric's lock, so concurrent callers can overshoot it slightly.
+    A max_label_sets of 0 turns the guard off.
+    """
+
+    def __init__(
+        self: Self, max_label_sets: int = DEFAULT_MAX_LABEL_SETS, **kwargs
+    ) -> Self:
+        super().__init__(**kwargs)
+        self.log = custom_logger_proxy()
+        self.max_label_sets = max_label_sets
+        self.overflowed = set()
+        self.label_sets = None
+        self.overflows = None
+        self._guard_lock = threading.Lock()
+
+    def bind_metrics(self: Self, prefix: str = "scriptbase"):
+        """
+        export the guard's own gauges, in multiprocess mode call this after
+        enabling it
+        """
+        if self.label_sets is not None:
+            return
+
+        # registered directly, so they are not guarded themselves
+        self.label_sets = Gauge(
+            f"{prefix}_metric_label_sets",
+            "Distinct label sets held by each labelled metric",
+            ["metric"],
+            registry=None,
+            multiprocess_mode="max",
+        )
+        self.overflows = Counter(
+            f"{prefix}_metric_label_overflow",
+            f"Label sets folded into '{OVERFLOW_LABEL_VALUE}' after reaching the limit",
+            ["metric"],
+            registry=None,
+        )
+        super().register(self.label_sets)
+        super().register(self.overflows)
+
+    def register(self: Self, collector):
+        super().register(collector)
+        if (
+            self.max_label_sets
+            and isinstance(collector, MetricWrapperBase)
+            and collector._labelnames
+        ):
+            collector.labels = self._guard(collector)
+
+    def _guard(self: Self, metric: MetricWrapperBase):
+        labels = metric.labels
+        children = metric._metrics
+        labelnames = metric._labelnames
+        limit = self.max_label_sets
+
+        def guarded_labels(*labelvalues, **labelkwargs):
+            size = len(children)
+            if size < limit:
+                child = labels(*labelvalues, **labelkwargs)
+                if len(children) != size and self.label_sets is not None:
+                    self.label_sets.labels(metric._name).set(len(children))
+                return child
+
+            if labelvalues and labelkwargs:
+                return labels(*labelvalues, **labelkwargs)
+            if labelkwargs:
+                if sorted(labelkwargs) != sorted(labelnames):
+                    # let prometheus_client raise its usual error
+                    return labels(**labelkwargs)
+                key = tuple(str(labelkwargs[name]) for name in labelnames)
+            else:
+                key = tuple(str(value) for value in labelvalues)
+                if len(key) != len(labelnames):
+                    return labels(*labelvalues)
+
+            if key in children:
+                return children[key]
+
+            self._overflow(metric, key)
+            return labels(*[OVERFLOW_LABEL_VALUE] * len(labelnames))
+
+        return guarded_labels
+
+    def _overflow(self: Self, metric: MetricWrapperBase, key: tuple[str, ...]):
+        if self.overflows is not None:
+            self.overflows.labels(metric._name).inc()
+
+        with self._guard_lock:
+            if metric._name in self.overflowed:
+                return
+            self.overflowed.add(metric._name)
+
+        # the label with the most distinct values is the likely culprit
+        with metric._lock:
+            keys = list(metric._metrics)
+        distinct = [len({k[i] for k in keys}) for i in range(len(key))]
+        worst = distinct.index(max(distinct))
+        self.log.warning(
+            "Metric has too many label sets, folding new ones into "
+            f"'{OVERFLOW_LABEL_VALUE}'",
+            metric=metric._name,
+            label=metric._labelnames[worst],
+            value=key[worst],
+            max_label_sets=self.max_label_sets,
+        )
@@ -1,43 +1,321 @@
-from typing import Literal, Optional, Self
+import io
+import mmap
+import os
+import stat
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from time import perf_counter
+from typing import BinaryIO, Iterable, Literal, Optional, Self, Union
 from urllib.parse import urlunparse
 
 import requests
+from prometheus_client import CollectorRegistry, Counter, Histogram
 
 from rv_script_lib.logging import custom_logger_proxy
 
 HEALTHCHECK_DEFAULT_PROTOCOL = "https"
 HEALTHCHECK_DEFAULT_HOSTNAME = "hc-ping.com"
+HEALTHCHECK_FLUSH_TIMEOUT = 30
+# hc-ping.com keeps the first 100kB of a ping body, self-hosted servers may differ
+HEALTHCHECK_BODY_LIMIT = 100_000
+HEALTHCHECK_BODY_CHUNK = 64 * 1024
+
+BodySource = Union[str, bytes, bytearray, memoryview, os.PathLike, BinaryIO, Iterable]
+
+
+def split_list(value: Union[str, Iterable[str], None]) -> list[str]:
+    """
+    split a comma separated string, or clean up a list of strings
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [item.strip() for item in value if item and item.strip()]
+
+
+def parse_targets(
+    uuids: Union[str, Iterable[str], None],
+    hosts: Union[str, Iterable[str], None],
+) -> list[tuple[str, str]]:
+    """
+    (uuid, host) pairs to ping. A uuid is pinged on every host, unless it is
+    written as uuid@host, which pins it to that host.
+    """
+    hosts = split_list(hosts) or [HEALTHCHECK_DEFAULT_HOSTNAME]
+    targets = []
+    for uuid in split_list(uuids):
+        uuid, _, pinned_host = uuid.partition("@")
+        for host in [pinned_host] if pinned_host else hosts:
+            if (uuid, host) not in targets:
+                targets.append((uuid, host))
+    return targets
+
+
+def read_body(
+    source: Optional[BodySource],
+    limit: int = HEALTHCHECK_BODY_LIMIT,
+    part: Literal["head", "tail"] = "tail",
+) -> Optional[memoryview]:
+    """
+    The first or last `limit` bytes of a ping body, reading no more than that.
+
+    str is sent as text, a path (os.PathLike) or a regular file is memory-mapped
+    and sliced, other seekable files are read from the needed offset, and pipes
+    or iterators of bytes are read in chunks, keeping at most `limit` bytes.
+    """
+    if source is None:
+        return None
+    if isinstance(source, str):
+        source = source.encode()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return _slice(memoryview(source).cast("B"), limit, part)
+
+    if isinstance(source, os.PathLike):
+        with open(source, "rb") as f:
+            return _read_file(f, limit, part)
+    if isinstance(source, io.TextIOBase):
+        # text files are read through their binary buffer, StringIO is in memory
+        source = source.buffer if hasattr(source, "buffer") else source.read()
+        if isinstance(source, str):
+            return _slice(memoryview(source.encode()), limit, part)
+    if hasattr(source, "read"):
+        return _read_file(source, limit, part)
+    return _read_chunks(iter(source), limit, part)
+
+
+def _slice(view: memoryview, limit: int, part: str) -> memoryview:
+    if len(view) <= limit:
+        return view
+    return view[:limit] if part == "head" else view[len(view) - limit :]
+
+
+def _read_file(f: BinaryIO, limit: int, part: str) -> memoryview:
+    try:
+        fd = f.fileno()
+        file_stat = os.fstat(fd)
+    except (OSError, AttributeError, io.UnsupportedOperation):
+        fd = None
+
+    # /proc files and the like report a size of 0, so are read like a pipe
+    if fd is not None and stat.S_ISREG(file_stat.st_mode) and file_stat.st_size:
+        # the mapping outlives the descriptor and is freed with the last view
+        mapped = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        return _slice(memoryview(mapped), limit, part)
+
+    if getattr(f, "seekable", lambda: False)():
+        size = f.seek(0, os.SEEK_END)
+        f.seek(0 if part == "head" else max(size - limit, 0))
+        return memoryview(f.read(limit) or b"")
+
+    return _read_chunks(iter(lambda: f.read(HEALTHCHECK_BODY_CHUNK), b""), limit, part)
+
+
+def _read_chunks(chunks: Iterable, limit: int, part: str) -> memoryview:
+    kept = deque()
+    size = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        kept.append(chunk)
+        size += len(chunk)
+        if part == "head" and size >= limit:
+            break
+        # drop whole chunks that are no longer part of the tail
+        while part == "tail" and size - len(kept[0]) >= limit:
+            size -= len(kept.popleft())
+
+    return _slice(memoryview(b"".join(kept)), limit, part)
+
+
+class BodyReader:
+    """
+    File-like view of a ping body, so requests streams it without copying and
+    can rewind it for a retry. Each request needs its own reader.
+    """
+
+    def __init__(self: Self, view: memoryview) -> Self:
+        self.view = view
+        self.position = 0
+
+    def __len__(self: Self) -> int:
+        return len(self.view)
+
+    def read(self: Self, size: int = -1) -> memoryview:
+        end = len(self.view) if size is None or size < 0 else self.position + size
+        chunk = self.view[self.position : end]
+        self.position += len(chunk)
+        return chunk
+
+    def tell(self: Self) -> int:
+        return self.position
+
+    def seek(self: Self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.position, os.SEEK_END: len(self)}
+        self.position = min(max(base[whence] + offset, 0), len(self))
+        return self.position
 
 
 class HealthCheckPinger:
+    """
+    Pings one or more healthchecks.io checks, possibly on several hosts.
+
+    With several targets, pings go out concurrently from one thread per target,
+    which keeps each target's pings in order. A ping call returns as soon as one
+    target has accepted it, the others finish in the background, and flush()
+    waits for them.
+
+    Ping bodies can be text, bytes, a path, a file or an iterator of bytes. Only
+    the head or tail that fits in body_limit is read, see read_body().
+    """
+
     def __init__(
         self: Self,
-        uuid: str,
+        uuid: Union[str, Iterable[str], None],
         healthcheck_protocol: Optional[
             Literal["http", "https"]
         ] = HEALTHCHECK_DEFAULT_PROTOCOL,
-        healtheck_host: Optional[str] = "hc-ping.com",
+        healtheck_host: Union[str, Iterable[str], None] = "hc-ping.com",
+        session: Optional[requests.Session] = None,
+        registry: Optional[CollectorRegistry] = None,
+        prefix: str = "scriptbase",
+        body_limit: int = HEALTHCHECK_BODY_LIMIT,
+        body_part: Literal["head", "tail"] = "tail",
     ) -> Self:
-        self.log = custom_logger_proxy()
+        self.logger = custom_logger_proxy()
+        self.session = session or requests.Session()
         self.uuid = uuid
         self.healthcheck_protocol = healthcheck_protocol
         self.healtheck_host = healtheck_host
+        self.hosts = split_list(healtheck_host) or [HEALTHCHECK_DEFAULT_HOSTNAME]
+        self.targets = parse_targets(uuid, self.hosts)
+        self._pid = os.getpid()
+        self._executors = {}
+        self._pending = set()
+        self.body_limit = body_limit
+        self.body_part = body_part
+
+        self.pings = Counter(
+            f"{prefix}_healthcheck_pings",
+            "Healthcheck pings sent to each target, by endpoint and result",
+            ["target", "endpoint", "result"],
+            registry=registry,
+        )
+        self.ping_latency = Histogram(
+            f"{prefix}_healthcheck_ping_duration_seconds",
+            "Latency of healthcheck pings to each target",
+            ["target"],
+            registry=registry,
+        )
+
+    @staticmethod
+    def target_label(uuid: str, host: str) -> str:
+        # enough of the uuid to tell checks apart, without publishing the ping url
+        return f"{host}/{uuid[:8]}"
+
+    def __ping(
+        self: Self,
+        endpoint_suffix: str,
+        endpoint_name: str,
+        params: Optional[dict] = None,
+        data: Optional[BodySource] = None,
+    ) -> bool:
+        """
+        ping every target, returns True once any of them accepted the ping
+        """
+        if not self.targets:
+            self.logger.debug("Healthcheck uuid not set, skipping")
+            return
+
+        # read once, every target sends from the same buffer
+        data = read_body(data, limit=self.body_limit, part=self.body_part)
+        kwargs = {"endpoint_name": endpoint_name, "params": params, "data": data}
+        if len(self.targets) == 1:
+            uuid, host = self.targets[0]
+            return self.__call_target(uuid, host, endpoint_suffix, **kwargs)
+
+        self.__reset_after_fork()
+        futures = set()
+        for uuid, host in self.targets:
+            if (uuid, host) not in self._executors:
+                self._executors[(uuid, host)] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="rv-healthcheck"
+                )
+            futures.add(
+                self._executors[(uuid, host)].submit(
+                    self.__call_target, uuid, host, endpoint_suffix, **kwargs
+                )
+            )
+        self._pending = {f for f in self._pending if not f.done()} | futures
+
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            if any(self.__ping_result(future) for future in done):
+                return True
+        return False
+
+    def __reset_after_fork(self: Self):
+        # executor threads do not survive a fork, a child starts its own
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._executors = {}
+            self._pending = set()
+
+    @staticmethod
+    def __ping_result(future: Future) -> bool:
+        try:
+            return bool(future.result())
+        except Exception:
+            return False
+
+    def __call_target(
+        self: Self, uuid: str, host: str, endpoint_suffix: str, **kwargs
+    ) -> bool:
+        label = self.target_label(uuid, host)
+        started = perf_counter()
+        result = False
+        try:
+            result = self.__call_hc_api(
+                endpoint_path=f"/{uuid}{endpoint_suffix}", host=host, **kwargs
+            )
+            return result
+        finally:
+            self.ping_latency.labels(label).observe(perf_counter() - started)
+            self.pings.labels(
+                label, kwargs["endpoint_name"], "success" if result else "failure"
+            ).inc()
+
+    def flush(self: Self, timeout: float = HEALTHCHECK_FLUSH_TIMEOUT) -> bool:
+        """
+        wait for pings still in flight, returns False if some did not finish
+        """
+        self.__reset_after_fork()
+        if not self._pending:
+            return True
+        _, not_done = wait(self._pending, timeout=timeout)
+        self._pending = not_done
+        if not_done:
+            self.logger.warning(
+                "Healthcheck pings still pending", pending=len(not_done)
+            )
+        return not not_done
 
     def __call_hc_api(
         self: Self,
         endpoint_path: str,
         endpoint_name: str,
         params: Optional[dict] = None,
-        data: Optional[str] = None,
+        data: Optional[memoryview] = None,
+        host: Optional[str] = None,
     ) -> bool:
-        if not self.uuid:
-            self.log.debug("Healthcheck uuid not set, skipping")
+        if not self.targets:
+            self.logger.debug("Healthcheck uuid not set, skipping")
             return
 
         url = urlunparse(
             (
                 self.healthcheck_protocol,
-                self.healtheck_host,
+                host or self.hosts[0],
                 endpoint_path,
                 "",
                 "",
@@ -45,16 +323,28 @@ class HealthCheckPinger:
             )
         )
 
-        self.log.debug("Calling Healthcheck", endpoint=endpoint_name, url=url)
+        self.logger.debug("Calling Healthcheck", endpoint=endpoint_name, url=url)
 
-        resp = requests.post(url, params=params, data=data)
+        try:
+            resp = self.session.post(
+                url,
+                params=params,
+                data=BodyReader(data) if data is not None else None,
+            )
+        except requests.RequestException as e:
+            self.logger.warning(
+                "Healthcheck request failed", endpoint=endpoint_name, error=str(e)
+            )
+            return False
 
         if "(not found)" in resp.text.lower():
-            self.log.warning("Healthcheck not found", endpoint=endpoint_name, url=url)
+            self.logger.warning(
+                "Healthcheck not found", endpoint=endpoint_name, url=url
+            )
             return False
 
         if "(rate limited)" in resp.text.lower():
-            self.log.warning(
+            self.logger.warning(
                 "Healthcheck rate limited", endpoint=endpoint_name, url=url
             )
             return False
@@ -63,7 +353,7 @@ class HealthCheckPinger:
             resp.raise_for_status()
             return True
         except Exception as e:
-            self.log.exception(e)
+            self.logger.exception(e)
 
         return False
 
@@ -71,51 +361,60 @@ class HealthCheckPinger:
     def __get_optional_params(**hc_kwargs) -> dict:
         return {key: value for key, value in hc_kwargs.items() if bool(value)}
 
-    def success(self: Self, rid: Optional[str] = ""):
-        self.__call_hc_api(
-            endpoint_path=f"/{self.uuid}",
+    def success(self: Self, rid: Optional[str] = "", data: Optional[BodySource] = None):
+        return self.__ping(
+            endpoint_suffix="",
             endpoint_name="success",
             params=self.__get_optional_params(rid=rid),
+            data=data,
         )
 
-    def start(self: Self, rid: Optional[str] = ""):
-        self.__call_hc_api(
-            endpoint_path=f"/{self.uuid}/start",
+    def start(self: Self, rid: Optional[str] = "", data: Optional[BodySource] = None):
+        return self.__ping(
+            endpoint_suffix="/start",
             endpoint_name="start",
             params=self.__get_optional_params(rid=rid),
+            data=data,
         )
 
-    def fail(self: Self, rid: Optional[str] = ""):
-        self.__call_hc_api(
-            endpoint_path=f"/{self.uuid}/fail",
+    def fail(self: Self, rid: Optional[str] = "", data: Optional[BodySource] = None):
+        return self.__ping(
+            endpoint_suffix="/fail",
             endpoint_name="fail",
             params=self.__get_optional_params(rid=rid),
+            data=data,
         )
 
-    def log(self: Self, log_event: str, rid: Optional[str] = ""):
-        self.__call_hc_api(
-            endpoint_path=f"/{self.uuid}/log",
+    def log(self: Self, log_event: BodySource, rid: Optional[str] = ""):
+        return self.__ping(
+            endpoint_suffix="/log",
             endpoint_name="log",
             params=self.__get_optional_params(rid=rid),
             data=log_event,
         )
 
-    def exit_status(self: Self, exit_status: int, rid: Optional[str] = ""):
+    def exit_status(
+        self: Self,
+        exit_status: int,
+        rid: Optional[str] = "",
+        data: Optional[BodySource] = None,
+    ):
         if not isinstance(exit_status, int):
-            self.log.error(
+            self.logger.error(
                 "Aborting", reason="exit status is not integer", exit_status=exit_status
             )
             return
         if not 0 <= exit_status <= 255:
-            self.log.error(
+            self.logger.error(
                 "Aborting",
                 reason="exit status needs to be in range 0-255",
                 exit_status=exit_status,
             )
             return
 
-        self.__call_hc_api(
-            endpoint_path=f"/{self.uuid}/{exit_status}",
+        return self.__ping(
+            endpoint_suffix=f"/{exit_status}",
             endpoint_name="log",
             params=self.__get_optional_params(rid=rid),
+            data=data,
         )
@@ -0,0 +1,93 @@
+from time import perf_counter
+from typing import Optional, Self
+from urllib.parse import urlparse
+
+import requests
+from prometheus_client import CollectorRegistry, Histogram
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_HTTP_TIMEOUT = 30
+DEFAULT_HTTP_RETRIES = 3
+DEFAULT_HTTP_BACKOFF_FACTOR = 0.5
+DEFAULT_HTTP_POOL_MAXSIZE = 10
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class InstrumentedSession(requests.Session):
+    """
+    requests Session with default timeouts, retries with backoff, per-host pool
+    sizes and a latency histogram labelled by host, method and status.
+
+    Retries follow urllib3's defaults and only repeat idempotent methods.
+    """
+
+    def __init__(
+        self: Self,
+        timeout: Optional[float] = DEFAULT_HTTP_TIMEOUT,
+        retries: int = DEFAULT_HTTP_RETRIES,
+        backoff_factor: float = DEFAULT_HTTP_BACKOFF_FACTOR,
+        pool_maxsize: int = DEFAULT_HTTP_POOL_MAXSIZE,
+        host_pool_sizes: Optional[dict[str, int]] = None,
+        registry: Optional[CollectorRegistry] = None,
+        prefix: str = "scriptbase",
+    ) -> Self:
+        super().__init__()
+        self.timeout = timeout
+        self.retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=HTTP_RETRY_STATUSES,
+            raise_on_status=False,
+        )
+
+        self.pool_sizes = {}
+        self.mount_pool("https://", pool_maxsize)
+        self.mount_pool("http://", pool_maxsize)
+        for host, host_pool_size in (host_pool_sizes or {}).items():
+            self.mount_pool(f"https://{host}", host_pool_size)
+            self.mount_pool(f"http://{host}", host_pool_size)
+
+        self.latency = Histogram(
+            f"{prefix}_http_request_duration_seconds",
+            "Latency of HTTP requests made through the shared session",
+            ["host", "method", "status"],
+            registry=registry,
+        )
+
+    def mount_pool(self: Self, prefix: str, pool_maxsize: int):
+        """
+        mount an adapter for a url prefix with its own connection pool size
+        """
+        self.pool_sizes[prefix] = pool_maxsize
+        self.mount(
+            prefix,
+            HTTPAdapter(
+                pool_connections=pool_maxsize,
+                pool_maxsize=pool_maxsize,
+                max_retries=self.retry,
+            ),
+        )
+
+    def reset_pools(self: Self):
+        """
+        drop every pooled connection and mount fresh adapters, call this in a
+        forked child so it does not share sockets with its parent
+        """
+        self.close()
+        for prefix, pool_maxsize in self.pool_sizes.items():
+            self.mount_pool(prefix, pool_maxsize)
+
+    def request(self: Self, method: str, url: str, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlparse(url).hostname or ""
+        status = "error"
+        started = perf_counter()
+        try:
+            resp = super().request(method, url, *args, **kwargs)
+            status = str(resp.status_code)
+            return resp
+        finally:
+            self.latency.labels(host, method.upper(), status).observe(
+                perf_counter() - started
+            )
@@ -0,0 +1,105 @@
+import json
+import os
+import resource
+import signal
+import sys
+from typing import Any, Callable, Optional, Self
+
+from rv_script_lib.logging import close_log_shipper, custom_logger_proxy
+from rv_script_lib.shutdown import ShutdownGraceExpired
+
+# seconds between SIGXCPU at the soft cpu limit and SIGKILL at the hard limit
+RLIMIT_CPU_KILL_AFTER = 5
+
+
+class IsolatedJobFailed(Exception):
+    """
+    raised in the parent when the forked child did not finish its job
+    """
+
+    def __init__(self: Self, exit_code: int):
+        if exit_code < 0:
+            reason = f"killed by {signal.Signals(-exit_code).name}"
+        else:
+            reason = f"exited with {exit_code}"
+        super().__init__(f"isolated job {reason}")
+        self.exit_code = exit_code
+
+
+def build_rlimits(
+    cpu_seconds: Optional[int] = 0, address_space: Optional[int] = 0
+) -> dict[int, tuple[int, int]]:
+    """
+    soft and hard limits to apply in the child, zero means unlimited
+    """
+    limits = {}
+    if cpu_seconds:
+        limits[resource.RLIMIT_CPU] = (cpu_seconds, cpu_seconds + RLIMIT_CPU_KILL_AFTER)
+    if address_space:
+        limits[resource.RLIMIT_AS] = (address_space, address_space)
+    return limits
+
+
+def set_rlimits(limits: dict[int, tuple[int, int]]):
+    for limit, (soft, hard) in limits.items():
+        _, current_hard = resource.getrlimit(limit)
+        if current_hard != resource.RLIM_INFINITY:
+            # an unprivileged process can only lower its hard limits
+            soft, hard = min(soft, current_hard), min(hard, current_hard)
+        resource.setrlimit(limit, (soft, hard))
+
+
+def run_isolated(
+    func: Callable[[], Any],
+    rlimits: Optional[dict[int, tuple[int, int]]] = None,
+) -> Any:
+    """
+    Run func in a forked child under rlimits, and return its JSON serializable
+    result in the parent.
+
+    Anything the child leaks, memory, descriptors or threads, goes away when it
+    exits. If the parent is interrupted, such as by ShutdownGraceExpired, the
+    child is killed before the exception is re-raised.
+    """
+    log = custom_logger_proxy()
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        exit_code = 1
+        try:
+            set_rlimits(rlimits or {})
+            result = json.dumps(func()).encode()
+            with os.fdopen(write_fd, "wb") as f:
+                f.write(result)
+            exit_code = 0
+        except ShutdownGraceExpired as e:
+            log.error("Isolated job abandoned at shutdown")
+            exit_code = 128 + e.signum
+        except BaseException:
+            log.exception("Isolated job failed")
+        finally:
+            close_log_shipper()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    os.close(write_fd)
+    try:
+        with os.fdopen(read_fd, "rb") as f:
+            output = f.read()
+        _, status = os.waitpid(pid, 0)
+    except BaseException:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        raise
+
+    exit_code = os.waitstatus_to_exitcode(status)
+    if exit_code != 0:
+        raise IsolatedJobFailed(exit_code)
+
+    log.debug("Isolated job finished", pid=pid)
+    return json.loads(output)
@@ -0,0 +1,158 @@
+import fcntl
+import hashlib
+import os
+import socket
+import threading
+from typing import Literal, Optional, Self
+
+from prometheus_client import CollectorRegistry, Counter
+
+from rv_script_lib.logging import custom_logger_proxy
+from rv_script_lib.multiprocess import pid_is_alive
+
+DEFAULT_LOCK_POLICY = "skip"
+LOCK_POLICIES = ("skip", "wait")
+LOCK_POLL_SECONDS = 0.5
+
+type LockPolicy = Literal["skip", "wait"]
+
+
+def splay_seconds(
+    max_seconds: float, key: str, hostname: Optional[str] = None
+) -> float:
+    """
+    deterministic delay in [0, max_seconds) for this host and key, so a fleet
+    running the same script spreads out, while each host keeps a steady offset
+    """
+    if max_seconds <= 0:
+        return 0.0
+    digest = hashlib.sha256(f"{hostname or socket.gethostname()}:{key}".encode())
+    fraction = int.from_bytes(digest.digest()[:8], "big") / 2**64
+    return fraction * max_seconds
+
+
+def read_lock_owner(path: str) -> tuple[int, str]:
+    """
+    returns (pid, hostname) written by the holder of a lock file, (0, "") if unknown
+    """
+    try:
+        with open(path) as f:
+            pid, _, hostname = f.read().strip().partition(" ")
+        return int(pid), hostname
+    except (OSError, ValueError):
+        return 0, ""
+
+
+class InstanceLock:
+    """
+    Exclusive flock on a file, so only one copy of a script runs a job at a time.
+
+    The holder writes "pid hostname" into the file. The kernel drops the lock
+    when the holder exits, so a record left by a dead process never blocks the
+    next run. If the lock is held while the recorded pid on this host is dead, a
+    child that inherited the descriptor still holds it. That is only reported,
+    since the file is never removed while locked.
+
+    With the "skip" policy acquire() gives up at once when the lock is held, with
+    "wait" it polls until the lock is free or `stop` is set.
+    """
+
+    def __init__(
+        self: Self,
+        path: str,
+        policy: LockPolicy = DEFAULT_LOCK_POLICY,
+        registry: Optional[CollectorRegistry] = None,
+        prefix: str = "scriptbase",
+    ) -> Self:
+        if policy not in LOCK_POLICIES:
+            raise ValueError(f"unknown lock policy {policy}")
+        self.log = custom_logger_proxy()
+        self.path = path
+        self.policy = policy
+        self.hostname = socket.gethostname()
+        self._fd = None
+        self.contention = Counter(
+            f"{prefix}_lock_contention",
+            "Times the instance lock was found held by another process",
+            registry=registry,
+        )
+        self.skipped = Counter(
+            f"{prefix}_skipped_runs",
+            "Runs skipped because another instance held the lock",
+            registry=registry,
+        )
+
+    @property
+    def held(self: Self) -> bool:
+        return self._fd is not None
+
+    def _try_lock(self: Self) -> bool:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            current = None
+        locked = os.fstat(fd)
+        if current is None or (current.st_dev, current.st_ino) != (
+            locked.st_dev,
+            locked.st_ino,
+        ):
+            # the file was replaced while we were locking it, try again
+            os.close(fd)
+            return self._try_lock()
+
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()} {self.hostname}\n".encode())
+        self._fd = fd
+        return True
+
+    def acquire(self: Self, stop: Optional[threading.Event] = None) -> bool:
+        """
+        take the lock, returns False if the run should be skipped
+        """
+        if self.held:
+            return True
+
+        stop = stop or threading.Event()
+        contended = False
+        while True:
+            if self._try_lock():
+                return True
+
+            if not contended:
+                contended = True
+                self.contention.inc()
+                pid, hostname = read_lock_owner(self.path)
+                if pid and hostname == self.hostname and not pid_is_alive(pid):
+                    self.log.warning(
+                        "Instance lock is held by a process that inherited it "
+                        "from a dead holder",
+                        path=self.path,
+                        pid=pid,
+                        policy=self.policy,
+                    )
+                else:
+                    self.log.info(
+                        "Instance lock is held",
+                        path=self.path,
+                        pid=pid,
+                        hostname=hostname,
+                        policy=self.policy,
+                    )
+
+            if self.policy == "skip" or stop.wait(LOCK_POLL_SECONDS):
+                self.skipped.inc()
+                return False
+
+    def release(self: Self):
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
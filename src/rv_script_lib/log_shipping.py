@@ -0,0 +1,265 @@
+import atexit
+import errno
+import os
+import queue
+import socket
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Optional, Self
+
+from prometheus_client import CollectorRegistry, Counter
+
+DEFAULT_LOG_QUEUE_SIZE = 10000
+DEFAULT_LOG_BATCH_SIZE = 100
+SYSLOG_SOCKET_PATHS = ("/dev/log", "/var/run/syslog")
+SYSLOG_FACILITY_USER = 1
+SEND_TIMEOUT_SECONDS = 5
+RECONNECT_MAX_SECONDS = 30
+CLOSE_TIMEOUT_SECONDS = 5
+
+SYSLOG_SEVERITIES = {
+    "critical": 2,
+    "fatal": 2,
+    "error": 3,
+    "err": 3,
+    "exception": 3,
+    "warning": 4,
+    "warn": 4,
+    "info": 6,
+    "msg": 6,
+    "debug": 7,
+}
+
+
+def parse_log_target(target: str) -> tuple[int, str]:
+    """
+    parse "syslog", "unix:///path" (stream) or "unixgram:///path" (datagram)
+    into (socket type, path)
+    """
+    if target == "syslog":
+        for path in SYSLOG_SOCKET_PATHS:
+            if os.path.exists(path):
+                return socket.SOCK_DGRAM, path
+        return socket.SOCK_DGRAM, SYSLOG_SOCKET_PATHS[0]
+
+    scheme, sep, path = target.partition("://")
+    if sep and scheme == "unix":
+        return socket.SOCK_STREAM, path
+    if sep and scheme in ("unixgram", "syslog"):
+        return socket.SOCK_DGRAM, path
+
+    raise ValueError(f"unknown log target {target}")
+
+
+def format_rfc5424(
+    message: str,
+    severity: int,
+    app_name: str,
+    hostname: str,
+    procid: int,
+    facility: int = SYSLOG_FACILITY_USER,
+    timestamp: Optional[datetime] = None,
+) -> bytes:
+    """
+    <PRI>1 TIMESTAMP HOSTNAME APP-NAME PROCID MSGID STRUCTURED-DATA MSG
+    """
+    timestamp = (timestamp or datetime.now(timezone.utc)).isoformat(
+        timespec="microseconds"
+    )
+    header = (
+        f"<{facility * 8 + severity}>1 {timestamp} {hostname or '-'} "
+        f"{app_name or '-'} {procid} - -"
+    )
+    return f"{header} {message}".encode()
+
+
+class LogShipper:
+    """
+    Sends rendered log lines to a local unix socket or syslog from a background
+    thread, in RFC 5424 format. Stream sockets use octet-counting framing
+    (RFC 6587) and datagram sockets send one message per datagram.
+
+    emit() never blocks. When the queue is full the line is dropped and counted.
+    Failed sends reconnect with exponential backoff and retry the same batch.
+    """
+
+    def __init__(
+        self: Self,
+        target: str,
+        app_name: Optional[str] = "",
+        queue_size: int = DEFAULT_LOG_QUEUE_SIZE,
+        batch_size: int = DEFAULT_LOG_BATCH_SIZE,
+        facility: int = SYSLOG_FACILITY_USER,
+    ) -> Self:
+        self.target = target
+        self.socket_type, self.path = parse_log_target(target)
+        self.app_name = app_name or os.path.basename(sys.argv[0])
+        self.hostname = socket.gethostname()
+        self.queue_size = queue_size
+        self.batch_size = max(batch_size, 1)
+        self.facility = facility
+        self.dropped = 0
+        self.sent = 0
+        self.drop_counter = None
+        self._sock = None
+        self._start()
+        atexit.register(self.close)
+
+    def _start(self: Self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.queue_size)
+        self._closing = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="rv-log-shipper", daemon=True
+        )
+        self._thread.start()
+
+    def bind_metrics(
+        self: Self,
+        registry: Optional[CollectorRegistry] = None,
+        prefix: str = "scriptbase",
+    ):
+        """
+        count drops in prometheus, including those before the registry existed
+        """
+        self.drop_counter = Counter(
+            f"{prefix}_log_shipping_dropped",
+            "Log lines dropped because the shipping queue was full",
+            registry=registry,
+        )
+        self.drop_counter.inc(self.dropped)
+
+    def emit(self: Self, severity: int, message: str):
+        if self._pid != os.getpid():
+            # the sending thread does not survive a fork
+            self._sock = None
+            self._start()
+
+        try:
+            self._queue.put_nowait(
+                format_rfc5424(
+                    message,
+                    severity=severity,
+                    app_name=self.app_name,
+                    hostname=self.hostname,
+                    procid=self._pid,
+                    facility=self.facility,
+                )
+            )
+        except queue.Full:
+            self._count_drop()
+
+    def _connect(self: Self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, self.socket_type)
+        sock.settimeout(SEND_TIMEOUT_SECONDS)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _send(self: Self, batch: list[bytes]):
+        """
+        send a batch, lines are removed from it as they go out
+        """
+        if self._sock is None:
+            self._sock = self._connect()
+
+        if self.socket_type == socket.SOCK_STREAM:
+            self._sock.sendall(b"".join(b"%d %s" % (len(line), line) for line in batch))
+            self.sent += len(batch)
+            batch.clear()
+            return
+
+        while batch:
+            try:
+                self._sock.send(batch[0])
+                self.sent += 1
+            except OSError as e:
+                if e.errno != errno.EMSGSIZE:
+                    raise
+                self._count_drop()
+            batch.pop(0)
+
+    def _count_drop(self: Self):
+        self.dropped += 1
+        if self.drop_counter is not None:
+            self.drop_counter.inc()
+
+    def _next_batch(self: Self) -> list[bytes]:
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self: Self):
+        backoff = 0.1
+        batch = []
+        while True:
+            if not batch:
+                batch = self._next_batch()
+                if not batch:
+                    if self._closing.is_set():
+                        break
+                    continue
+
+            try:
+                self._send(batch)
+            except OSError:
+                if self._sock is not None:
+                    self._sock.close()
+                    self._sock = None
+                if self._closing.wait(backoff):
+                    break
+                backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+                continue
+
+            backoff = 0.1
+
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def close(self: Self, timeout: float = CLOSE_TIMEOUT_SECONDS):
+        """
+        send what is queued, waiting up to timeout, then stop the thread
+        """
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._closing.set()
+        self._thread.join(timeout)
+
+
+class ShippingLogger:
+    """
+    structlog logger that hands rendered lines to a LogShipper
+    """
+
+    def __init__(self: Self, shipper: LogShipper) -> Self:
+        self.shipper = shipper
+
+    def __getattr__(self: Self, name: str):
+        severity = SYSLOG_SEVERITIES.get(name, SYSLOG_SEVERITIES["info"])
+        shipper = self.shipper
+
+        def log(message: str):
+            shipper.emit(severity, message)
+
+        setattr(self, name, log)
+        return log
+
+
+class ShippingLoggerFactory:
+    def __init__(self: Self, shipper: LogShipper) -> Self:
+        self.shipper = shipper
+
+    def __call__(self: Self, *args) -> ShippingLogger:
+        return ShippingLogger(self.shipper)
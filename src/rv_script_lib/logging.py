@@ -1,11 +1,18 @@
+import hashlib
 import logging
 import os
+import signal
 import sys
-from typing import Optional, Union
+import threading
+import traceback
+from time import monotonic
+from typing import Optional, Self, Union
 
 import structlog
 
 from rv_script_lib.lib_types import LogFormatChoice
+from rv_script_lib.log_shipping import LogShipper, ShippingLoggerFactory
+from rv_script_lib.signals import deferred_calls
 
 DEFAULT_LOG_FORMAT = "dev"
 
@@ -15,6 +22,32 @@ LOGLEVEL_FORMATTERS = {
     "dev": structlog.dev.ConsoleRenderer(),
 }
 
+# formats that change when lines go to --log-target, where the syslog header
+# already carries the time and nothing interprets ANSI colors
+SHIPPED_LOG_FORMATTERS = {
+    "dev": structlog.dev.ConsoleRenderer(colors=False),
+}
+
+LOG_LEVEL_STEPS = (
+    logging.DEBUG,
+    logging.INFO,
+    logging.WARNING,
+    logging.ERROR,
+    logging.CRITICAL,
+)
+
+# the level most recently handed to structlog by this module
+_active_log_level = None
+
+# where log lines go when --log-target is set, None means stdout
+_active_log_shipper = None
+
+# full tracebacks are logged once per fingerprint within this many seconds
+DEFAULT_EXCEPTION_WINDOW = 300
+DEFAULT_EXCEPTION_MAX_FRAMES = 30
+DEFAULT_EXCEPTION_MAX_CHARS = 8192
+EXCEPTION_MAX_FINGERPRINTS = 256
+
 TIMESTAMPER_KWARGS = {
     "dev": {
         "utc": False,
@@ -23,7 +56,9 @@ TIMESTAMPER_KWARGS = {
 }
 
 
-def get_loglevel_formatter_by_name(format_name: str):
+def get_loglevel_formatter_by_name(format_name: str, shipped: bool = False):
+    if shipped and format_name in SHIPPED_LOG_FORMATTERS:
+        return SHIPPED_LOG_FORMATTERS[format_name]
     return LOGLEVEL_FORMATTERS.get(
         format_name, LOGLEVEL_FORMATTERS.get(DEFAULT_LOG_FORMAT)
     )
@@ -53,11 +88,112 @@ def get_loglevel_from_arg(loglevel_argument: Union[int, bool, None]) -> int:
     }.get(loglevel_argument, logging.DEBUG)
 
 
+class ExceptionDeduplicator:
+    """
+    structlog processor that renders each distinct traceback once per window.
+
+    A traceback is fingerprinted by its exception type and the code locations of
+    its innermost max_frames frames, not by the message, so the same failure with
+    a different id in the message still matches. The first occurrence in a
+    window gets the traceback in the "exception" key, trimmed to max_frames
+    frames and the last max_chars characters. Later occurrences only get a one
+    line summary, with exc_ref pointing back at the full one and exc_count.
+    A window of 0 renders every traceback.
+    """
+
+    def __init__(
+        self: Self,
+        window_seconds: float = DEFAULT_EXCEPTION_WINDOW,
+        max_frames: int = DEFAULT_EXCEPTION_MAX_FRAMES,
+        max_chars: int = DEFAULT_EXCEPTION_MAX_CHARS,
+        max_fingerprints: int = EXCEPTION_MAX_FINGERPRINTS,
+    ) -> Self:
+        self.window_seconds = window_seconds
+        self.max_frames = max(max_frames, 1)
+        self.max_chars = max_chars
+        self.max_fingerprints = max_fingerprints
+        # fingerprint -> [window start, occurrences], oldest first
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def __call__(self: Self, logger, method_name: str, event_dict: dict) -> dict:
+        exc_info = self.get_exc_info(event_dict.pop("exc_info", None))
+        if exc_info is None:
+            return event_dict
+
+        exc_type, exc, tb = exc_info
+        ref = self.fingerprint(exc_type, tb)
+        count = self.count(ref)
+
+        event_dict["exc_ref"] = ref
+        if count == 1:
+            event_dict["exception"] = self.render(exc_info)
+        else:
+            event_dict["exc_count"] = count
+            event_dict["exception"] = self.summary(exc_type, exc)
+        return event_dict
+
+    @staticmethod
+    def get_exc_info(exc_info) -> Optional[tuple]:
+        if isinstance(exc_info, BaseException):
+            return (type(exc_info), exc_info, exc_info.__traceback__)
+        if isinstance(exc_info, tuple):
+            return exc_info if exc_info[0] is not None else None
+        if exc_info:
+            exc_info = sys.exc_info()
+            return exc_info if exc_info[0] is not None else None
+        return None
+
+    def fingerprint(self: Self, exc_type: type, tb) -> str:
+        locations = []
+        while tb is not None:
+            code = tb.tb_frame.f_code
+            locations.append(f"{code.co_filename}:{code.co_name}:{tb.tb_lineno}")
+            tb = tb.tb_next
+
+        digest = hashlib.sha256(
+            f"{exc_type.__module__}.{exc_type.__qualname__}".encode()
+        )
+        for location in locations[-self.max_frames :]:
+            digest.update(location.encode())
+        return digest.hexdigest()[:12]
+
+    def count(self: Self, ref: str) -> int:
+        """
+        occurrences of ref in its current window, including this one
+        """
+        now = monotonic()
+        with self._lock:
+            seen = self._seen.get(ref)
+            if seen is None or now - seen[0] >= self.window_seconds:
+                self._seen.pop(ref, None)
+                seen = self._seen[ref] = [now, 0]
+                while len(self._seen) > self.max_fingerprints:
+                    del self._seen[next(iter(self._seen))]
+            seen[1] += 1
+            return seen[1]
+
+    def render(self: Self, exc_info: tuple) -> str:
+        rendered = "".join(
+            traceback.format_exception(*exc_info, limit=-self.max_frames)
+        ).rstrip()
+        if len(rendered) > self.max_chars:
+            # the end has the innermost frames and the exception itself
+            rendered = "[truncated]\n" + rendered[-self.max_chars :]
+        return rendered
+
+    def summary(self: Self, exc_type: type, exc: BaseException) -> str:
+        message = str(exc).split("\n", 1)[0]
+        return f"{exc_type.__name__}: {message}"[: self.max_chars]
+
+
 def get_custom_logger(
     log_format: Optional[LogFormatChoice] = DEFAULT_LOG_FORMAT,
     force_configure: Optional[bool] = False,
     loglevel_argument: Union[int, bool] = logging.INFO,
     log_initialization: Optional[bool] = False,
+    log_target: Optional[str] = "",
+    exception_formatter: Optional[ExceptionDeduplicator] = None,
 ) -> structlog.typing.WrappedLogger:
     log_level = get_loglevel_from_arg(loglevel_argument)
 
@@ -71,15 +207,23 @@ def get_custom_logger(
             log_format, TIMESTAMPER_KWARGS[DEFAULT_LOG_FORMAT]
         )
 
+        shipped = bool(log_target)
+        processors = [
+            structlog.contextvars.merge_contextvars,
+            structlog.processors.add_log_level,
+        ]
+        if not (shipped and log_format in SHIPPED_LOG_FORMATTERS):
+            processors.append(structlog.processors.TimeStamper(**configure_kwargs))
+        processors += [
+            exception_formatter or ExceptionDeduplicator(),
+            get_loglevel_formatter_by_name(log_format, shipped=shipped),
+        ]
+
         structlog.configure(
-            processors=[
-                structlog.contextvars.merge_contextvars,
-                structlog.processors.add_log_level,
-                structlog.processors.TimeStamper(**configure_kwargs),
-                get_loglevel_formatter_by_name(log_format),
-            ],
-            wrapper_class=structlog.make_filtering_bound_logger(log_level),
+            processors=processors,
+            logger_factory=get_logger_factory(log_target),
         )
+        set_log_level(log_level)
 
     logger = structlog.get_logger()
 
@@ -96,3 +240,129 @@ def get_custom_logger(
 
 def custom_logger_proxy() -> structlog.typing.WrappedLogger:
     return structlog.get_logger()
+
+
+def get_logger_factory(log_target: Optional[str] = ""):
+    """
+    stdout by default, otherwise a LogShipper for the target, replacing any earlier one
+    """
+    global _active_log_shipper
+
+    close_log_shipper()
+    _active_log_shipper = None
+    if not log_target:
+        return structlog.PrintLoggerFactory()
+
+    _active_log_shipper = LogShipper(target=log_target)
+    return ShippingLoggerFactory(_active_log_shipper)
+
+
+def get_log_shipper() -> Optional[LogShipper]:
+    return _active_log_shipper
+
+
+def close_log_shipper():
+    """
+    send any queued log lines, for use before a process exits without atexit
+    """
+    if _active_log_shipper is not None:
+        _active_log_shipper.close()
+
+
+def get_log_level() -> Optional[int]:
+    return _active_log_level
+
+
+def set_log_level(log_level: int) -> int:
+    """
+    Change the level of every logger from structlog.get_logger() in place.
+
+    Lazy logger proxies pick up the new wrapper class on their next call, and the
+    filtering wrapper keeps calls below the level as no-ops.
+    """
+    global _active_log_level
+
+    log_level = get_loglevel_from_arg(log_level)
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(log_level),
+    )
+    _active_log_level = log_level
+
+    return log_level
+
+
+def step_log_level(steps: int) -> int:
+    """
+    move the log level by steps, negative is more verbose
+    """
+    current = _active_log_level or logging.INFO
+    index = min(
+        range(len(LOG_LEVEL_STEPS)),
+        key=lambda i: abs(LOG_LEVEL_STEPS[i] - current),
+    )
+    index = max(0, min(len(LOG_LEVEL_STEPS) - 1, index + steps))
+
+    return set_log_level(LOG_LEVEL_STEPS[index])
+
+
+class LogLevelSignals:
+    """
+    SIGUSR1 makes logging one step more verbose, SIGUSR2 one step less verbose.
+
+    The handler only queues the step. Reconfiguring structlog and logging the
+    change happen on the deferred_calls thread, since the signal may interrupt
+    the job in the middle of writing a log line.
+    """
+
+    def __init__(self: Self) -> Self:
+        self._previous_handlers = {}
+
+    def install(self: Self):
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        deferred_calls.start()
+        for signum in (signal.SIGUSR1, signal.SIGUSR2):
+            self._previous_handlers[signum] = signal.signal(signum, self._handle)
+
+    def restore(self: Self):
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        self._previous_handlers = {}
+
+    @classmethod
+    def _handle(cls, signum: int, frame):
+        deferred_calls.call_soon(cls._step, signum)
+
+    @staticmethod
+    def _step(signum: int):
+        log_level = step_log_level(-1 if signum == signal.SIGUSR1 else 1)
+        custom_logger_proxy().warning(
+            "Log level changed",
+            signal=signal.Signals(signum).name,
+            loglevel=logging.getLevelName(log_level),
+        )
+
+
+def log_level_command(args: list[str]) -> str:
+    """
+    control command, "loglevel" reports the level, "loglevel debug" sets it
+    """
+    if args:
+        level_name = args[0].upper()
+        if level_name in ("UP", "VERBOSE"):
+            log_level = step_log_level(-1)
+        elif level_name in ("DOWN", "QUIET"):
+            log_level = step_log_level(1)
+        elif level_name.isdigit():
+            log_level = set_log_level(int(level_name))
+        elif isinstance(logging.getLevelName(level_name), int):
+            log_level = set_log_level(logging.getLevelName(level_name))
+        else:
+            raise ValueError(f"unknown log level {args[0]}")
+
+        custom_logger_proxy().warning(
+            "Log level changed", loglevel=logging.getLevelName(log_level)
+        )
+
+    return logging.getLevelName(get_log_level() or logging.NOTSET)
@@ -0,0 +1,171 @@
+import glob
+import os
+import shutil
+import tempfile
+from collections import defaultdict
+from typing import Optional, Self
+
+from prometheus_client import CollectorRegistry, values
+from prometheus_client.mmap_dict import MmapedDict
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+
+from rv_script_lib.logging import custom_logger_proxy
+
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+ARCHIVE_SUFFIX = "archive"
+
+
+def pid_is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def parse_db_filename(path: str) -> tuple[str, str, str]:
+    """
+    split a prometheus multiprocess file name into (type, gauge mode, pid)
+    """
+    parts = os.path.basename(path)[: -len(".db")].split("_")
+    if parts[0] == "gauge":
+        return parts[0], parts[1], parts[2]
+    return parts[0], "", parts[1]
+
+
+def fold_value(
+    mode: str, current: Optional[tuple[float, float]], new: tuple[float, float]
+) -> tuple[float, float]:
+    """
+    combine two (value, timestamp) samples of one series the way the collector
+    would, mode is the gauge mode or "" for counters and histograms
+    """
+    if current is None:
+        return new
+    if mode == "min":
+        return min(current, new, key=lambda sample: sample[0])
+    if mode == "max":
+        return max(current, new, key=lambda sample: sample[0])
+    if mode == "mostrecent":
+        return max(current, new, key=lambda sample: sample[1])
+    return current[0] + new[0], max(current[1], new[1])
+
+
+class MultiProcessMetrics:
+    """
+    Switches prometheus_client to per-process memory-mapped metric files.
+
+    Every metric created after enable(), in this process or in any process forked
+    from it, writes to its own file in `path`, and export_registry() merges them.
+    Files of processes that have exited are folded into one archive file per
+    metric type and gauge mode, so the directory does not grow with every worker.
+    Counters, histograms, summaries and "sum" gauges are added up, "min", "max"
+    and "mostrecent" gauges keep the value the collector would have shown.
+    "all" and live gauges of dead processes are dropped.
+    """
+
+    def __init__(self: Self, path: Optional[str] = "") -> Self:
+        self.log = custom_logger_proxy()
+        self.owns_path = not path
+        self.path = path or tempfile.mkdtemp(prefix="rv-prom-multiproc-")
+        self.enabled = False
+        self._owner_pid = os.getpid()
+        self._previous_value_class = None
+        self._previous_env = None
+
+    def enable(self: Self):
+        if self.enabled:
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        self.remove_stale_files()
+
+        self._previous_env = os.environ.get(MULTIPROC_DIR_ENV)
+        os.environ[MULTIPROC_DIR_ENV] = self.path
+        self._previous_value_class = values.ValueClass
+        values.ValueClass = values.MultiProcessValue()
+        self.enabled = True
+
+        self.log.debug("Prometheus multiprocess mode enabled", path=self.path)
+
+    def disable(self: Self):
+        if not self.enabled or os.getpid() != self._owner_pid:
+            return
+
+        values.ValueClass.close_all_files()
+        values.ValueClass = self._previous_value_class
+        if self._previous_env is None:
+            os.environ.pop(MULTIPROC_DIR_ENV, None)
+        else:
+            os.environ[MULTIPROC_DIR_ENV] = self._previous_env
+        self.enabled = False
+
+        if self.owns_path:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def remove_stale_files(self: Self):
+        """
+        remove files left behind by earlier runs, whose processes are all gone
+        """
+        for path in glob.glob(os.path.join(self.path, "*.db")):
+            _, _, pid = parse_db_filename(path)
+            if pid == ARCHIVE_SUFFIX or not pid_is_alive(int(pid)):
+                os.remove(path)
+
+    def compact(self: Self) -> int:
+        """
+        fold files from exited processes together, returns how many were removed
+        """
+        archived = defaultdict(dict)
+        dead_files = []
+
+        for path in glob.glob(os.path.join(self.path, "*.db")):
+            typ, mode, pid = parse_db_filename(path)
+            if pid == ARCHIVE_SUFFIX or pid_is_alive(int(pid)):
+                continue
+
+            if typ == "gauge" and mode.startswith("live"):
+                mark_process_dead(int(pid), self.path)
+                continue
+
+            dead_files.append(path)
+            if typ == "gauge" and mode == "all":
+                # series labelled with a pid that is gone, nothing to keep
+                continue
+
+            name = f"{typ}_{mode}" if typ == "gauge" else typ
+            folded = archived[name]
+            for key, value, timestamp, _ in MmapedDict.read_all_values_from_file(path):
+                folded[key] = fold_value(mode, folded.get(key), (value, timestamp))
+
+        for name, folded in archived.items():
+            archive_path = os.path.join(self.path, f"{name}_{ARCHIVE_SUFFIX}.db")
+            mode = name.partition("_")[2]
+            if os.path.exists(archive_path):
+                for key, value, timestamp, _ in MmapedDict.read_all_values_from_file(
+                    archive_path
+                ):
+                    folded[key] = fold_value(mode, folded.get(key), (value, timestamp))
+
+            archive = MmapedDict(archive_path)
+            try:
+                for key, (value, timestamp) in folded.items():
+                    archive.write_value(key, value, timestamp)
+            finally:
+                archive.close()
+
+        for path in dead_files:
+            os.remove(path)
+
+        return len(dead_files)
+
+    def export_registry(self: Self) -> CollectorRegistry:
+        """
+        registry that merges the metrics of this process and all of its workers
+        """
+        self.compact()
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry, path=self.path)
+        return registry
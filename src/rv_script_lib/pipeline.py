@@ -0,0 +1,444 @@
+import multiprocessing
+import pickle
+import queue
+import threading
+import traceback
+from time import monotonic
+from typing import Callable, Iterable, Iterator, Literal, Optional, Self
+
+from prometheus_client import CollectorRegistry, Counter, Gauge
+
+from rv_script_lib.logging import custom_logger_proxy
+
+DEFAULT_PIPELINE_QUEUE_SIZE = 16
+POLL_SECONDS = 0.1
+# how long process workers get to exit once the pipeline has stopped
+WORKER_STOP_SECONDS = 5
+
+type StageFunction = Callable[[Iterator], Iterable]
+type StageMode = Literal["thread", "process"]
+
+
+class PipelineStopped(Exception):
+    """
+    raised inside workers to unwind once another stage has failed
+    """
+
+
+class PipelineWorkerDied(RuntimeError):
+    """
+    a process worker exited without reporting an error, such as on SIGKILL
+    """
+
+
+class PipelineMetrics:
+    """
+    metrics shared by every pipeline a script creates
+    """
+
+    def __init__(
+        self: Self,
+        registry: Optional[CollectorRegistry] = None,
+        prefix: str = "scriptbase",
+    ) -> Self:
+        self.items = Counter(
+            f"{prefix}_pipeline_items",
+            "Items emitted by each pipeline stage",
+            ["pipeline", "stage"],
+            registry=registry,
+        )
+        self.queue_depth = Gauge(
+            f"{prefix}_pipeline_queue_depth",
+            "Batches waiting in front of each pipeline stage",
+            ["pipeline", "stage"],
+            registry=registry,
+            multiprocess_mode="mostrecent",
+        )
+
+
+class Stage:
+    def __init__(
+        self: Self,
+        func: StageFunction,
+        name: str,
+        workers: int,
+        mode: StageMode,
+        batch_size: int,
+        queue_size: int,
+    ) -> Self:
+        if mode not in ("thread", "process"):
+            raise ValueError(f"unknown stage mode {mode}")
+        self.func = func
+        self.name = name
+        self.workers = max(workers, 1)
+        self.mode = mode
+        self.batch_size = max(batch_size, 1)
+        self.queue_size = max(queue_size, 1)
+
+
+def _put(out_queue, item, stop) -> None:
+    while True:
+        try:
+            out_queue.put(item, timeout=POLL_SECONDS)
+            return
+        except queue.Full:
+            if stop.is_set():
+                raise PipelineStopped()
+
+
+def _drain(stage_queue) -> None:
+    """
+    throw away whatever is waiting in a queue of a stopped pipeline
+    """
+    while True:
+        try:
+            stage_queue.get_nowait()
+        except (queue.Empty, OSError, ValueError):
+            return
+
+
+def _read_batches(in_queue, stop) -> Iterator:
+    """
+    yield items from batches on in_queue until a None end marker arrives
+    """
+    while True:
+        try:
+            batch = in_queue.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            if stop.is_set():
+                raise PipelineStopped()
+            continue
+
+        if batch is None:
+            return
+        yield from batch
+
+
+def _run_worker(stage: Stage, in_queue, out_queue, stop, errors, emitted) -> None:
+    """
+    run one worker of a stage, in a thread or a child process
+    """
+    try:
+        batch = []
+        for result in stage.func(_read_batches(in_queue, stop)):
+            batch.append(result)
+            if len(batch) >= stage.batch_size:
+                _put(out_queue, batch, stop)
+                emitted(len(batch))
+                batch = []
+        if batch:
+            _put(out_queue, batch, stop)
+            emitted(len(batch))
+    except PipelineStopped:
+        pass
+    except BaseException as e:
+        stop.set()
+        formatted = traceback.format_exc()
+        try:
+            pickle.dumps(e)
+        except Exception:
+            # process queues pickle in a background thread, where failures are lost
+            e = RuntimeError(repr(e))
+        errors.put((stage.name, e, formatted))
+
+
+class Pipeline:
+    """
+    Chain of generator stages connected by bounded queues.
+
+    Each stage function receives an iterator of input items and yields output
+    items. It runs in `workers` threads or forked processes that share one input
+    queue. Items travel between stages in lists of up to the producing stage's
+    `batch_size`. A full queue blocks the producer, which gives backpressure. If a
+    stage raises, the pipeline stops and run() re-raises the exception.
+
+    pipe = Pipeline("etl")
+    pipe.stage(parse, workers=4)
+    pipe.stage(transform, workers=2, mode="process")
+    for row in pipe.run(read_lines()):
+        ...
+    """
+
+    def __init__(
+        self: Self,
+        name: str,
+        batch_size: int = 1,
+        queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE,
+        metrics: Optional[PipelineMetrics] = None,
+    ) -> Self:
+        self.log = custom_logger_proxy()
+        self.name = name
+        self.batch_size = max(batch_size, 1)
+        self.queue_size = queue_size
+        self.metrics = metrics
+        self.stages = []
+
+    def stage(
+        self: Self,
+        func: StageFunction,
+        workers: int = 1,
+        mode: StageMode = "thread",
+        batch_size: int = 1,
+        queue_size: Optional[int] = None,
+        name: Optional[str] = None,
+    ) -> Self:
+        """
+        append a stage, returns the pipeline so calls can be chained
+        """
+        self.stages.append(
+            Stage(
+                func=func,
+                name=name or getattr(func, "__name__", f"stage{len(self.stages)}"),
+                workers=workers,
+                mode=mode,
+                batch_size=batch_size,
+                queue_size=queue_size or self.queue_size,
+            )
+        )
+        return self
+
+    def run(self: Self, source: Iterable) -> Iterator:
+        """
+        feed source through every stage, yielding what the last stage emits
+        """
+        if not self.stages:
+            yield from source
+            return
+
+        use_processes = any(stage.mode == "process" for stage in self.stages)
+        context = multiprocessing.get_context("fork") if use_processes else None
+
+        def make_queue(size: int):
+            return context.Queue(size) if context else queue.Queue(size)
+
+        stop = context.Event() if context else threading.Event()
+        errors = context.Queue() if context else queue.Queue()
+
+        queues = [make_queue(stage.queue_size) for stage in self.stages]
+        queues.append(make_queue(self.queue_size))
+
+        process_counts = {}
+        stage_workers = []
+        for index, stage in enumerate(self.stages):
+            workers = []
+            if stage.mode == "process":
+                shared_count = context.Value("q", 0)
+                process_counts[stage.name] = shared_count
+                emitted = self._shared_counter(shared_count)
+            else:
+                emitted = self._metric_counter(stage.name)
+
+            for worker_number in range(stage.workers):
+                args = (stage, queues[index], queues[index + 1], stop, errors, emitted)
+                worker_name = f"rv-pipeline-{self.name}-{stage.name}-{worker_number}"
+                if stage.mode == "process":
+                    worker = context.Process(
+                        target=_run_worker, args=args, name=worker_name, daemon=True
+                    )
+                else:
+                    worker = threading.Thread(
+                        target=_run_worker, args=args, name=worker_name, daemon=True
+                    )
+                workers.append(worker)
+            stage_workers.append(workers)
+
+        # forked workers start first, so they do not inherit the helper threads
+        for workers in stage_workers:
+            for worker in workers:
+                if not isinstance(worker, threading.Thread):
+                    worker.start()
+        for workers in stage_workers:
+            for worker in workers:
+                if isinstance(worker, threading.Thread):
+                    worker.start()
+
+        helpers = [
+            threading.Thread(
+                target=self._feed,
+                args=(source, queues[0], self.stages[0].workers, stop, errors),
+                name=f"rv-pipeline-{self.name}-feed",
+                daemon=True,
+            )
+        ]
+        for index, workers in enumerate(stage_workers):
+            next_workers = (
+                self.stages[index + 1].workers if index + 1 < len(self.stages) else 1
+            )
+            helpers.append(
+                threading.Thread(
+                    target=self._close_stage,
+                    args=(
+                        self.stages[index].name,
+                        workers,
+                        queues[index + 1],
+                        next_workers,
+                        stop,
+                        errors,
+                    ),
+                    name=f"rv-pipeline-{self.name}-{self.stages[index].name}-close",
+                    daemon=True,
+                )
+            )
+        for helper in helpers:
+            helper.start()
+
+        try:
+            for batch in self._read_output(queues[-1], stop):
+                self._sample_depths(queues)
+                yield from batch
+        finally:
+            if not stop.is_set() and any(h.is_alive() for h in helpers):
+                # the caller stopped consuming early
+                stop.set()
+            for helper in helpers:
+                helper.join()
+            for workers in stage_workers:
+                for worker in workers:
+                    worker.join()
+            self._sample_depths(queues)
+            if stop.is_set() and context:
+                # batches this process still buffers for queues that nobody
+                # reads would otherwise keep it from exiting
+                parent_fed = [queues[0]] + [
+                    queues[index + 1]
+                    for index, stage in enumerate(self.stages)
+                    if stage.mode == "thread"
+                ]
+                for stage_queue in parent_fed:
+                    _drain(stage_queue)
+                for stage_queue in queues:
+                    stage_queue.cancel_join_thread()
+            for stage_name, shared_count in process_counts.items():
+                self._metric_counter(stage_name)(shared_count.value)
+
+        self._raise_errors(errors, stop)
+
+    def drain(self: Self, source: Iterable) -> int:
+        """
+        run the pipeline for its side effects, returns the number of output items
+        """
+        return sum(1 for _ in self.run(source))
+
+    def _metric_counter(self: Self, stage_name: str) -> Callable[[int], None]:
+        if self.metrics is None:
+            return lambda amount: None
+        return self.metrics.items.labels(self.name, stage_name).inc
+
+    @staticmethod
+    def _shared_counter(shared_count) -> Callable[[int], None]:
+        def emitted(amount: int):
+            with shared_count.get_lock():
+                shared_count.value += amount
+
+        return emitted
+
+    def _sample_depths(self: Self, queues: list):
+        if self.metrics is None:
+            return
+        for stage, stage_queue in zip(self.stages, queues):
+            try:
+                depth = stage_queue.qsize()
+            except NotImplementedError:
+                continue
+            self.metrics.queue_depth.labels(self.name, stage.name).set(depth)
+
+    def _feed(self: Self, source: Iterable, out_queue, workers: int, stop, errors):
+        try:
+            batch = []
+            for item in source:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    _put(out_queue, batch, stop)
+                    batch = []
+            if batch:
+                _put(out_queue, batch, stop)
+            for _ in range(workers):
+                _put(out_queue, None, stop)
+        except PipelineStopped:
+            pass
+        except BaseException as e:
+            stop.set()
+            errors.put(("source", e, traceback.format_exc()))
+
+    @staticmethod
+    def _close_stage(
+        stage_name: str, workers: list, out_queue, next_workers: int, stop, errors
+    ):
+        """
+        once every worker of a stage is done, tell each downstream worker
+        """
+        # a process cannot exit until its queue's feeder thread has written
+        # every batch, so once the pipeline stops its output is thrown away here
+        running = list(workers)
+        stopped_at = None
+        killed = False
+        while running:
+            running[0].join(POLL_SECONDS)
+            for worker in [worker for worker in running if not worker.is_alive()]:
+                running.remove(worker)
+                # _run_worker reports its own errors, so only a kill gets here
+                exitcode = getattr(worker, "exitcode", 0)
+                if exitcode and stopped_at is None:
+                    killed = True
+                    stop.set()
+                    error = PipelineWorkerDied(
+                        f"worker {worker.name} exited with code {exitcode}"
+                    )
+                    errors.put((stage_name, error, f"{error}\n"))
+
+            if running and stop.is_set():
+                if not killed:
+                    # a worker killed mid-write leaves half a batch, which
+                    # would block the read
+                    _drain(out_queue)
+                stopped_at = stopped_at or monotonic()
+                if monotonic() - stopped_at > WORKER_STOP_SECONDS:
+                    # a killed sibling can leave a queue lock held forever
+                    for worker in running:
+                        if hasattr(worker, "kill"):
+                            worker.kill()
+        try:
+            for _ in range(next_workers):
+                _put(out_queue, None, stop)
+        except PipelineStopped:
+            pass
+
+    @staticmethod
+    def _read_output(out_queue, stop) -> Iterator[list]:
+        while True:
+            try:
+                batch = out_queue.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if batch is None:
+                return
+            yield batch
+
+    def _raise_errors(self: Self, errors, stop):
+        # every failure sets stop before it is queued
+        if not stop.is_set():
+            return
+
+        failures = []
+        try:
+            # a process queue may still be flushing the first failure
+            failures.append(errors.get(timeout=POLL_SECONDS))
+            while True:
+                failures.append(errors.get_nowait())
+        except queue.Empty:
+            pass
+
+        if not failures:
+            return
+
+        stage_name, error, formatted = failures[0]
+        self.log.error(
+            "Pipeline stage failed",
+            pipeline=self.name,
+            stage=stage_name,
+            failures=len(failures),
+        )
+        error.add_note(f"in pipeline {self.name} stage {stage_name}:\n{formatted}")
+        raise error
@@ -0,0 +1,256 @@
+import datetime
+import os
+from typing import Optional, Self
+from zoneinfo import ZoneInfo
+
+# how far ahead next_fire() looks before deciding a schedule never fires
+SEARCH_YEARS = 5
+
+CRON_MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+MONTH_NAMES = {
+    name: number
+    for number, name in enumerate(
+        "jan feb mar apr may jun jul aug sep oct nov dec".split(), start=1
+    )
+}
+DAY_NAMES = {
+    name: number for number, name in enumerate("sun mon tue wed thu fri sat".split())
+}
+
+CALENDAR_DAYS = {
+    "daily": "*",
+    "weekdays": "1-5",
+    "weekends": "0,6",
+}
+
+
+def local_timezone() -> datetime.tzinfo:
+    """
+    the system time zone with its DST rules, from TZ or /etc/localtime
+    """
+    name = os.getenv("TZ", "").lstrip(":")
+    if name:
+        return ZoneInfo(name)
+    try:
+        with open("/etc/localtime", "rb") as f:
+            return ZoneInfo.from_file(f, key="localtime")
+    except OSError:
+        return datetime.timezone.utc
+
+
+def parse_cron_field(
+    field: str, low: int, high: int, names: Optional[dict] = None
+) -> frozenset[int]:
+    """
+    parse one cron field, such as *, */15, 1-5, mon-fri or 0,30
+    """
+    values = set()
+    for part in field.lower().split(","):
+        part, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if step < 1:
+            raise ValueError(f"invalid step in cron field {field}")
+
+        if part == "*":
+            start, end = low, high
+        else:
+            start_name, _, end_name = part.partition("-")
+            start = _parse_cron_value(start_name, names)
+            end = _parse_cron_value(end_name, names) if end_name else start
+            if step > 1 and not end_name:
+                end = high
+
+        if not low <= start <= high or not low <= end <= high or start > end:
+            raise ValueError(f"cron field {field} is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+
+    return frozenset(values)
+
+
+def _parse_cron_value(value: str, names: Optional[dict]) -> int:
+    if names and value in names:
+        return names[value]
+    return int(value)
+
+
+def calendar_to_cron(expression: str) -> str:
+    """
+    convert "weekdays 02:00", "mon,wed 08:30,17:30" or "daily 00:15" to cron
+    """
+    try:
+        days, times = expression.lower().split()
+    except ValueError:
+        raise ValueError(f"invalid schedule {expression}") from None
+
+    days = CALENDAR_DAYS.get(days, days)
+    hours_minutes = [time.split(":") for time in times.split(",")]
+    minutes = {minute for _, minute in hours_minutes}
+    if len(minutes) > 1:
+        # cron cannot pair each hour with its own minute
+        raise ValueError(f"times in {expression} must share the same minute")
+
+    hours = ",".join(str(int(hour)) for hour, _ in hours_minutes)
+    return f"{int(minutes.pop())} {hours} * * {days}"
+
+
+class CronSchedule:
+    """
+    Cron style schedule: five fields (minute hour day-of-month month day-of-week),
+    a macro such as @daily, or a calendar line such as "weekdays 02:00".
+
+    Fire times are wall clock times in `timezone`. A time that a DST change skips
+    fires once, moved forward by the size of the jump. When clocks go back, a
+    schedule with a fixed hour fires only on the first occurrence of a repeated
+    time, while a wildcard or stepped hour field ("*", "*/2") fires on both, so
+    "*/15 * * * *" keeps running every quarter hour through the repeated hour.
+    """
+
+    def __init__(
+        self: Self, expression: str, timezone: Optional[datetime.tzinfo] = None
+    ) -> Self:
+        self.expression = expression.strip()
+        self.timezone = timezone or local_timezone()
+
+        cron = CRON_MACROS.get(self.expression.lower(), self.expression)
+        fields = cron.split()
+        if len(fields) == 2:
+            fields = calendar_to_cron(cron).split()
+        if len(fields) != 5:
+            raise ValueError(f"invalid schedule {expression}")
+
+        self.minutes = parse_cron_field(fields[0], 0, 59)
+        self.hours = parse_cron_field(fields[1], 0, 23)
+        self.days = parse_cron_field(fields[2], 1, 31)
+        self.months = parse_cron_field(fields[3], 1, 12, MONTH_NAMES)
+        weekdays = parse_cron_field(fields[4], 0, 7, DAY_NAMES)
+        # 0 and 7 are both sunday, datetime.isoweekday() uses 7
+        self.weekdays = frozenset(7 if day == 0 else day for day in weekdays)
+
+        # like cron, if both day fields are restricted either one may match
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+        # hourly style schedules also fire in the hour repeated by a DST change
+        self.every_hour = "*" in fields[1] or "/" in fields[1]
+
+        self.sorted_hours = sorted(self.hours)
+        self.sorted_minutes = sorted(self.minutes)
+        self._cached_after = None
+        self._cached_next = None
+
+        self.next_fire(datetime.datetime.now(datetime.timezone.utc))
+
+    def __repr__(self: Self) -> str:
+        return f"CronSchedule({self.expression!r}, {self.timezone})"
+
+    def matches_date(self: Self, date: datetime.date) -> bool:
+        if date.month not in self.months:
+            return False
+        day_match = date.day in self.days
+        weekday_match = date.isoweekday() in self.weekdays
+        if self.any_day:
+            return weekday_match
+        if self.any_weekday:
+            return day_match
+        return day_match or weekday_match
+
+    def next_fire(self: Self, after: datetime.datetime) -> datetime.datetime:
+        """
+        first fire time strictly after `after`, as an aware UTC datetime. The
+        last answer is cached until it has passed.
+        """
+        if after.tzinfo is None:
+            raise ValueError("after must be timezone aware")
+        # compare instants, datetimes sharing a tzinfo compare by wall clock
+        after = after.astimezone(datetime.timezone.utc)
+
+        if (
+            self._cached_next is not None
+            and self._cached_after <= after < self._cached_next
+        ):
+            return self._cached_next
+
+        fire = self._search(after)
+        self._cached_after = after
+        self._cached_next = fire
+        return fire
+
+    def _search(self: Self, after: datetime.datetime) -> datetime.datetime:
+        local_after = after.astimezone(self.timezone)
+        date = local_after.date()
+        last_date = date + datetime.timedelta(days=366 * SEARCH_YEARS)
+
+        while date <= last_date:
+            if self.matches_date(date):
+                fire = self._first_on_date(date, after)
+                if fire is not None:
+                    return fire
+            date += datetime.timedelta(days=1)
+
+        raise ValueError(f"schedule {self.expression} never fires")
+
+    def _first_on_date(
+        self: Self, date: datetime.date, after: datetime.datetime
+    ) -> Optional[datetime.datetime]:
+        # wall times map to instants in order, give or take the day's DST change
+        midnight = datetime.datetime(
+            date.year, date.month, date.day, tzinfo=self.timezone
+        )
+        next_midnight = midnight + datetime.timedelta(days=1)
+        shift = abs(next_midnight.utcoffset() - midnight.utcoffset())
+        # so hours ending more than that before `after` cannot fire
+        earliest = after.astimezone(self.timezone).replace(tzinfo=None) - shift
+
+        first = None
+        for hour in self.sorted_hours:
+            if (date, hour) < (earliest.date(), earliest.hour):
+                continue
+            for minute in self.sorted_minutes:
+                wall = datetime.datetime(
+                    date.year, date.month, date.day, hour, minute, tzinfo=self.timezone
+                )
+                # converting to UTC moves a time inside a DST gap forward, and
+                # keeps ambiguous local times out of later comparisons
+                fire = wall.astimezone(datetime.timezone.utc)
+                if fire > after:
+                    if not self.every_hour:
+                        return fire
+                    if first is not None and fire > first + shift:
+                        return first
+                    first = min(first or fire, fire)
+
+                if self.every_hour and shift:
+                    repeat = self._repeated(wall)
+                    if repeat is not None and repeat > after:
+                        first = min(first or repeat, repeat)
+        return first
+
+    def _repeated(self: Self, wall: datetime.datetime) -> Optional[datetime.datetime]:
+        """
+        the second occurrence of an ambiguous wall time as UTC, None otherwise
+        """
+        second = wall.replace(fold=1)
+        if second.utcoffset() == wall.utcoffset():
+            return None
+        repeat = second.astimezone(datetime.timezone.utc)
+        # inside a gap fold=1 maps backwards instead, that time never happened
+        if repeat.astimezone(self.timezone).replace(tzinfo=None) != wall.replace(
+            tzinfo=None
+        ):
+            return None
+        return repeat
+
+
+def parse_schedule(expression: str, timezone_name: Optional[str] = "") -> CronSchedule:
+    return CronSchedule(
+        expression,
+        timezone=ZoneInfo(timezone_name) if timezone_name else None,
+    )
@@ -0,0 +1,154 @@
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional, Self
+
+from rv_script_lib.logging import custom_logger_proxy
+from rv_script_lib.signals import deferred_calls
+
+DEFAULT_SHUTDOWN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+DEFAULT_SHUTDOWN_GRACE = "30s"
+
+
+class ShutdownGraceExpired(BaseException):
+    """
+    Raised in the main thread when a job is still running after the grace period.
+
+    This derives from BaseException so that a broad `except Exception` in job code
+    does not swallow the shutdown.
+    """
+
+    def __init__(self: Self, signum: int):
+        super().__init__(f"shutdown grace period expired after {signum}")
+        self.signum = signum
+
+
+class ShutdownHandler:
+    """
+    Turns SIGTERM/SIGINT into a shutdown request that wakes any pending wait(),
+    and sets the optional `wakeup` event shared with other waiters.
+
+    A job running when the signal arrives gets `grace_seconds` to finish before
+    ShutdownGraceExpired is raised in the main thread. A second signal skips the
+    rest of the grace period.
+
+    The handlers themselves only record the signal, arm the grace timer and
+    raise. Setting the events and logging run later through deferred_calls, so
+    a signal that lands while the job holds a lock cannot deadlock it.
+    """
+
+    def __init__(
+        self: Self,
+        grace_seconds: float,
+        signals: Optional[tuple[int, ...]] = DEFAULT_SHUTDOWN_SIGNALS,
+        wakeup: Optional[threading.Event] = None,
+    ) -> Self:
+        self.log = custom_logger_proxy()
+        self.grace_seconds = grace_seconds
+        self.signals = signals
+        self.requested = threading.Event()
+        self.wakeup = wakeup
+        self.signum = None
+        self.in_job = False
+        self._previous_handlers = {}
+
+    @property
+    def exit_code(self: Self) -> int:
+        """
+        shell style exit code for the signal that requested the shutdown
+        """
+        if self.signum is None:
+            return 0
+        return 128 + self.signum
+
+    def install(self: Self):
+        if threading.current_thread() is not threading.main_thread():
+            self.log.debug("Not on the main thread, skipping signal handlers")
+            return
+
+        deferred_calls.start()
+        for signum in self.signals:
+            self._previous_handlers[signum] = signal.signal(signum, self._handle)
+
+    def restore(self: Self):
+        self._disarm_grace()
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        self._previous_handlers = {}
+
+    def request(self: Self, signum: int):
+        """
+        request a shutdown, as if signum had been received
+        """
+        deferred_calls.start()
+        self._handle(signum, None)
+
+    def wait(self: Self, timeout: float) -> bool:
+        """
+        sleep for up to timeout seconds, returns True if a shutdown was requested
+        """
+        return self.requested.wait(timeout=max(timeout, 0))
+
+    @contextmanager
+    def job(self: Self) -> Iterator[None]:
+        """
+        mark a job as in flight, so a shutdown request starts the grace timer
+        """
+        self.in_job = True
+        try:
+            if self.signum is not None:
+                # requested before the job started, its grace starts now
+                self._arm_grace()
+            yield
+        finally:
+            self.in_job = False
+            self._disarm_grace()
+
+    def _handle(self: Self, signum: int, frame):
+        # signal context, no locks and no logging here
+        if self.signum is not None:
+            if self.in_job:
+                deferred_calls.call_soon(
+                    self.log.warning,
+                    "Second shutdown signal, abandoning job",
+                    signal=signal.Signals(signum).name,
+                )
+                raise ShutdownGraceExpired(self.signum)
+            return
+
+        self.signum = signum
+        deferred_calls.call_soon(self._requested, signum, self.in_job)
+
+        if self.in_job:
+            self._arm_grace()
+
+    def _requested(self: Self, signum: int, in_job: bool):
+        self.requested.set()
+        if self.wakeup is not None:
+            self.wakeup.set()
+        self.log.warning(
+            "Shutdown requested",
+            signal=signal.Signals(signum).name,
+            in_job=in_job,
+            grace_seconds=self.grace_seconds,
+        )
+
+    def _arm_grace(self: Self):
+        if threading.current_thread() is not threading.main_thread():
+            return
+        if self.grace_seconds <= 0:
+            raise ShutdownGraceExpired(self.signum)
+        self._previous_handlers.setdefault(
+            signal.SIGALRM, signal.signal(signal.SIGALRM, self._grace_expired)
+        )
+        signal.setitimer(signal.ITIMER_REAL, self.grace_seconds)
+
+    def _disarm_grace(self: Self):
+        if signal.SIGALRM in self._previous_handlers:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    def _grace_expired(self: Self, signum: int, frame):
+        deferred_calls.call_soon(
+            self.log.error, "Shutdown grace period expired", grace=self.grace_seconds
+        )
+        raise ShutdownGraceExpired(self.signum)
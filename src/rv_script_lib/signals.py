@@ -0,0 +1,71 @@
+import os
+import queue
+import threading
+from typing import Callable, Self
+
+import structlog
+
+
+class DeferredCalls:
+    """
+    Runs work queued by signal handlers on a daemon thread.
+
+    Python runs signal handlers in the main thread between bytecodes. A handler
+    that takes a lock the interrupted code already holds, such as structlog's
+    print lock or the condition inside a threading.Event, deadlocks the process.
+    Handlers here only call call_soon(), which puts to a SimpleQueue, one of the
+    few operations that is safe to re-enter, and logging, events and
+    reconfiguration happen on the worker thread.
+    """
+
+    def __init__(self: Self) -> Self:
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self: Self):
+        """
+        start the worker, call this from normal code before installing handlers
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="rv-signal-calls", daemon=True
+                )
+                self._thread.start()
+
+    def call_soon(self: Self, func: Callable, *args, **kwargs):
+        """
+        queue func(*args, **kwargs), safe to call from a signal handler
+        """
+        self._queue.put((func, args, kwargs))
+
+    def flush(self: Self, timeout: float = 5) -> bool:
+        """
+        wait until everything queued so far has run
+        """
+        done = threading.Event()
+        self.call_soon(done.set)
+        self.start()
+        return done.wait(timeout)
+
+    def _run(self: Self):
+        while True:
+            func, args, kwargs = self._queue.get()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                structlog.get_logger().exception("Deferred signal work failed")
+
+    def _after_fork(self: Self):
+        # the worker thread does not survive a fork, nor does any lock it held
+        started = self._thread is not None
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        if started:
+            self.start()
+
+
+deferred_calls = DeferredCalls()
+os.register_at_fork(after_in_child=deferred_calls._after_fork)
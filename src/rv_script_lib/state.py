@@ -0,0 +1,104 @@
+import json
+import sqlite3
+from collections.abc import MutableMapping
+from typing import Any, Iterator, Optional, Self
+
+from rv_script_lib.logging import custom_logger_proxy
+
+
+class StateStore(MutableMapping):
+    """
+    Key/value state for repeat jobs, such as cursors, watermarks or seen ids.
+
+    Values live in memory as normal python objects and must be JSON serializable.
+    commit() writes the keys that changed since the last commit to sqlite in a
+    single transaction, and rollback() puts the in-memory values back to what was
+    last committed. Without a path the store is memory only, but still rolls back.
+    """
+
+    def __init__(self: Self, path: Optional[str] = "") -> Self:
+        self.log = custom_logger_proxy()
+        self.path = path
+        self._data = {}
+        self._committed = {}
+        self._conn = None
+
+        if self.path:
+            self._conn = sqlite3.connect(self.path, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self.reload()
+
+    def __getitem__(self: Self, key: str) -> Any:
+        return self._data[key]
+
+    def __setitem__(self: Self, key: str, value: Any):
+        if not isinstance(key, str):
+            raise TypeError("state keys must be strings")
+        self._data[key] = value
+
+    def __delitem__(self: Self, key: str):
+        del self._data[key]
+
+    def __iter__(self: Self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self: Self) -> int:
+        return len(self._data)
+
+    def reload(self: Self):
+        """
+        replace the in-memory values with what is committed on disk
+        """
+        if self._conn is not None:
+            self._committed = dict(self._conn.execute("SELECT key, value FROM state"))
+        self.rollback()
+
+    def commit(self: Self) -> int:
+        """
+        persist changes made since the last commit, returns the number of changed keys
+        """
+        encoded = {
+            key: json.dumps(value, sort_keys=True) for key, value in self._data.items()
+        }
+        changed = [
+            (key, value)
+            for key, value in encoded.items()
+            if self._committed.get(key) != value
+        ]
+        deleted = [(key,) for key in self._committed.keys() - encoded.keys()]
+
+        if self._conn is not None and (changed or deleted):
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO state (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    changed,
+                )
+                self._conn.executemany("DELETE FROM state WHERE key = ?", deleted)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        self._committed = encoded
+        if changed or deleted:
+            self.log.debug(
+                "State committed", changed=len(changed), deleted=len(deleted)
+            )
+
+        return len(changed) + len(deleted)
+
+    def rollback(self: Self):
+        """
+        discard changes made since the last commit
+        """
+        self._data = {key: json.loads(value) for key, value in self._committed.items()}
+
+    def close(self: Self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
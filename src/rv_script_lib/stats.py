@@ -0,0 +1,126 @@
+from array import array
+from typing import Optional, Self
+
+from prometheus_client import CollectorRegistry, Gauge
+
+DEFAULT_STATS_WINDOW = 256
+STATS_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class IterationStats:
+    """
+    Fixed-size ring buffer of the most recent iterations.
+
+    Each record is a start time, a duration, a success flag and an item count,
+    kept in preallocated arrays, so memory use does not grow with the number of
+    iterations. Summaries are computed over the records currently in the window.
+    """
+
+    def __init__(self: Self, size: int = DEFAULT_STATS_WINDOW) -> Self:
+        self.size = max(size, 1)
+        self.starts = array("d", bytes(8 * self.size))
+        self.durations = array("d", bytes(8 * self.size))
+        self.items = array("d", bytes(8 * self.size))
+        self.successes = array("b", bytes(self.size))
+        self.count = 0
+        self.total = 0
+        self.failure_streak = 0
+        self._next = 0
+
+    def record(
+        self: Self, start: float, duration: float, success: bool, items: float = 0
+    ):
+        index = self._next
+        self.starts[index] = start
+        self.durations[index] = duration
+        self.items[index] = items
+        self.successes[index] = success
+        self._next = (index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        self.total += 1
+        self.failure_streak = 0 if success else self.failure_streak + 1
+
+    def percentiles(self: Self, quantiles: tuple[float, ...]) -> list[float]:
+        """
+        nearest-rank percentiles of durations in the window, each between 0 and 1
+        """
+        if not self.count:
+            return [0.0 for _ in quantiles]
+        ordered = sorted(self.durations[: self.count])
+        return [
+            ordered[min(max(int(q * self.count + 0.5), 1), self.count) - 1]
+            for q in quantiles
+        ]
+
+    def percentile(self: Self, q: float) -> float:
+        return self.percentiles((q,))[0]
+
+    def failure_ratio(self: Self) -> float:
+        if not self.count:
+            return 0.0
+        return 1 - sum(self.successes[: self.count]) / self.count
+
+    def items_per_second(self: Self) -> float:
+        """
+        items processed per second of job run time
+        """
+        busy = sum(self.durations[: self.count])
+        if not busy:
+            return 0.0
+        return sum(self.items[: self.count]) / busy
+
+    def summary(self: Self) -> dict:
+        summary = {
+            "iterations": self.total,
+            "window": self.count,
+            "failure_ratio": round(self.failure_ratio(), 4),
+            "failure_streak": self.failure_streak,
+            "items_per_second": round(self.items_per_second(), 3),
+        }
+        for q, value in zip(STATS_QUANTILES, self.percentiles(STATS_QUANTILES)):
+            summary[f"p{q * 100:g}_seconds"] = round(value, 3)
+        return summary
+
+
+class StatsMetrics:
+    """
+    gauges that publish an IterationStats summary
+    """
+
+    def __init__(
+        self: Self,
+        registry: Optional[CollectorRegistry] = None,
+        prefix: str = "scriptbase",
+    ) -> Self:
+        self.duration = Gauge(
+            f"{prefix}_iteration_duration_seconds",
+            "Job duration percentiles over the recent iterations",
+            ["quantile"],
+            registry=registry,
+            multiprocess_mode="mostrecent",
+        )
+        self.failure_ratio = Gauge(
+            f"{prefix}_iteration_failure_ratio",
+            "Share of the recent iterations that failed",
+            registry=registry,
+            multiprocess_mode="mostrecent",
+        )
+        self.failure_streak = Gauge(
+            f"{prefix}_iteration_failure_streak",
+            "Consecutive failed iterations, up to the most recent one",
+            registry=registry,
+            multiprocess_mode="mostrecent",
+        )
+        self.items_per_second = Gauge(
+            f"{prefix}_iteration_items_per_second",
+            "Items processed per second of job run time over the recent iterations",
+            registry=registry,
+            multiprocess_mode="mostrecent",
+        )
+
+    def update(self: Self, stats: IterationStats):
+        for q, value in zip(STATS_QUANTILES, stats.percentiles(STATS_QUANTILES)):
+            self.duration.labels(f"{q:g}").set(value)
+        self.failure_ratio.set(stats.failure_ratio())
+        self.failure_streak.set(stats.failure_streak)
+        self.items_per_second.set(stats.items_per_second())
@@ -0,0 +1,276 @@
+import argparse
+import glob
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from datetime import datetime
+from time import time
+from typing import Optional, Self
+
+from rv_script_lib.multiprocess import pid_is_alive
+
+STATUS_DIR_ENV = "RV_SCRIPT_STATUS_DIR"
+STATUS_SUFFIX = ".status"
+STATUS_MAGIC = b"RVS1"
+
+# magic, sequence, pid, iteration, started, updated, last duration, next fire,
+# last status, phase, name
+STATUS_STRUCT = struct.Struct("<4sIiQddddb31s64s")
+SEQUENCE = struct.Struct("<I")
+SEQUENCE_OFFSET = 4
+STATUS_READ_RETRIES = 100
+
+LAST_STATUS_NAMES = {-1: "", 0: "fail", 1: "success", 2: "skipped"}
+LAST_STATUS_CODES = {name: code for code, name in LAST_STATUS_NAMES.items()}
+
+
+def status_file_name(name: str, pid: int) -> str:
+    return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.{pid}{STATUS_SUFFIX}"
+
+
+class StatusFile:
+    """
+    Fixed-size status record for one process, in a memory-mapped file.
+
+    update() packs the record straight into the shared mapping, so keeping it
+    current costs no system calls. A sequence number that is odd while a write
+    is in progress lets readers in other processes retry torn reads. Without a
+    directory the record lives in an anonymous mapping and nothing is written.
+    """
+
+    def __init__(
+        self: Self, directory: Optional[str] = "", name: str = "script"
+    ) -> Self:
+        self.pid = os.getpid()
+        self.path = None
+        self.fields = {
+            "pid": self.pid,
+            "iteration": 0,
+            "started": time(),
+            "updated": time(),
+            "last_duration": 0.0,
+            "next_fire": 0.0,
+            "last_status": "",
+            "phase": "starting",
+            "name": name,
+        }
+        self._sequence = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.path = os.path.join(directory, status_file_name(name, self.pid))
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.ftruncate(fd, STATUS_STRUCT.size)
+                self._map = mmap.mmap(fd, STATUS_STRUCT.size)
+            finally:
+                os.close(fd)
+        else:
+            self._map = mmap.mmap(-1, STATUS_STRUCT.size)
+
+        self._write()
+
+    def update(self: Self, **fields):
+        """
+        change some fields, such as update(phase="running", iteration=3)
+        """
+        if self._map.closed:
+            return
+        self.fields.update(fields)
+        self.fields["updated"] = time()
+        self._write()
+
+    def _write(self: Self):
+        fields = self.fields
+        self._sequence += 1
+        SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, self._sequence)
+        STATUS_STRUCT.pack_into(
+            self._map,
+            0,
+            STATUS_MAGIC,
+            self._sequence,
+            fields["pid"],
+            fields["iteration"],
+            fields["started"],
+            fields["updated"],
+            fields["last_duration"],
+            fields["next_fire"],
+            LAST_STATUS_CODES.get(fields["last_status"], -1),
+            fields["phase"].encode()[:31],
+            fields["name"].encode()[:64],
+        )
+        self._sequence += 1
+        SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, self._sequence)
+
+    def close(self: Self):
+        """
+        unmap the record and remove its file, only in the process that made it
+        """
+        if os.getpid() != self.pid or self._map.closed:
+            return
+        self._map.close()
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def unpack_status(data: bytes) -> Optional[dict]:
+    if len(data) < STATUS_STRUCT.size:
+        return None
+    (
+        magic,
+        sequence,
+        pid,
+        iteration,
+        started,
+        updated,
+        last_duration,
+        next_fire,
+        last_status,
+        phase,
+        name,
+    ) = STATUS_STRUCT.unpack_from(data)
+    if magic != STATUS_MAGIC:
+        return None
+    return {
+        "name": name.rstrip(b"\0").decode(errors="replace"),
+        "pid": pid,
+        "iteration": iteration,
+        "phase": phase.rstrip(b"\0").decode(errors="replace"),
+        "last_status": LAST_STATUS_NAMES.get(last_status, ""),
+        "last_duration": last_duration,
+        "next_fire": next_fire,
+        "started": started,
+        "updated": updated,
+        "_sequence": sequence,
+    }
+
+
+def read_status(path: str) -> Optional[dict]:
+    """
+    a consistent copy of a status record, None if it is not one
+    """
+    try:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for _ in range(STATUS_READ_RETRIES):
+                    (before,) = SEQUENCE.unpack_from(mapped, SEQUENCE_OFFSET)
+                    status = unpack_status(mapped[: STATUS_STRUCT.size])
+                    (after,) = SEQUENCE.unpack_from(mapped, SEQUENCE_OFFSET)
+                    if before == after and not before % 2:
+                        break
+    except (OSError, ValueError):
+        return None
+
+    if status is not None:
+        del status["_sequence"]
+        status["alive"] = pid_is_alive(status["pid"])
+    return status
+
+
+def read_status_dir(directory: str) -> list[dict]:
+    records = []
+    for path in sorted(glob.glob(os.path.join(directory, f"*{STATUS_SUFFIX}"))):
+        status = read_status(path)
+        if status is not None:
+            status["path"] = path
+            records.append(status)
+    return records
+
+
+def format_timestamp(timestamp: float) -> str:
+    if not timestamp:
+        return "-"
+    return datetime.fromtimestamp(timestamp).isoformat(sep=" ", timespec="seconds")
+
+
+def format_table(records: list[dict]) -> str:
+    header = (
+        "NAME",
+        "PID",
+        "ALIVE",
+        "ITER",
+        "PHASE",
+        "LAST",
+        "DURATION",
+        "NEXT RUN",
+        "UPDATED",
+    )
+    rows = [header]
+    for status in records:
+        rows.append(
+            (
+                status["name"],
+                str(status["pid"]),
+                "yes" if status["alive"] else "no",
+                str(status["iteration"]),
+                status["phase"],
+                status["last_status"] or "-",
+                f"{status['last_duration']:.3f}s" if status["iteration"] else "-",
+                format_timestamp(status["next_fire"]),
+                format_timestamp(status["updated"]),
+            )
+        )
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in rows
+    )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """
+    rv-script-status, show the status records of every job on this host
+    """
+    parser = argparse.ArgumentParser(
+        prog="rv-script-status",
+        description="Show what the scripts writing status files are doing",
+    )
+    parser.add_argument(
+        "--status-dir",
+        dest="status_dir",
+        type=str,
+        default=os.getenv(STATUS_DIR_ENV, ""),
+        help=f"Directory the scripts write status files to. Set with env var {STATUS_DIR_ENV}",
+    )
+    parser.add_argument(
+        "--json",
+        dest="json",
+        action="store_true",
+        help="Print one JSON object per status file",
+    )
+    parser.add_argument(
+        "--prune",
+        dest="prune",
+        action="store_true",
+        help="Remove status files left behind by processes that are gone",
+    )
+    args = parser.parse_args(argv)
+
+    if not args.status_dir:
+        parser.error(f"--status-dir or {STATUS_DIR_ENV} is required")
+
+    records = read_status_dir(args.status_dir)
+    if args.prune:
+        for status in records:
+            if not status["alive"]:
+                os.remove(status["path"])
+        records = [status for status in records if status["alive"]]
+
+    if args.json:
+        for status in records:
+            print(json.dumps(status, sort_keys=True))
+    elif records:
+        print(format_table(records))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
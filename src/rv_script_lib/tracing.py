@@ -0,0 +1,262 @@
+import json
+import random
+import threading
+import time
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+from typing import Any, Optional, Self
+
+import structlog
+from prometheus_client import CollectorRegistry, Histogram
+
+_current_span = ContextVar("rv_script_lib_current_span", default=None)
+
+SPAN_STATUS_UNSET = 0
+SPAN_STATUS_OK = 1
+SPAN_STATUS_ERROR = 2
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "attributes",
+        "start_ns",
+        "end_ns",
+        "status",
+        "status_message",
+    )
+
+    def __init__(
+        self: Self, name: str, parent: Optional["Span"], attributes: dict
+    ) -> Self:
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else ""
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.status = SPAN_STATUS_UNSET
+        self.status_message = ""
+
+    @property
+    def duration(self: Self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def set_attribute(self: Self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_otlp(self: Self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": otlp_attributes(self.attributes),
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+def otlp_attributes(attributes: dict) -> list[dict]:
+    """
+    convert a dict to the OTLP/JSON key value list
+    """
+    converted = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            otlp_value = {"boolValue": value}
+        elif isinstance(value, int):
+            otlp_value = {"intValue": str(value)}
+        elif isinstance(value, float):
+            otlp_value = {"doubleValue": value}
+        else:
+            otlp_value = {"stringValue": str(value)}
+        converted.append({"key": key, "value": otlp_value})
+    return converted
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class _SpanContext(ContextDecorator):
+    """
+    context manager and decorator for one span, a new Span is made per use
+    """
+
+    def __init__(self: Self, tracer: "Tracer", name: str, attributes: dict) -> Self:
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span = None
+        self._span_token = None
+        self._log_tokens = None
+
+    def _recreate_cm(self: Self) -> Self:
+        return _SpanContext(self.tracer, self.name, dict(self.attributes))
+
+    def __enter__(self: Self) -> Span:
+        self.span = Span(self.name, _current_span.get(), self.attributes)
+        self._span_token = _current_span.set(self.span)
+        self._log_tokens = structlog.contextvars.bind_contextvars(
+            trace_id=self.span.trace_id,
+            span_id=self.span.span_id,
+        )
+        return self.span
+
+    def __exit__(self: Self, exc_type, exc_value, traceback) -> bool:
+        span = self.span
+        span.end_ns = time.time_ns()
+        if exc_type is not None:
+            span.status = SPAN_STATUS_ERROR
+            span.status_message = f"{exc_type.__name__}: {exc_value}"
+        elif span.status == SPAN_STATUS_UNSET:
+            span.status = SPAN_STATUS_OK
+
+        structlog.contextvars.reset_contextvars(**self._log_tokens)
+        _current_span.reset(self._span_token)
+        self.tracer.finish(span)
+        return False
+
+
+class _NoopSpanContext(ContextDecorator):
+    """
+    shared stand-in used while tracing is disabled
+    """
+
+    def __enter__(self: Self) -> None:
+        return None
+
+    def __exit__(self: Self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+
+_NOOP_SPAN_CONTEXT = _NoopSpanContext()
+
+
+class Tracer:
+    """
+    Times named phases of a job.
+
+    Spans nest through contextvars, bind trace_id and span_id into the structlog
+    context, and record their duration in a histogram labelled by span name. With
+    an export path, finished spans are buffered and appended to the file by flush()
+    as OTLP/JSON lines, which the OpenTelemetry collector's otlpjsonfile receiver
+    can read.
+    """
+
+    def __init__(
+        self: Self,
+        enabled: bool = True,
+        registry: Optional[CollectorRegistry] = None,
+        prefix: str = "scriptbase",
+        export_path: Optional[str] = "",
+        service_name: Optional[str] = "",
+    ) -> Self:
+        self.enabled = enabled
+        self.export_path = export_path
+        self.service_name = service_name
+        self._finished = []
+        self._lock = threading.Lock()
+        self.durations = None
+        if enabled:
+            self.durations = Histogram(
+                f"{prefix}_span_duration_seconds",
+                "Duration of traced job phases",
+                ["span"],
+                registry=registry,
+            )
+
+    def span(self: Self, name: str, **attributes) -> ContextDecorator:
+        if not self.enabled:
+            return _NOOP_SPAN_CONTEXT
+        return _SpanContext(self, name, attributes)
+
+    def finish(self: Self, span: Span):
+        self.durations.labels(span.name).observe(span.duration)
+        if self.export_path:
+            with self._lock:
+                self._finished.append(span)
+
+    def flush(self: Self) -> int:
+        """
+        append buffered spans to the export file, returns how many were written
+        """
+        with self._lock:
+            finished, self._finished = self._finished, []
+
+        if not finished:
+            return 0
+
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": otlp_attributes(
+                            {"service.name": self.service_name}
+                        )
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "rv_script_lib"},
+                            "spans": [span.to_otlp() for span in finished],
+                        }
+                    ],
+                }
+            ]
+        }
+        with open(self.export_path, "a") as f:
+            f.write(json.dumps(request, separators=(",", ":")) + "\n")
+
+        return len(finished)
+
+
+_NOOP_TRACER = Tracer(enabled=False)
+_active_tracer = _NOOP_TRACER
+
+
+def set_tracer(tracer: Optional[Tracer]):
+    global _active_tracer
+    _active_tracer = tracer or _NOOP_TRACER
+
+
+def span(name: str, **attributes) -> ContextDecorator:
+    """
+    Span on the active tracer, usable where no ScriptBase instance is in reach,
+    such as decorating methods in a class body.
+
+    @span("fetch")
+    def fetch(self): ...
+    """
+    return _LazySpanContext(name, attributes)
+
+
+class _LazySpanContext(ContextDecorator):
+    """
+    looks up the active tracer each time it is entered
+    """
+
+    def __init__(self: Self, name: str, attributes: dict) -> Self:
+        self.name = name
+        self.attributes = attributes
+        self._context = None
+
+    def _recreate_cm(self: Self) -> Self:
+        return _LazySpanContext(self.name, self.attributes)
+
+    def __enter__(self: Self) -> Optional[Span]:
+        self._context = _active_tracer.span(self.name, **self.attributes)
+        return self._context.__enter__()
+
+    def __exit__(self: Self, exc_type, exc_value, traceback) -> bool:
+        return self._context.__exit__(exc_type, exc_value, traceback)
@@ -0,0 +1,388 @@
+import errno
+import os
+import signal
+import socket
+import stat
+import threading
+from collections import ChainMap, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic
+from typing import Callable, Mapping, Optional, Self
+
+from rv_script_lib.logging import custom_logger_proxy
+from rv_script_lib.signals import deferred_calls
+
+DEFAULT_TRIGGER_DEBOUNCE = "1s"
+DEFAULT_TRIGGER_POLL = "2s"
+
+type ControlCommand = Callable[[list[str]], str]
+
+
+class TriggerSet:
+    """
+    Collects wake-ups from trigger sources so the repeat loop can start early.
+
+    fire() is safe to call from other threads. SIGHUP goes through deferred_calls,
+    since setting the wakeup event from a handler could deadlock against the
+    main thread's own wait(). Events that arrive within `debounce_seconds` of
+    the first one are coalesced into a single wake-up.
+    """
+
+    def __init__(
+        self: Self,
+        debounce_seconds: float = 1.0,
+        wakeup: Optional[threading.Event] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> Self:
+        self.log = custom_logger_proxy()
+        self.debounce_seconds = debounce_seconds
+        self.wakeup = wakeup or threading.Event()
+        self.stop = stop or threading.Event()
+        self.sources = []
+        self._pending = deque()
+        self._previous_sighup = None
+
+    def fire(self: Self, reason: str):
+        self._pending.append((reason, monotonic()))
+        self.wakeup.set()
+
+    def add_source(self: Self, source):
+        """
+        add a trigger source, anything with start(trigger_set) and stop() methods
+        """
+        self.sources.append(source)
+
+    def start(self: Self):
+        for source in self.sources:
+            source.start(self)
+
+    def close(self: Self):
+        for source in self.sources:
+            source.stop()
+
+    def install_sighup(self: Self):
+        if threading.current_thread() is not threading.main_thread():
+            return
+        deferred_calls.start()
+        self._previous_sighup = signal.signal(signal.SIGHUP, self._handle_sighup)
+
+    def restore_sighup(self: Self):
+        if self._previous_sighup is not None:
+            signal.signal(signal.SIGHUP, self._previous_sighup)
+            self._previous_sighup = None
+
+    def _handle_sighup(self: Self, signum: int, frame):
+        # keep the signal time, the fire itself happens off the handler
+        deferred_calls.call_soon(self._fire_at, "sighup", monotonic())
+
+    def _fire_at(self: Self, reason: str, fired_at: float):
+        self._pending.append((reason, fired_at))
+        self.wakeup.set()
+
+    def wait(self: Self, timeout: float) -> list[tuple[str, float]]:
+        """
+        Wait up to timeout seconds for a trigger.
+
+        Returns the coalesced (reason, monotonic fire time) pairs, oldest first, or
+        an empty list if the timeout passed or a stop was requested first.
+        """
+        deadline = monotonic() + timeout
+
+        while not self.stop.is_set():
+            if not self.wakeup.wait(timeout=max(deadline - monotonic(), 0)):
+                return []
+
+            if self.stop.is_set():
+                break
+
+            if self.debounce_seconds > 0:
+                self.stop.wait(self.debounce_seconds)
+
+            self.wakeup.clear()
+            triggered = self.drain()
+            if triggered:
+                self.log.debug(
+                    "Triggered",
+                    reasons=sorted({reason for reason, _ in triggered}),
+                    coalesced=len(triggered),
+                )
+                return triggered
+
+        return []
+
+    def drain(self: Self) -> list[tuple[str, float]]:
+        triggered = []
+        while self._pending:
+            triggered.append(self._pending.popleft())
+        return triggered
+
+
+class FileWatchTrigger:
+    """
+    Fires when a file, or any entry directly inside a directory, changes.
+
+    This polls stat() results, so it works on any filesystem without extra
+    dependencies.
+    """
+
+    def __init__(self: Self, paths: list[str], poll_seconds: float = 2.0) -> Self:
+        self.log = custom_logger_proxy()
+        self.paths = paths
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _stat_key(path: str) -> Optional[tuple[int, int]]:
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return None
+        return (stat_result.st_mtime_ns, stat_result.st_size)
+
+    def snapshot(self: Self) -> dict[str, Optional[tuple[int, int]]]:
+        state = {}
+        for path in self.paths:
+            state[path] = self._stat_key(path)
+            if os.path.isdir(path):
+                try:
+                    with os.scandir(path) as entries:
+                        for entry in entries:
+                            state[entry.path] = self._stat_key(entry.path)
+                except OSError:
+                    pass
+        return state
+
+    def start(self: Self, trigger_set: TriggerSet):
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._watch,
+            args=(trigger_set, self.snapshot()),
+            name="rv-trigger-file-watch",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self: Self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds + 1)
+            self._thread = None
+
+    def _watch(self: Self, trigger_set: TriggerSet, last_state: dict):
+        while not self._stop.wait(self.poll_seconds):
+            state = self.snapshot()
+            if state != last_state:
+                changed = sorted(
+                    path
+                    for path in state.keys() | last_state.keys()
+                    if state.get(path) != last_state.get(path)
+                )
+                self.log.debug("Watched files changed", paths=changed)
+                trigger_set.fire("file")
+                last_state = state
+
+
+def run_control_command(commands: Mapping[str, ControlCommand], line: str) -> str:
+    """
+    run a control command line such as "kick", returning the reply text
+    """
+    words = line.split()
+    if not words:
+        words = ["kick"]
+
+    command = commands.get(words[0].lower())
+    if command is None:
+        return f"error unknown command {words[0]}"
+
+    try:
+        return command(words[1:])
+    except Exception as e:
+        return f"error {e}"
+
+
+class SocketControlTrigger:
+    """
+    Unix stream socket that accepts one command line per connection.
+
+    An empty line or "kick" fires the trigger, other commands can be registered
+    in `commands`. A socket left at `path` by a process that is gone is replaced,
+    but start() refuses to take over a path that is not a socket or that another
+    process still answers on, and stop() only removes the socket it created.
+    """
+
+    def __init__(
+        self: Self,
+        path: str,
+        commands: Optional[dict[str, ControlCommand]] = None,
+    ) -> Self:
+        self.log = custom_logger_proxy()
+        self.path = path
+        self.commands = commands if commands is not None else {}
+        self._sock = None
+        self._thread = None
+        self._bound = None
+
+    def start(self: Self, trigger_set: TriggerSet):
+        commands = ChainMap(
+            {"kick": lambda args: self._kick(trigger_set)}, self.commands
+        )
+
+        self._remove_stale_socket()
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen()
+        bound = os.lstat(self.path)
+        self._bound = (bound.st_dev, bound.st_ino)
+
+        self._thread = threading.Thread(
+            target=self._serve,
+            args=(self._sock, commands),
+            name="rv-trigger-socket",
+            daemon=True,
+        )
+        self._thread.start()
+        self.log.debug("Control socket listening", path=self.path)
+
+    def stop(self: Self):
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+            self._sock = None
+
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+        if self._bound is not None:
+            try:
+                current = os.lstat(self.path)
+                if (current.st_dev, current.st_ino) == self._bound:
+                    os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self._bound = None
+
+    def _remove_stale_socket(self: Self):
+        try:
+            mode = os.lstat(self.path).st_mode
+        except FileNotFoundError:
+            return
+
+        if not stat.S_ISSOCK(mode):
+            raise FileExistsError(
+                errno.EEXIST,
+                "Control socket path exists and is not a socket",
+                self.path,
+            )
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # nobody listens any more, the socket is left over
+            os.unlink(self.path)
+            return
+        finally:
+            probe.close()
+
+        raise OSError(
+            errno.EADDRINUSE, "Control socket is in use by another process", self.path
+        )
+
+    @staticmethod
+    def _kick(trigger_set: TriggerSet) -> str:
+        trigger_set.fire("socket")
+        return "ok"
+
+    def _serve(self: Self, sock: socket.socket, commands: ChainMap):
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+
+            with conn:
+                conn.settimeout(5)
+                try:
+                    line = conn.makefile("r").readline()
+                    reply = run_control_command(commands, line)
+                    conn.sendall(f"{reply}\n".encode())
+                except OSError as e:
+                    self.log.warning("Control socket error", error=str(e))
+
+
+class HttpControlTrigger:
+    """
+    Small HTTP endpoint, POST /kick fires the trigger.
+
+    Other registered commands are reachable as POST /<command>/<arg>/...
+    """
+
+    def __init__(
+        self: Self,
+        host: str,
+        port: int,
+        commands: Optional[dict[str, ControlCommand]] = None,
+    ) -> Self:
+        self.log = custom_logger_proxy()
+        self.host = host
+        self.port = port
+        self.commands = commands if commands is not None else {}
+        self.server = None
+        self._thread = None
+
+    def start(self: Self, trigger_set: TriggerSet):
+        commands = ChainMap(
+            {"kick": lambda args: self._kick(trigger_set)}, self.commands
+        )
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self: Self):
+                reply = run_control_command(
+                    commands, " ".join(self.path.strip("/").split("/"))
+                )
+                self.send_response(400 if reply.startswith("error") else 200)
+                self.send_header("Content-Type", "text/plain")
+                self.end_headers()
+                self.wfile.write(f"{reply}\n".encode())
+
+            def log_message(self: Self, format: str, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(
+            target=self.server.serve_forever,
+            name="rv-trigger-http",
+            daemon=True,
+        )
+        self._thread.start()
+        self.log.debug("Control endpoint listening", host=self.host, port=self.port)
+
+    def stop(self: Self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    @staticmethod
+    def _kick(trigger_set: TriggerSet) -> str:
+        trigger_set.fire("http")
+        return "ok"
+
+
+def parse_host_port(value: str, default_host: str = "127.0.0.1") -> tuple[str, int]:
+    """
+    parse "port" or "host:port" into a (host, port) tuple
+    """
+    host, _, port = value.rpartition(":")
+    return (host or default_host, int(port))
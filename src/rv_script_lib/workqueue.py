@@ -0,0 +1,287 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from time import perf_counter, time
+from typing import Any, Iterable, Optional, Self
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+from rv_script_lib.logging import custom_logger_proxy
+
+DEFAULT_LEASE_SECONDS = 300
+SQLITE_BUSY_TIMEOUT = 30
+
+
+class WorkQueueMetrics:
+    """
+    metrics shared by every work queue a script opens
+    """
+
+    def __init__(
+        self: Self,
+        registry: Optional[CollectorRegistry] = None,
+        prefix: str = "scriptbase",
+    ) -> Self:
+        self.depth = Gauge(
+            f"{prefix}_work_queue_depth",
+            "Items in each work queue, ready to claim or leased",
+            ["queue", "state"],
+            registry=registry,
+            multiprocess_mode="mostrecent",
+        )
+        self.claim_latency = Histogram(
+            f"{prefix}_work_queue_claim_latency_seconds",
+            "Time taken to claim a batch, including waiting for the database lock",
+            ["queue"],
+            registry=registry,
+        )
+        self.redeliveries = Counter(
+            f"{prefix}_work_queue_redeliveries",
+            "Items claimed again after a lease expired or a nack",
+            ["queue"],
+            registry=registry,
+        )
+
+
+class WorkItem:
+    __slots__ = ("id", "payload", "attempts", "lease_expires")
+
+    def __init__(
+        self: Self, id: int, payload: Any, attempts: int, lease_expires: float
+    ) -> Self:
+        self.id = id
+        self.payload = payload
+        self.attempts = attempts
+        self.lease_expires = lease_expires
+
+    def __repr__(self: Self) -> str:
+        return f"WorkItem(id={self.id}, attempts={self.attempts})"
+
+
+class WorkQueue:
+    """
+    Named queue of JSON items in a sqlite file that several processes, or several
+    hosts on a shared filesystem, can work through together.
+
+    claim() leases a batch to this queue object and returns it. The items must
+    then be ack()ed once done, or nack()ed to hand them back. Items whose lease
+    runs out before an ack are claimable again, so work is delivered at least
+    once. WAL mode needs shared memory and does not work on network filesystems,
+    pass wal=False there.
+
+    queue = WorkQueue("/shared/work.sqlite", "urls")
+    queue.put_many(urls)
+    for item in queue.claim(limit=10):
+        fetch(item.payload)
+        queue.ack(item)
+    """
+
+    def __init__(
+        self: Self,
+        path: Optional[str],
+        name: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        metrics: Optional[WorkQueueMetrics] = None,
+        wal: bool = True,
+    ) -> Self:
+        self.log = custom_logger_proxy()
+        self.path = path or ":memory:"
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.metrics = metrics
+        self.wal = wal
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self: Self):
+        self._pid = os.getpid()
+        self._conn = sqlite3.connect(
+            self.path,
+            timeout=SQLITE_BUSY_TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        if self.wal:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS work_items ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, "
+            "payload TEXT NOT NULL, enqueued REAL NOT NULL, available REAL NOT NULL, "
+            "lease_owner TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS work_items_ready "
+            "ON work_items (queue, available, lease_expires)"
+        )
+
+    def _db(self: Self) -> sqlite3.Connection:
+        # a sqlite connection must not be used on both sides of a fork
+        if self._pid != os.getpid():
+            if self.path == ":memory:":
+                self.log.warning(
+                    "In-memory work queue used after a fork starts empty, "
+                    "pass a path to share it",
+                    queue=self.name,
+                )
+            self._lock = threading.Lock()
+            self._connect()
+        return self._conn
+
+    def put(self: Self, payload: Any, delay: float = 0) -> int:
+        return self.put_many([payload], delay=delay)[0]
+
+    def put_many(self: Self, payloads: Iterable[Any], delay: float = 0) -> list[int]:
+        """
+        add items in one transaction, returns their ids
+        """
+        now = time()
+        rows = [
+            (self.name, json.dumps(payload), now, now + delay) for payload in payloads
+        ]
+        conn = self._db()
+        ids = []
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for row in rows:
+                    ids.append(
+                        conn.execute(
+                            "INSERT INTO work_items (queue, payload, enqueued, available) "
+                            "VALUES (?, ?, ?, ?)",
+                            row,
+                        ).lastrowid
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        self.update_depth()
+        return ids
+
+    def claim(
+        self: Self, limit: int = 1, lease_seconds: Optional[float] = None
+    ) -> list[WorkItem]:
+        """
+        lease up to limit ready items, oldest first
+        """
+        started = perf_counter()
+        conn = self._db()
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time()
+                expires = now + (lease_seconds or self.lease_seconds)
+                rows = conn.execute(
+                    "SELECT id, payload, attempts FROM work_items "
+                    "WHERE queue = ? AND available <= ? "
+                    "AND (lease_expires IS NULL OR lease_expires <= ?) "
+                    "ORDER BY id LIMIT ?",
+                    (self.name, now, now, limit),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE work_items SET lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    [(self.owner, expires, row[0]) for row in rows],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        items = [
+            WorkItem(id, json.loads(payload), attempts + 1, expires)
+            for id, payload, attempts in rows
+        ]
+        if self.metrics is not None:
+            self.metrics.claim_latency.labels(self.name).observe(
+                perf_counter() - started
+            )
+            redelivered = sum(1 for item in items if item.attempts > 1)
+            if redelivered:
+                self.metrics.redeliveries.labels(self.name).inc(redelivered)
+        self.update_depth()
+        return items
+
+    def _update_leased(self: Self, sql: str, params: list[tuple]) -> int:
+        conn = self._db()
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                changed = conn.executemany(sql, params).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return changed
+
+    def ack(self: Self, *items: WorkItem) -> int:
+        """
+        remove finished items, returns how many were still leased to us
+        """
+        acked = self._update_leased(
+            "DELETE FROM work_items WHERE id = ? AND lease_owner = ?",
+            [(item.id, self.owner) for item in items],
+        )
+        if acked < len(items):
+            self.log.warning(
+                "Acked items whose lease had expired",
+                queue=self.name,
+                lost=len(items) - acked,
+            )
+        return acked
+
+    def nack(self: Self, *items: WorkItem, delay: float = 0) -> int:
+        """
+        hand items back to the queue, claimable again after delay seconds
+        """
+        return self._update_leased(
+            "UPDATE work_items SET lease_owner = NULL, lease_expires = NULL, "
+            "available = ? WHERE id = ? AND lease_owner = ?",
+            [(time() + delay, item.id, self.owner) for item in items],
+        )
+
+    def extend(
+        self: Self, *items: WorkItem, lease_seconds: Optional[float] = None
+    ) -> int:
+        """
+        renew the lease on items that are taking a while
+        """
+        expires = time() + (lease_seconds or self.lease_seconds)
+        extended = self._update_leased(
+            "UPDATE work_items SET lease_expires = ? WHERE id = ? AND lease_owner = ?",
+            [(expires, item.id, self.owner) for item in items],
+        )
+        for item in items:
+            item.lease_expires = expires
+        return extended
+
+    def depth(self: Self) -> dict[str, int]:
+        """
+        returns counts of items that are ready (or delayed) and leased
+        """
+        now = time()
+        conn = self._db()
+        with self._lock:
+            leased, total = conn.execute(
+                "SELECT COALESCE(SUM(lease_expires > ?), 0), COUNT(*) "
+                "FROM work_items WHERE queue = ?",
+                (now, self.name),
+            ).fetchone()
+        return {"ready": total - leased, "leased": leased}
+
+    def update_depth(self: Self):
+        """
+        refresh the depth gauge, done on every put and claim
+        """
+        if self.metrics is None:
+            return
+        for state, value in self.depth().items():
+            self.metrics.depth.labels(self.name, state).set(value)
+
+    def close(self: Self):
+        with self._lock:
+            self._conn.close()
@@ -152,3 +152,39 @@ class TestArguments(TestCase):
         self.assertEqual(log_counts.get("warning", 0), 1)
         self.assertEqual(log_counts.get("error", 0), 1)
         self.assertEqual(log_counts.get("critical", 0), 1)
+
+    def test_feature_options_hidden(self: Self):
+        hidden_help = get_custom_parser().format_help()
+        shown_help = get_custom_parser(
+            include_state_options=True,
+            include_cache_options=True,
+            include_tracing_options=True,
+            include_locking_options=True,
+            include_isolation_options=True,
+            include_work_queue_options=True,
+        ).format_help()
+
+        for option in (
+            "--state-path",
+            "--cache-dir",
+            "--trace-file",
+            "--lock-file",
+            "--isolate-iterations",
+            "--work-queue-path",
+        ):
+            self.assertNotIn(option, hidden_help)
+            self.assertIn(option, shown_help)
+
+        # hidden options still parse, like the repeat group
+        args = get_custom_parser().parse_args(["--state-path", "/tmp/state.sqlite"])
+        self.assertEqual(args.state_path, "/tmp/state.sqlite")
+        self.assertFalse(args.isolate_iterations)
+
+    def test_repeat_options_hidden(self: Self):
+        hidden_help = get_custom_parser().format_help()
+        shown_help = get_custom_parser(include_repeat_group=True).format_help()
+
+        self.assertNotIn("Repeat Groups", hidden_help)
+        for option in ("--repeat-interval", "--job-budget"):
+            self.assertNotIn(option, hidden_help)
+            self.assertIn(option, shown_help)
@@ -0,0 +1,70 @@
+import math
+import threading
+import time
+from typing import Self
+from unittest import TestCase
+
+from rv_script_lib.budget import JobBudget, iter_within_budget
+
+
+class TestJobBudget(TestCase):
+    def test_unlimited(self: Self):
+        budget = JobBudget()
+        self.assertIsNone(budget.deadline)
+        self.assertEqual(budget.remaining(), math.inf)
+        self.assertFalse(budget.exhausted(needed=3600))
+
+    def test_remaining(self: Self):
+        budget = JobBudget(seconds=60)
+        self.assertAlmostEqual(budget.deadline, time.monotonic() + 60, delta=1)
+        self.assertGreater(budget.remaining(), 59)
+        self.assertTrue(budget.exhausted(needed=61))
+        self.assertEqual(JobBudget(seconds=0).remaining(), 0)
+
+
+class TestIterWithinBudget(TestCase):
+    def test_items_run_out_first(self: Self):
+        checkpoints = []
+        items = iter_within_budget(
+            range(5), JobBudget(seconds=60), checkpoint=checkpoints.append
+        )
+        self.assertEqual(list(items), [0, 1, 2, 3, 4])
+        self.assertEqual(checkpoints, [])
+
+    def test_budget_runs_out(self: Self):
+        checkpoints = []
+        source = iter(range(100))
+        processed = []
+        for item in iter_within_budget(
+            source, JobBudget(seconds=0.1), checkpoint=checkpoints.append
+        ):
+            time.sleep(0.03)
+            processed.append(item)
+
+        # the average item time is reserved, so the deadline is not overrun
+        self.assertLessEqual(len(processed), 3)
+        self.assertEqual(checkpoints, [processed[-1]])
+        # items that were not started stay in the source
+        self.assertEqual(next(source), len(processed))
+
+    def test_stop_event(self: Self):
+        stop = threading.Event()
+        checkpoints = []
+        processed = []
+        for item in iter_within_budget(
+            range(10), JobBudget(), checkpoint=checkpoints.append, stop=stop
+        ):
+            processed.append(item)
+            if item == 2:
+                stop.set()
+
+        self.assertEqual(processed, [0, 1, 2])
+        self.assertEqual(checkpoints, [2])
+
+    def test_nothing_processed(self: Self):
+        checkpoints = []
+        items = iter_within_budget(
+            range(10), JobBudget(seconds=0), checkpoint=checkpoints.append
+        )
+        self.assertEqual(list(items), [])
+        self.assertEqual(checkpoints, [None])
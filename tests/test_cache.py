@@ -0,0 +1,106 @@
+import os
+from tempfile import TemporaryDirectory
+from typing import Self
+from unittest import TestCase, mock
+
+from prometheus_client import CollectorRegistry
+
+from rv_script_lib.cache import Cache, CacheManager, DiskCache, parse_size
+
+
+class TestParseSize(TestCase):
+    def test_sizes(self: Self):
+        self.assertEqual(parse_size("500"), 500)
+        self.assertEqual(parse_size("10k"), 10 * 1024)
+        self.assertEqual(parse_size("64M"), 64 * 1024**2)
+        self.assertEqual(parse_size("1GB"), 1024**3)
+
+
+class TestCache(TestCase):
+    def setUp(self: Self):
+        self.registry = CollectorRegistry()
+        self.manager = CacheManager(registry=self.registry, prefix="test")
+
+    def events(self: Self, cache_name: str, event: str) -> float:
+        return (
+            self.registry.get_sample_value(
+                "test_cache_events_total", {"cache": cache_name, "event": event}
+            )
+            or 0
+        )
+
+    def test_decorator(self: Self):
+        calls = []
+
+        @self.manager.cached(ttl=60, name="lookup")
+        def lookup(x: int) -> int:
+            calls.append(x)
+            return x * 2
+
+        self.assertEqual(lookup(2), 4)
+        self.assertEqual(lookup(2), 4)
+        self.assertEqual(lookup(3), 6)
+
+        self.assertEqual(calls, [2, 3])
+        self.assertEqual(self.events("lookup", "hit"), 1)
+        self.assertEqual(self.events("lookup", "miss"), 2)
+
+    def test_ttl(self: Self):
+        cache = self.manager.get_cache("ttl", ttl=10)
+
+        with mock.patch("rv_script_lib.cache.time", return_value=1000):
+            cache.set("key", "value")
+            self.assertEqual(cache.get("key"), "value")
+
+        with mock.patch("rv_script_lib.cache.time", return_value=1011):
+            self.assertIsNone(cache.get("key"))
+
+    def test_lru(self: Self):
+        cache = self.manager.get_cache("lru", ttl=60, max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(self.events("lru", "eviction"), 1)
+
+    def test_same_name_same_cache(self: Self):
+        self.assertIs(
+            self.manager.get_cache("x", ttl=1), self.manager.get_cache("x", ttl=1)
+        )
+
+
+class TestDiskCache(TestCase):
+    def setUp(self: Self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_survives_restart(self: Self):
+        manager = CacheManager(directory=self.temp_dir.name)
+        manager.get_cache("ref", ttl=60).set("key", {"some": "data"})
+        manager.close()
+
+        manager = CacheManager(directory=self.temp_dir.name)
+        self.addCleanup(manager.close)
+        cache = manager.get_cache("ref", ttl=60)
+        self.assertEqual(cache.get("key"), {"some": "data"})
+        self.assertIsNone(manager.get_cache("other", ttl=60).get("key"))
+
+    def test_size_limit(self: Self):
+        disk = DiskCache(self.temp_dir.name, max_size=300)
+        self.addCleanup(disk.close)
+        cache = Cache(name="big", ttl=60, disk=disk)
+
+        for i in range(5):
+            cache.set(str(i), b"x" * 100)
+
+        (total,) = disk._conn.execute("SELECT SUM(size) FROM cache").fetchone()
+        self.assertLessEqual(total, 300)
+        self.assertTrue(os.path.isfile(disk.path))
+
+        # the oldest entry was evicted from disk, newest is still there
+        cache._entries.clear()
+        self.assertIsNone(cache.get("0"))
+        self.assertEqual(cache.get("4"), b"x" * 100)
@@ -0,0 +1,77 @@
+from typing import Self
+from unittest import TestCase
+
+from prometheus_client import Counter, Gauge, Histogram
+from structlog.testing import capture_logs
+
+from rv_script_lib.cardinality import GuardedCollectorRegistry
+
+
+class TestGuardedCollectorRegistry(TestCase):
+    def setUp(self: Self):
+        self.registry = GuardedCollectorRegistry(max_label_sets=3)
+        self.registry.bind_metrics(prefix="test")
+
+    def test_overflow_folds_into_other(self: Self):
+        counter = Counter(
+            "files", "files seen", ["kind", "name"], registry=self.registry
+        )
+        with capture_logs() as cap_logs:
+            for i in range(10):
+                counter.labels("csv", f"file-{i}").inc()
+            counter.labels(kind="csv", name="file-0").inc()
+
+        self.assertEqual(len(counter._metrics), 4)
+        self.assertEqual(
+            self.registry.get_sample_value(
+                "files_total", {"kind": "csv", "name": "file-0"}
+            ),
+            2,
+        )
+        self.assertEqual(
+            self.registry.get_sample_value(
+                "files_total", {"kind": "other", "name": "other"}
+            ),
+            7,
+        )
+
+        warnings = [log for log in cap_logs if log["log_level"] == "warning"]
+        self.assertEqual(len(warnings), 1)
+        self.assertEqual(warnings[0]["metric"], "files")
+        self.assertEqual(warnings[0]["label"], "name")
+        self.assertEqual(warnings[0]["value"], "file-3")
+
+    def test_cardinality_metrics(self: Self):
+        gauge = Gauge("queue", "queue depth", ["queue"], registry=self.registry)
+        for i in range(5):
+            gauge.labels(str(i)).set(i)
+
+        self.assertEqual(
+            self.registry.get_sample_value(
+                "test_metric_label_sets", {"metric": "queue"}
+            ),
+            3,
+        )
+        self.assertEqual(
+            self.registry.get_sample_value(
+                "test_metric_label_overflow_total", {"metric": "queue"}
+            ),
+            2,
+        )
+
+    def test_label_errors(self: Self):
+        histogram = Histogram("took", "time taken", ["step"], registry=self.registry)
+        for i in range(3):
+            histogram.labels(str(i)).observe(1)
+
+        with self.assertRaises(ValueError):
+            histogram.labels("a", "b")
+        with self.assertRaises(ValueError):
+            histogram.labels(stage="x")
+
+    def test_disabled(self: Self):
+        registry = GuardedCollectorRegistry(max_label_sets=0)
+        counter = Counter("hits", "hits", ["path"], registry=registry)
+        for i in range(10):
+            counter.labels(str(i)).inc()
+        self.assertEqual(len(counter._metrics), 10)
@@ -1,9 +1,23 @@
+import io
+import os
+import pathlib
+import threading
+import time
+from tempfile import TemporaryDirectory
 from typing import Self
-from unittest import TestCase
+from unittest import TestCase, mock
 
 import requests_mock
+from prometheus_client import CollectorRegistry
 
-from rv_script_lib.healthchecks import HealthCheckPinger
+from rv_script_lib.healthchecks import (
+    HEALTHCHECK_DEFAULT_HOSTNAME,
+    BodyReader,
+    HealthCheckPinger,
+    parse_targets,
+    read_body,
+)
+from rv_script_lib.isolation import run_isolated
 
 
 class TestHealthCheckPinger(TestCase):
@@ -130,3 +144,162 @@ class TestHealthCheckNone(TestCase):
 
         self.healthcheck.fail()
         self.assertFalse(rmock.called)
+
+
+class TestHealthCheckTargets(TestCase):
+    UUID_A = "5bf66975-d4c7-4bf5-bcc8-b8d8a82ea278"
+    UUID_B = "0e1f2a3b-d4c7-4bf5-bcc8-b8d8a82ea278"
+
+    def test_parse_targets(self: Self):
+        self.assertEqual(
+            parse_targets(f"{self.UUID_A}, {self.UUID_B}@mirror.local", "a.io,b.io"),
+            [
+                (self.UUID_A, "a.io"),
+                (self.UUID_A, "b.io"),
+                (self.UUID_B, "mirror.local"),
+            ],
+        )
+        self.assertEqual(parse_targets("", "a.io"), [])
+        self.assertEqual(
+            parse_targets([self.UUID_A], None),
+            [(self.UUID_A, HEALTHCHECK_DEFAULT_HOSTNAME)],
+        )
+
+    @requests_mock.Mocker()
+    def test_fan_out(self: Self, rmock: requests_mock.mocker.Mocker):
+        registry = CollectorRegistry()
+        healthcheck = HealthCheckPinger(
+            uuid=f"{self.UUID_A},{self.UUID_B}@mirror.local",
+            healtheck_host="hc-ping.com",
+            registry=registry,
+            prefix="test",
+        )
+        rmock.post(f"https://hc-ping.com/{self.UUID_A}/start", text="OK")
+        rmock.post(f"https://mirror.local/{self.UUID_B}/start", status_code=500)
+
+        self.assertTrue(healthcheck.start())
+        self.assertTrue(healthcheck.flush())
+        self.assertEqual(rmock.call_count, 2)
+
+        def pings(target: str, result: str) -> float:
+            return registry.get_sample_value(
+                "test_healthcheck_pings_total",
+                {"target": target, "endpoint": "start", "result": result},
+            )
+
+        self.assertEqual(pings(f"hc-ping.com/{self.UUID_A[:8]}", "success"), 1)
+        self.assertEqual(pings(f"mirror.local/{self.UUID_B[:8]}", "failure"), 1)
+
+    def test_slow_mirror(self: Self):
+        release = threading.Event()
+        calls = []
+
+        def post(url, **kwargs):
+            calls.append(url)
+            if "mirror" in url:
+                release.wait(5)
+            return mock.Mock(text="OK")
+
+        session = mock.Mock(post=post)
+        healthcheck = HealthCheckPinger(
+            uuid=self.UUID_A, healtheck_host="hc-ping.com,mirror.local", session=session
+        )
+
+        started = time.monotonic()
+        self.assertTrue(healthcheck.success())
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertFalse(healthcheck.flush(timeout=0.1))
+
+        release.set()
+        self.assertTrue(healthcheck.flush())
+        self.assertEqual(len(calls), 2)
+
+    def test_fan_out_in_forked_child(self: Self):
+        calls = []
+
+        def post(url, **kwargs):
+            calls.append(url)
+            return mock.Mock(text="OK")
+
+        healthcheck = HealthCheckPinger(
+            uuid=f"{self.UUID_A},{self.UUID_B}",
+            healtheck_host="hc-ping.com",
+            session=mock.Mock(post=post),
+        )
+        # the parent's executor threads exist before the fork
+        self.assertTrue(healthcheck.start())
+        self.assertTrue(healthcheck.flush())
+
+        def child() -> int:
+            healthcheck.log("from the child")
+            healthcheck.flush()
+            return len(calls)
+
+        started = time.monotonic()
+        self.assertEqual(run_isolated(child), 4)
+        self.assertLess(time.monotonic() - started, 5)
+
+
+class TestPingBodies(TestCase):
+    TEST_UUID = "5bf66975-d4c7-4bf5-bcc8-b8d8a82ea278"
+    CONTENT = b"0123456789" * 100 + b"END"
+
+    def setUp(self: Self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = pathlib.Path(self.temp_dir.name, "output.log")
+        self.path.write_bytes(self.CONTENT)
+
+    def test_in_memory(self: Self):
+        self.assertIsNone(read_body(None))
+        self.assertEqual(bytes(read_body("héllo", limit=3, part="head")), b"h\xc3\xa9")
+        self.assertEqual(bytes(read_body(self.CONTENT, limit=3)), b"END")
+        self.assertEqual(bytes(read_body(io.StringIO("abcdef"), limit=2)), b"ef")
+
+    def test_files(self: Self):
+        self.assertEqual(bytes(read_body(self.path, limit=5)), b"89END")
+        self.assertEqual(bytes(read_body(self.path, limit=4, part="head")), b"0123")
+        with open(self.path, "rb") as f:
+            self.assertEqual(bytes(read_body(f, limit=5)), b"89END")
+        with open(self.path, "r") as f:
+            self.assertEqual(bytes(read_body(f, limit=5)), b"89END")
+        self.assertEqual(bytes(read_body(io.BytesIO(self.CONTENT), limit=5)), b"89END")
+
+    def test_pipe(self: Self):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(write_fd, "wb") as f:
+            f.write(self.CONTENT)
+        with os.fdopen(read_fd, "rb") as f:
+            self.assertEqual(bytes(read_body(f, limit=5)), b"89END")
+
+    def test_iterator(self: Self):
+        chunks = iter([b"abc", "def", b"ghi", b"jkl"])
+        self.assertEqual(bytes(read_body(chunks, limit=4, part="head")), b"abcd")
+        # the head is read without draining the source
+        self.assertEqual(next(chunks), b"ghi")
+
+        chunks = (bytes([byte]) * 10 for byte in range(100))
+        self.assertEqual(
+            bytes(read_body(chunks, limit=12)), bytes([98] * 2 + [99] * 10)
+        )
+
+    def test_body_reader(self: Self):
+        reader = BodyReader(memoryview(b"abcdef"))
+        self.assertEqual(len(reader), 6)
+        self.assertEqual(bytes(reader.read(4)), b"abcd")
+        self.assertEqual(bytes(reader.read()), b"ef")
+        self.assertEqual(len(reader.read(4)), 0)
+        reader.seek(1)
+        self.assertEqual(bytes(reader.read(2)), b"bc")
+
+    @requests_mock.Mocker()
+    def test_log_file(self: Self, rmock: requests_mock.mocker.Mocker):
+        rmock.post(f"https://hc-ping.com/{self.TEST_UUID}/log", text="OK")
+        rmock.post(f"https://hc-ping.com/{self.TEST_UUID}/1", text="OK")
+        healthcheck = HealthCheckPinger(uuid=self.TEST_UUID, body_limit=5)
+
+        self.assertTrue(healthcheck.log(self.path))
+        self.assertEqual(bytes(rmock.last_request.body.read()), b"89END")
+
+        self.assertTrue(healthcheck.exit_status(1, data="short"))
+        self.assertEqual(bytes(rmock.last_request.body.read()), b"short")
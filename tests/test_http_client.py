@@ -0,0 +1,80 @@
+from typing import Self
+from unittest import TestCase
+
+import requests
+import requests_mock
+from prometheus_client import CollectorRegistry
+
+from rv_script_lib.healthchecks import HealthCheckPinger
+from rv_script_lib.http_client import InstrumentedSession
+
+
+class TestInstrumentedSession(TestCase):
+    def setUp(self: Self):
+        self.registry = CollectorRegistry()
+        self.session = InstrumentedSession(
+            timeout=7,
+            host_pool_sizes={"api.example.com": 32},
+            registry=self.registry,
+            prefix="test",
+        )
+
+    def latency_count(self: Self, host: str, method: str, status: str) -> float:
+        return self.registry.get_sample_value(
+            "test_http_request_duration_seconds_count",
+            {"host": host, "method": method, "status": status},
+        )
+
+    @requests_mock.Mocker()
+    def test_default_timeout(self: Self, rmock: requests_mock.mocker.Mocker):
+        rmock.get("https://api.example.com/thing", text="ok")
+
+        self.session.get("https://api.example.com/thing")
+        self.assertEqual(rmock.last_request.timeout, 7)
+
+        self.session.get("https://api.example.com/thing", timeout=1)
+        self.assertEqual(rmock.last_request.timeout, 1)
+
+    @requests_mock.Mocker()
+    def test_latency_metrics(self: Self, rmock: requests_mock.mocker.Mocker):
+        rmock.get("https://api.example.com/thing", text="ok")
+        rmock.post("https://other.example.com/missing", status_code=404)
+        rmock.get("https://down.example.com/", exc=requests.ConnectionError)
+
+        self.session.get("https://api.example.com/thing")
+        self.session.get("https://api.example.com/thing")
+        self.session.post("https://other.example.com/missing")
+        with self.assertRaises(requests.ConnectionError):
+            self.session.get("https://down.example.com/")
+
+        self.assertEqual(self.latency_count("api.example.com", "GET", "200"), 2)
+        self.assertEqual(self.latency_count("other.example.com", "POST", "404"), 1)
+        self.assertEqual(self.latency_count("down.example.com", "GET", "error"), 1)
+
+    def test_pool_sizes(self: Self):
+        host_adapter = self.session.get_adapter("https://api.example.com/thing")
+        default_adapter = self.session.get_adapter("https://elsewhere.example.com/")
+
+        self.assertEqual(host_adapter._pool_maxsize, 32)
+        self.assertEqual(default_adapter._pool_maxsize, 10)
+        self.assertEqual(host_adapter.max_retries.total, 3)
+
+    def test_reset_pools(self: Self):
+        host_adapter = self.session.get_adapter("https://api.example.com/thing")
+        self.session.reset_pools()
+
+        fresh_adapter = self.session.get_adapter("https://api.example.com/thing")
+        self.assertIsNot(fresh_adapter, host_adapter)
+        self.assertEqual(fresh_adapter._pool_maxsize, 32)
+        self.assertEqual(
+            self.session.get_adapter("https://elsewhere.example.com/")._pool_maxsize,
+            10,
+        )
+
+    @requests_mock.Mocker()
+    def test_shared_with_healthcheck(self: Self, rmock: requests_mock.mocker.Mocker):
+        rmock.post("https://hc-ping.com/some-uuid", text="OK")
+
+        HealthCheckPinger(uuid="some-uuid", session=self.session).success()
+
+        self.assertEqual(self.latency_count("hc-ping.com", "POST", "200"), 1)
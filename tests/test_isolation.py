@@ -0,0 +1,49 @@
+import os
+import resource
+import signal
+from typing import Self
+from unittest import TestCase
+
+from rv_script_lib.isolation import IsolatedJobFailed, build_rlimits, run_isolated
+
+
+class TestRunIsolated(TestCase):
+    def test_result(self: Self):
+        parent = os.getpid()
+        self.assertNotEqual(run_isolated(os.getpid), parent)
+        self.assertEqual(run_isolated(lambda: {"rows": [1, 2]}), {"rows": [1, 2]})
+
+    def test_leaks_stay_in_child(self: Self):
+        leaked = []
+
+        def leak():
+            leaked.append(os.open(os.devnull, os.O_RDONLY))
+            return len(leaked)
+
+        self.assertEqual(run_isolated(leak), 1)
+        self.assertEqual(leaked, [])
+
+    def test_failure(self: Self):
+        def fail():
+            raise RuntimeError("boom")
+
+        with self.assertRaises(IsolatedJobFailed) as context:
+            run_isolated(fail)
+        self.assertEqual(context.exception.exit_code, 1)
+
+    def test_rlimits(self: Self):
+        limits = build_rlimits(cpu_seconds=1, address_space=256 * 1024**2)
+        self.assertEqual(limits[resource.RLIMIT_CPU][0], 1)
+
+        def read_limits():
+            return resource.getrlimit(resource.RLIMIT_AS)[0]
+
+        self.assertEqual(run_isolated(read_limits, rlimits=limits), 256 * 1024**2)
+
+        def spin():
+            while True:
+                pass
+
+        with self.assertRaises(IsolatedJobFailed) as context:
+            run_isolated(spin, rlimits=build_rlimits(cpu_seconds=1))
+        self.assertEqual(context.exception.exit_code, -signal.SIGXCPU)
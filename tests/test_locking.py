@@ -0,0 +1,104 @@
+import fcntl
+import os
+import socket
+import threading
+from tempfile import TemporaryDirectory
+from typing import Self
+from unittest import TestCase, mock
+
+from prometheus_client import CollectorRegistry
+from structlog.testing import capture_logs
+
+from rv_script_lib.locking import InstanceLock, read_lock_owner, splay_seconds
+
+
+class TestSplay(TestCase):
+    def test_deterministic(self: Self):
+        first = splay_seconds(60, "job", hostname="host-a")
+        self.assertEqual(first, splay_seconds(60, "job", hostname="host-a"))
+        self.assertNotEqual(first, splay_seconds(60, "job", hostname="host-b"))
+        self.assertGreaterEqual(first, 0)
+        self.assertLess(first, 60)
+
+    def test_disabled(self: Self):
+        self.assertEqual(splay_seconds(0, "job"), 0)
+
+
+class TestInstanceLock(TestCase):
+    def setUp(self: Self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, "job.lock")
+        self.registry = CollectorRegistry()
+
+    def make_lock(self: Self, policy: str = "skip", prefix: str = "test"):
+        return InstanceLock(
+            self.path, policy=policy, registry=self.registry, prefix=prefix
+        )
+
+    def sample(self: Self, name: str) -> float:
+        return self.registry.get_sample_value(name) or 0
+
+    def test_skip(self: Self):
+        first = self.make_lock()
+        second = self.make_lock(prefix="other")
+
+        self.assertTrue(first.acquire())
+        self.assertEqual(read_lock_owner(self.path)[0], os.getpid())
+        self.assertFalse(second.acquire())
+        self.assertEqual(self.sample("other_lock_contention_total"), 1)
+        self.assertEqual(self.sample("other_skipped_runs_total"), 1)
+
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+
+    def test_wait(self: Self):
+        first = self.make_lock()
+        second = self.make_lock(policy="wait", prefix="other")
+        self.assertTrue(first.acquire())
+
+        threading.Timer(0.2, first.release).start()
+        self.assertTrue(second.acquire())
+        self.assertEqual(self.sample("other_lock_contention_total"), 1)
+        self.assertEqual(self.sample("other_skipped_runs_total"), 0)
+        second.release()
+
+    def test_wait_stopped(self: Self):
+        first = self.make_lock()
+        second = self.make_lock(policy="wait", prefix="other")
+        self.assertTrue(first.acquire())
+
+        stop = threading.Event()
+        threading.Timer(0.2, stop.set).start()
+        self.assertFalse(second.acquire(stop=stop))
+        self.assertEqual(self.sample("other_skipped_runs_total"), 1)
+        first.release()
+
+    def test_stale(self: Self):
+        with open(self.path, "w") as f:
+            f.write(f"999999 {socket.gethostname()}\n")
+
+        # a record left by a dead process does not block anyone
+        first = self.make_lock()
+        with mock.patch("rv_script_lib.locking.pid_is_alive", return_value=False):
+            self.assertTrue(first.acquire())
+        self.assertEqual(read_lock_owner(self.path)[0], os.getpid())
+        first.release()
+
+    def test_stale_record_still_locked(self: Self):
+        # an inherited descriptor keeps the lock after the recorded pid is gone
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.addCleanup(os.close, fd)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        lock = self.make_lock()
+        os.write(fd, f"999999 {lock.hostname}\n".encode())
+
+        with mock.patch("rv_script_lib.locking.pid_is_alive", return_value=False):
+            with capture_logs() as cap_logs:
+                self.assertFalse(lock.acquire())
+
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(read_lock_owner(self.path)[0], 999999)
+        self.assertEqual(cap_logs[0]["log_level"], "warning")
+        self.assertEqual(self.sample("test_skipped_runs_total"), 1)
@@ -0,0 +1,171 @@
+import os
+import re
+import socket
+import time
+from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
+from typing import Self
+from unittest import TestCase, mock
+
+import structlog
+from prometheus_client import CollectorRegistry
+
+from rv_script_lib.log_shipping import (
+    LogShipper,
+    format_rfc5424,
+    parse_log_target,
+)
+from rv_script_lib.logging import get_custom_logger, get_log_shipper
+
+RFC5424 = re.compile(r"^<(\d+)>1 \S+ \S+ (\S+) (\d+) - - (.*)$")
+
+
+def read_octet_counted(data: bytes) -> list[bytes]:
+    messages = []
+    while data:
+        length, _, rest = data.partition(b" ")
+        messages.append(rest[: int(length)])
+        data = rest[int(length) :]
+    return messages
+
+
+class TestFormatting(TestCase):
+    def test_rfc5424(self: Self):
+        line = format_rfc5424(
+            "hello world",
+            severity=3,
+            app_name="job",
+            hostname="host",
+            procid=42,
+            timestamp=datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        )
+        self.assertEqual(
+            line, b"<11>1 2024-01-02T03:04:05.000000+00:00 host job 42 - - hello world"
+        )
+
+    def test_targets(self: Self):
+        self.assertEqual(
+            parse_log_target("unix:///run/x"), (socket.SOCK_STREAM, "/run/x")
+        )
+        self.assertEqual(
+            parse_log_target("unixgram:///run/x"), (socket.SOCK_DGRAM, "/run/x")
+        )
+        self.assertEqual(parse_log_target("syslog")[0], socket.SOCK_DGRAM)
+        with self.assertRaises(ValueError):
+            parse_log_target("tcp://localhost:514")
+
+
+class TestLogShipper(TestCase):
+    def setUp(self: Self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, "log.sock")
+
+    def listen(self: Self, socket_type: int) -> socket.socket:
+        listener = socket.socket(socket.AF_UNIX, socket_type)
+        listener.bind(self.path)
+        listener.settimeout(5)
+        if socket_type == socket.SOCK_STREAM:
+            listener.listen()
+        self.addCleanup(listener.close)
+        return listener
+
+    def test_datagram(self: Self):
+        listener = self.listen(socket.SOCK_DGRAM)
+        shipper = LogShipper(f"unixgram://{self.path}", app_name="job")
+        shipper.emit(6, "first")
+        shipper.emit(3, "second")
+        shipper.close()
+
+        received = [RFC5424.match(listener.recv(4096).decode()) for _ in range(2)]
+        self.assertEqual([m.group(4) for m in received], ["first", "second"])
+        self.assertEqual([m.group(1) for m in received], ["14", "11"])
+        self.assertEqual(received[0].group(2), "job")
+        self.assertEqual(int(received[0].group(3)), os.getpid())
+
+    def test_stream_reconnects(self: Self):
+        shipper = LogShipper(f"unix://{self.path}")
+        shipper.emit(6, "before the listener")
+        time.sleep(0.2)
+
+        listener = self.listen(socket.SOCK_STREAM)
+        shipper.emit(6, "after")
+        conn, _ = listener.accept()
+        self.addCleanup(conn.close)
+        shipper.close()
+
+        data = b""
+        while chunk := conn.recv(4096):
+            data += chunk
+        messages = [m.decode() for m in read_octet_counted(data)]
+        self.assertEqual(
+            [RFC5424.match(m).group(4) for m in messages],
+            ["before the listener", "after"],
+        )
+        self.assertEqual(shipper.dropped, 0)
+
+    def test_overflow_drops(self: Self):
+        shipper = LogShipper(f"unixgram://{self.path}", queue_size=2)
+        registry = CollectorRegistry()
+        with mock.patch.object(shipper, "_send", side_effect=OSError):
+            for i in range(10):
+                shipper.emit(6, str(i))
+            shipper.bind_metrics(registry=registry, prefix="test")
+            shipper.emit(6, "one more")
+            shipper.close(timeout=1)
+
+        self.assertGreaterEqual(shipper.dropped, 7)
+        self.assertEqual(
+            registry.get_sample_value("test_log_shipping_dropped_total"),
+            shipper.dropped,
+        )
+
+
+class TestLoggerFactory(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.addCleanup(structlog.reset_defaults)
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, "log.sock")
+
+    def test_structlog_to_socket(self: Self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        listener.bind(self.path)
+        listener.settimeout(5)
+        self.addCleanup(listener.close)
+
+        logger = get_custom_logger(
+            log_format="logfmt", log_target=f"unixgram://{self.path}"
+        )
+        logger.warning("shipped", answer=42)
+        logger.debug("filtered")
+        get_log_shipper().close()
+        self.addCleanup(get_custom_logger, force_configure=True)
+
+        match = RFC5424.match(listener.recv(4096).decode())
+        self.assertEqual(match.group(1), "12")
+        self.assertIn("event=shipped", match.group(4))
+        self.assertIn("answer=42", match.group(4))
+        listener.setblocking(False)
+        with self.assertRaises(BlockingIOError):
+            listener.recv(4096)
+
+    def test_dev_format_shipped_plain(self: Self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        listener.bind(self.path)
+        listener.settimeout(5)
+        self.addCleanup(listener.close)
+
+        logger = get_custom_logger(
+            log_format="dev", log_target=f"unixgram://{self.path}"
+        )
+        logger.warning("shipped", answer=42)
+        get_log_shipper().close()
+        self.addCleanup(get_custom_logger, force_configure=True)
+
+        # no ANSI colors, and the time only in the syslog header
+        message = RFC5424.match(listener.recv(4096).decode()).group(4)
+        self.assertNotIn("\x1b[", message)
+        self.assertTrue(message.startswith("[warning"), message)
+        self.assertIn("answer=42", message)
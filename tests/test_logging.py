@@ -1,10 +1,23 @@
 import logging
+import os
+import signal
 from typing import Self
-from unittest import TestCase
+from unittest import TestCase, mock
+
+import structlog
+from structlog.testing import capture_logs
 
 from rv_script_lib.logging import (
+    ExceptionDeduplicator,
+    LogLevelSignals,
+    get_custom_logger,
+    get_log_level,
     get_loglevel_from_arg,
+    log_level_command,
+    set_log_level,
+    step_log_level,
 )
+from rv_script_lib.signals import deferred_calls
 
 
 class TestGetLoglevelFromArg(TestCase):
@@ -31,3 +44,126 @@ class TestGetLoglevelFromArg(TestCase):
         self.assertEqual(get_loglevel_from_arg(5), logging.DEBUG)
         self.assertEqual(get_loglevel_from_arg(150), logging.DEBUG)
         self.assertEqual(get_loglevel_from_arg(151), logging.DEBUG)
+
+
+class TestRuntimeLogLevel(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.log = get_custom_logger(loglevel_argument=logging.INFO)
+
+    def test_existing_logger_follows_level(self: Self):
+        with capture_logs() as cap_logs:
+            self.log.debug("hidden")
+            set_log_level(logging.DEBUG)
+            self.log.debug("shown")
+            set_log_level(logging.ERROR)
+            self.log.warning("hidden")
+
+        self.assertEqual([x["event"] for x in cap_logs], ["shown"])
+        self.assertEqual(get_log_level(), logging.ERROR)
+
+    def test_step(self: Self):
+        self.assertEqual(step_log_level(-1), logging.DEBUG)
+        self.assertEqual(step_log_level(-1), logging.DEBUG)
+        self.assertEqual(step_log_level(2), logging.WARNING)
+        self.assertEqual(step_log_level(10), logging.CRITICAL)
+
+    def test_signals(self: Self):
+        handler = LogLevelSignals()
+        handler.install()
+        self.addCleanup(handler.restore)
+
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.assertTrue(deferred_calls.flush())
+        self.assertEqual(get_log_level(), logging.DEBUG)
+
+        os.kill(os.getpid(), signal.SIGUSR2)
+        os.kill(os.getpid(), signal.SIGUSR2)
+        self.assertTrue(deferred_calls.flush())
+        self.assertEqual(get_log_level(), logging.WARNING)
+
+    def test_command(self: Self):
+        self.assertEqual(log_level_command([]), "INFO")
+        self.assertEqual(log_level_command(["debug"]), "DEBUG")
+        self.assertEqual(log_level_command(["quiet"]), "INFO")
+        self.assertEqual(log_level_command(["40"]), "ERROR")
+
+        with self.assertRaises(ValueError):
+            log_level_command(["loud"])
+
+
+def fail(message: str, depth: int = 0):
+    if depth:
+        fail(message, depth - 1)
+    raise ValueError(message)
+
+
+class TestExceptionDeduplicator(TestCase):
+    def process(self: Self, processor: ExceptionDeduplicator, message: str, **kw):
+        try:
+            fail(message, **kw)
+        except ValueError:
+            return processor(None, "exception", {"event": "failed", "exc_info": True})
+
+    def test_first_occurrence_rendered(self: Self):
+        processor = ExceptionDeduplicator()
+        first = self.process(processor, "item 1")
+        second = self.process(processor, "item 2")
+
+        self.assertNotIn("exc_info", first)
+        self.assertIn("Traceback", first["exception"])
+        self.assertIn("ValueError: item 1", first["exception"])
+        self.assertNotIn("exc_count", first)
+
+        # the message differs, the frames do not
+        self.assertEqual(second["exc_ref"], first["exc_ref"])
+        self.assertEqual(second["exception"], "ValueError: item 2")
+        self.assertEqual(second["exc_count"], 2)
+
+    def test_different_frames(self: Self):
+        processor = ExceptionDeduplicator()
+        first = self.process(processor, "x")
+        deeper = self.process(processor, "x", depth=2)
+        self.assertNotEqual(first["exc_ref"], deeper["exc_ref"])
+        self.assertIn("Traceback", deeper["exception"])
+
+    def test_window(self: Self):
+        processor = ExceptionDeduplicator(window_seconds=60)
+        with mock.patch("rv_script_lib.logging.monotonic", return_value=1000):
+            self.process(processor, "x")
+            self.assertEqual(self.process(processor, "x")["exc_count"], 2)
+        with mock.patch("rv_script_lib.logging.monotonic", return_value=1061):
+            again = self.process(processor, "x")
+        self.assertIn("Traceback", again["exception"])
+
+        processor = ExceptionDeduplicator(window_seconds=0)
+        self.process(processor, "x")
+        self.assertIn("Traceback", self.process(processor, "x")["exception"])
+
+    def test_depth_and_size(self: Self):
+        processor = ExceptionDeduplicator(max_frames=2, max_chars=10_000)
+        event = self.process(processor, "deep", depth=10)
+        self.assertEqual(event["exception"].count("in fail"), 2)
+
+        processor = ExceptionDeduplicator(max_chars=40)
+        event = self.process(processor, "deep", depth=10)
+        self.assertTrue(event["exception"].startswith("[truncated]"))
+        self.assertTrue(event["exception"].endswith("ValueError: deep"))
+        self.assertLessEqual(len(event["exception"]), 40 + len("[truncated]\n"))
+
+    def test_no_exception(self: Self):
+        processor = ExceptionDeduplicator()
+        self.assertEqual(processor(None, "info", {"event": "ok"}), {"event": "ok"})
+        self.assertEqual(
+            processor(None, "error", {"event": "ok", "exc_info": False}),
+            {"event": "ok"},
+        )
+
+    def test_exception_instance(self: Self):
+        processor = ExceptionDeduplicator()
+        try:
+            fail("given")
+        except ValueError as e:
+            error = e
+        event = processor(None, "error", {"event": "x", "exc_info": error})
+        self.assertIn("ValueError: given", event["exception"])
@@ -0,0 +1,134 @@
+import glob
+import os
+from tempfile import TemporaryDirectory
+from typing import Self
+from unittest import TestCase
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, values
+
+from rv_script_lib.multiprocess import MultiProcessMetrics, parse_db_filename
+
+
+def run_in_child(func):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            func()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+
+class TestMultiProcessMetrics(TestCase):
+    def setUp(self: Self):
+        self.original_value_class = values.ValueClass
+        self.multiprocess = MultiProcessMetrics()
+        self.multiprocess.enable()
+        self.addCleanup(self.multiprocess.disable)
+        self.registry = CollectorRegistry()
+
+    def test_disable_restores(self: Self):
+        path = self.multiprocess.path
+        self.multiprocess.disable()
+
+        self.assertIs(values.ValueClass, self.original_value_class)
+        self.assertNotIn("PROMETHEUS_MULTIPROC_DIR", os.environ)
+        self.assertFalse(os.path.isdir(path))
+
+    def test_counts_from_children(self: Self):
+        counter = Counter("test_things", "things", ["kind"], registry=self.registry)
+        histogram = Histogram("test_seconds", "seconds", registry=self.registry)
+        counter.labels("parent").inc()
+
+        for _ in range(3):
+            run_in_child(lambda: counter.labels("child").inc(2))
+        run_in_child(lambda: histogram.observe(0.2))
+
+        export = self.multiprocess.export_registry()
+
+        self.assertEqual(
+            export.get_sample_value("test_things_total", {"kind": "parent"}), 1
+        )
+        self.assertEqual(
+            export.get_sample_value("test_things_total", {"kind": "child"}), 6
+        )
+        self.assertEqual(export.get_sample_value("test_seconds_count"), 1)
+
+        # the child files were folded into archives
+        files = [
+            parse_db_filename(path)
+            for path in glob.glob(os.path.join(self.multiprocess.path, "*.db"))
+        ]
+        self.assertIn(("counter", "", "archive"), files)
+        self.assertIn(("histogram", "", "archive"), files)
+        self.assertEqual({pid for _, _, pid in files}, {"archive", str(os.getpid())})
+
+        # compacting again keeps the totals
+        run_in_child(lambda: counter.labels("child").inc(4))
+        export = self.multiprocess.export_registry()
+        self.assertEqual(
+            export.get_sample_value("test_things_total", {"kind": "child"}), 10
+        )
+
+    def test_live_gauges_of_dead_workers(self: Self):
+        gauge = Gauge(
+            "test_busy", "busy", registry=self.registry, multiprocess_mode="livesum"
+        )
+        gauge.set(1)
+        run_in_child(lambda: gauge.set(5))
+
+        export = self.multiprocess.export_registry()
+
+        self.assertEqual(export.get_sample_value("test_busy"), 1)
+
+    def test_gauges_of_dead_workers_folded(self: Self):
+        peak = Gauge(
+            "test_peak", "peak", registry=self.registry, multiprocess_mode="max"
+        )
+        latest = Gauge(
+            "test_latest",
+            "latest",
+            registry=self.registry,
+            multiprocess_mode="mostrecent",
+        )
+        per_pid = Gauge(
+            "test_per_pid", "per pid", registry=self.registry, multiprocess_mode="all"
+        )
+
+        def child(value: float):
+            peak.set(value)
+            latest.set(value)
+            per_pid.set(value)
+
+        for value in (3, 7, 5):
+            run_in_child(lambda: child(value))
+        export = self.multiprocess.export_registry()
+        run_in_child(lambda: child(2))
+        export = self.multiprocess.export_registry()
+
+        self.assertEqual(export.get_sample_value("test_peak"), 7)
+        self.assertEqual(export.get_sample_value("test_latest"), 2)
+        per_pid_samples = [m for m in export.collect() if m.name == "test_per_pid"]
+        self.assertEqual(
+            [sample.labels for sample in per_pid_samples[0].samples],
+            [{"pid": str(os.getpid())}],
+        )
+
+        # one archive per gauge mode, no files of dead workers left
+        files = {
+            parse_db_filename(path)
+            for path in glob.glob(os.path.join(self.multiprocess.path, "*.db"))
+        }
+        self.assertEqual(
+            {file for file in files if file[2] != str(os.getpid())},
+            {("gauge", "max", "archive"), ("gauge", "mostrecent", "archive")},
+        )
+
+    def test_stale_files_removed(self: Self):
+        with TemporaryDirectory() as temp_dir:
+            for name in ("counter_999999999.db", "counter_archive.db"):
+                open(os.path.join(temp_dir, name), "w").close()
+
+            MultiProcessMetrics(path=temp_dir).remove_stale_files()
+
+            self.assertEqual(os.listdir(temp_dir), [])
@@ -0,0 +1,153 @@
+import os
+import signal
+import time
+from typing import Iterator, Self
+from unittest import TestCase, mock
+
+from prometheus_client import CollectorRegistry
+
+from rv_script_lib.pipeline import Pipeline, PipelineMetrics, PipelineWorkerDied
+
+
+def double(items: Iterator[int]) -> Iterator[int]:
+    for item in items:
+        yield item * 2
+
+
+def only_even(items: Iterator[int]) -> Iterator[int]:
+    for item in items:
+        if item % 2 == 0:
+            yield item
+
+
+def explode_on_seven(items: Iterator[int]) -> Iterator[int]:
+    for item in items:
+        if item == 7:
+            raise ValueError("seven")
+        yield item
+
+
+def killed_on_seven(items: Iterator[int]) -> Iterator[int]:
+    for item in items:
+        if item == 7:
+            os.kill(os.getpid(), signal.SIGKILL)
+        yield item
+
+
+def large_items(items: Iterator[int]) -> Iterator[bytes]:
+    for item in items:
+        yield bytes(200_000)
+
+
+def explode_on_second(items: Iterator[bytes]) -> Iterator[bytes]:
+    for number, item in enumerate(items):
+        if number == 1:
+            raise ValueError("second")
+        yield item
+
+
+class TestPipeline(TestCase):
+    def setUp(self: Self):
+        self.registry = CollectorRegistry()
+        self.metrics = PipelineMetrics(registry=self.registry, prefix="test")
+
+    def items_emitted(self: Self, pipeline: str, stage: str) -> float:
+        return self.registry.get_sample_value(
+            "test_pipeline_items_total", {"pipeline": pipeline, "stage": stage}
+        )
+
+    def test_no_stages(self: Self):
+        self.assertEqual(list(Pipeline("empty").run(range(3))), [0, 1, 2])
+
+    def test_threads(self: Self):
+        pipe = Pipeline("threads", batch_size=4, metrics=self.metrics)
+        pipe.stage(only_even, workers=3, batch_size=5).stage(double, workers=2)
+
+        results = list(pipe.run(range(100)))
+
+        self.assertEqual(sorted(results), [x * 2 for x in range(0, 100, 2)])
+        self.assertEqual(self.items_emitted("threads", "only_even"), 50)
+        self.assertEqual(self.items_emitted("threads", "double"), 50)
+
+    def test_processes(self: Self):
+        pipe = Pipeline("procs", metrics=self.metrics)
+        pipe.stage(double, workers=2, mode="process", batch_size=10)
+        pipe.stage(only_even)
+
+        self.assertEqual(pipe.drain(range(200)), 200)
+        self.assertEqual(self.items_emitted("procs", "double"), 200)
+        self.assertEqual(self.items_emitted("procs", "only_even"), 200)
+
+    def test_backpressure(self: Self):
+        produced = []
+
+        def source():
+            for i in range(1000):
+                produced.append(i)
+                yield i
+
+        def slow(items):
+            for item in items:
+                time.sleep(0.001)
+                yield item
+
+        pipe = Pipeline("bounded", queue_size=2)
+        pipe.stage(slow, queue_size=2)
+        results = pipe.run(source())
+
+        next(results)
+        time.sleep(0.1)
+        # source can only run a few batches ahead of the consumer
+        self.assertLess(len(produced), 20)
+        results.close()
+
+    def test_thread_error(self: Self):
+        pipe = Pipeline("broken").stage(explode_on_seven, workers=2).stage(double)
+
+        with self.assertRaises(ValueError):
+            list(pipe.run(range(100)))
+
+    def test_process_error(self: Self):
+        pipe = Pipeline("broken").stage(explode_on_seven, mode="process")
+
+        with self.assertRaises(ValueError):
+            pipe.drain(range(100))
+
+    def test_process_killed(self: Self):
+        pipe = Pipeline("killed").stage(killed_on_seven, workers=2, mode="process")
+
+        # the sibling may be stuck on a queue lock the killed worker held
+        with mock.patch("rv_script_lib.pipeline.WORKER_STOP_SECONDS", 0.5):
+            with self.assertRaises(PipelineWorkerDied):
+                pipe.drain(range(100))
+
+    def test_process_stage_downstream_error(self: Self):
+        # the worker's queue still holds batches nobody will read
+        pipe = Pipeline("blocked").stage(large_items, mode="process")
+        pipe.stage(explode_on_second)
+
+        started = time.monotonic()
+        with self.assertRaises(ValueError):
+            pipe.drain(range(100))
+        self.assertLess(time.monotonic() - started, 10)
+
+    def test_process_stage_early_break(self: Self):
+        pipe = Pipeline("early").stage(large_items, mode="process")
+
+        started = time.monotonic()
+        for number, _ in enumerate(pipe.run(range(100))):
+            if number == 2:
+                break
+        self.assertLess(time.monotonic() - started, 10)
+
+    def test_source_error(self: Self):
+        def source():
+            yield 1
+            raise KeyError("source")
+
+        with self.assertRaises(KeyError):
+            Pipeline("broken").stage(double).drain(source())
+
+    def test_bad_mode(self: Self):
+        with self.assertRaises(ValueError):
+            Pipeline("bad").stage(double, mode="fiber")
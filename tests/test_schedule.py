@@ -0,0 +1,170 @@
+import datetime
+import time
+from typing import Self
+from unittest import TestCase
+from zoneinfo import ZoneInfo
+
+from rv_script_lib.schedule import (
+    CronSchedule,
+    calendar_to_cron,
+    parse_cron_field,
+    parse_schedule,
+)
+
+UTC = datetime.timezone.utc
+NEW_YORK = ZoneInfo("America/New_York")
+
+
+class TestParsing(TestCase):
+    def test_fields(self: Self):
+        self.assertEqual(parse_cron_field("*/15", 0, 59), {0, 15, 30, 45})
+        self.assertEqual(parse_cron_field("1-5", 0, 7), {1, 2, 3, 4, 5})
+        self.assertEqual(parse_cron_field("10/20", 0, 59), {10, 30, 50})
+        self.assertEqual(
+            parse_cron_field("mon-wed,sat", 0, 7, {"mon": 1, "wed": 3, "sat": 6}),
+            {1, 2, 3, 6},
+        )
+        for field in ("60", "5-1", "*/0", "x"):
+            with self.assertRaises(ValueError):
+                parse_cron_field(field, 0, 59)
+
+    def test_calendar(self: Self):
+        self.assertEqual(calendar_to_cron("weekdays 02:00"), "0 2 * * 1-5")
+        self.assertEqual(calendar_to_cron("mon,wed 08:30,17:30"), "30 8,17 * * mon,wed")
+        with self.assertRaises(ValueError):
+            calendar_to_cron("daily 08:00,17:30")
+
+    def test_invalid(self: Self):
+        for expression in ("* * *", "@fortnightly", "0 0 30 2 *"):
+            with self.assertRaises(ValueError):
+                CronSchedule(expression, UTC)
+
+
+class TestNextFire(TestCase):
+    def test_quarter_hour(self: Self):
+        schedule = parse_schedule("*/15 * * * *", "UTC")
+        after = datetime.datetime(2024, 1, 1, 10, 7, tzinfo=UTC)
+        self.assertEqual(
+            schedule.next_fire(after), datetime.datetime(2024, 1, 1, 10, 15, tzinfo=UTC)
+        )
+        # strictly after
+        fire = datetime.datetime(2024, 1, 1, 10, 15, tzinfo=UTC)
+        self.assertEqual(
+            schedule.next_fire(fire), datetime.datetime(2024, 1, 1, 10, 30, tzinfo=UTC)
+        )
+
+    def test_weekdays(self: Self):
+        schedule = CronSchedule("weekdays 02:00", UTC)
+        friday = datetime.datetime(2024, 1, 5, 3, 0, tzinfo=UTC)
+        self.assertEqual(
+            schedule.next_fire(friday), datetime.datetime(2024, 1, 8, 2, 0, tzinfo=UTC)
+        )
+
+    def test_day_fields_either_match(self: Self):
+        # the 13th of the month, or any friday
+        schedule = CronSchedule("0 0 13 * 5", UTC)
+        after = datetime.datetime(2024, 1, 6, tzinfo=UTC)
+        self.assertEqual(
+            schedule.next_fire(after), datetime.datetime(2024, 1, 12, tzinfo=UTC)
+        )
+        self.assertEqual(
+            schedule.next_fire(datetime.datetime(2024, 1, 12, 1, tzinfo=UTC)),
+            datetime.datetime(2024, 1, 13, tzinfo=UTC),
+        )
+
+    def test_leap_day(self: Self):
+        schedule = CronSchedule("0 0 29 2 *", UTC)
+        after = datetime.datetime(2024, 3, 1, tzinfo=UTC)
+        self.assertEqual(
+            schedule.next_fire(after), datetime.datetime(2028, 2, 29, tzinfo=UTC)
+        )
+
+    def test_dst_gap(self: Self):
+        # 02:30 does not exist on 2024-03-10 in New York
+        schedule = CronSchedule("30 2 * * *", NEW_YORK)
+        after = datetime.datetime(2024, 3, 10, 0, 0, tzinfo=NEW_YORK)
+        fire = schedule.next_fire(after)
+        self.assertEqual(fire, datetime.datetime(2024, 3, 10, 7, 30, tzinfo=UTC))
+        local = fire.astimezone(NEW_YORK)
+        self.assertEqual((local.hour, local.minute), (3, 30))
+        self.assertEqual(
+            schedule.next_fire(fire),
+            datetime.datetime(2024, 3, 11, 2, 30, tzinfo=NEW_YORK),
+        )
+
+    def test_dst_fold(self: Self):
+        # 01:30 happens twice on 2024-11-03 in New York, fire on the first
+        schedule = CronSchedule("30 1 * * *", NEW_YORK)
+        after = datetime.datetime(2024, 11, 3, 0, 0, tzinfo=NEW_YORK)
+        fire = schedule.next_fire(after)
+        self.assertEqual(fire, datetime.datetime(2024, 11, 3, 5, 30, tzinfo=UTC))
+
+        second_occurrence = datetime.datetime(2024, 11, 3, 6, 0, tzinfo=UTC)
+        self.assertEqual(
+            schedule.next_fire(second_occurrence),
+            datetime.datetime(2024, 11, 4, 6, 30, tzinfo=UTC),
+        )
+
+    def test_dst_fold_every_hour(self: Self):
+        # a quarter-hourly schedule keeps firing through the repeated hour
+        schedule = CronSchedule("*/15 * * * *", NEW_YORK)
+        fire = datetime.datetime(2024, 11, 3, 5, 30, tzinfo=UTC)
+        fires = []
+        for _ in range(8):
+            fire = schedule.next_fire(fire)
+            fires.append(fire)
+
+        self.assertEqual(
+            fires,
+            [
+                datetime.datetime(2024, 11, 3, 5, 45, tzinfo=UTC)
+                + datetime.timedelta(minutes=15 * i)
+                for i in range(8)
+            ],
+        )
+        self.assertEqual(
+            [fire.astimezone(NEW_YORK).strftime("%H:%M %Z") for fire in fires[:3]],
+            ["01:45 EDT", "01:00 EST", "01:15 EST"],
+        )
+
+    def test_dst_gap_every_hour(self: Self):
+        # skipped times are moved forward, never fired twice
+        schedule = CronSchedule("30 * * * *", NEW_YORK)
+        fire = datetime.datetime(2024, 3, 10, 6, 0, tzinfo=UTC)
+        fires = []
+        for _ in range(3):
+            fire = schedule.next_fire(fire)
+            fires.append(fire)
+
+        self.assertEqual(
+            fires,
+            [
+                datetime.datetime(2024, 3, 10, 6, 30, tzinfo=UTC),
+                datetime.datetime(2024, 3, 10, 7, 30, tzinfo=UTC),
+                datetime.datetime(2024, 3, 10, 8, 30, tzinfo=UTC),
+            ],
+        )
+
+    def test_every_minute(self: Self):
+        # walk a whole fall back day, a minute at a time
+        schedule = CronSchedule("* * * * *", NEW_YORK)
+        start = datetime.datetime(2024, 11, 3, 4, 0, tzinfo=UTC)
+        fire = start
+        began = time.monotonic()
+        for _ in range(25 * 60):
+            fire = schedule.next_fire(fire)
+        self.assertLess(time.monotonic() - began, 2)
+        self.assertEqual(fire, start + datetime.timedelta(hours=25))
+
+    def test_cached(self: Self):
+        schedule = CronSchedule("@daily", UTC)
+        after = datetime.datetime(2024, 1, 1, 12, tzinfo=UTC)
+        fire = schedule.next_fire(after)
+        self.assertIs(schedule.next_fire(after + datetime.timedelta(hours=1)), fire)
+        self.assertEqual(
+            schedule.next_fire(fire), datetime.datetime(2024, 1, 3, tzinfo=UTC)
+        )
+
+    def test_naive(self: Self):
+        with self.assertRaises(ValueError):
+            CronSchedule("@daily", UTC).next_fire(datetime.datetime(2024, 1, 1))
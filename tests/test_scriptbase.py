@@ -1,15 +1,22 @@
 import datetime
+import json
 import os
 import pprint
+import signal
+import time
 from collections import Counter
 from tempfile import TemporaryDirectory
 from typing import Self
 from unittest import TestCase, mock
 
 import structlog
+from prometheus_client import Counter as PromCounter
 from structlog.testing import capture_logs
 
 from rv_script_lib import ScriptBase
+from rv_script_lib.isolation import IsolatedJobFailed
+from rv_script_lib.signals import deferred_calls
+from rv_script_lib.status import read_status
 
 
 class TestScriptBase(TestCase):
@@ -254,6 +261,51 @@ class TestScriptBase(TestCase):
         self.assertIsInstance(my_job.repeat_interval, datetime.timedelta)
         self.assertEqual(my_job.repeat_interval.total_seconds(), 3600)
 
+    @mock.patch(
+        "sys.argv",
+        ["script_name", "--repeat-schedule", "@hourly", "--repeat-max", "2"],
+    )
+    def test_repeat_schedule(self: Self):
+        class MyScript(ScriptBase):
+            RUN_COUNT = 0
+
+            def runJob(self: Self):
+                self.RUN_COUNT += 1
+
+        my_job = MyScript()
+        fire_times = []
+        runs_before_fire = []
+
+        def next_fire(after: datetime.datetime) -> datetime.datetime:
+            runs_before_fire.append(my_job.RUN_COUNT)
+            fire_times.append(after + datetime.timedelta(milliseconds=10))
+            return fire_times[-1]
+
+        with mock.patch.object(my_job.schedule, "next_fire", side_effect=next_fire):
+            my_job.run()
+
+        self.assertEqual(my_job.RUN_COUNT, 2)
+        # waits for the first fire time before the first run
+        self.assertEqual(runs_before_fire[0], 0)
+        self.assertIn(
+            my_job.prom_registry.get_sample_value(
+                "scriptbase_next_run_timestamp_seconds"
+            ),
+            [fire.timestamp() for fire in fire_times],
+        )
+
+    @mock.patch(
+        "sys.argv",
+        ["script_name", "--repeat-schedule", "@hourly", "--repeat-interval", "1h"],
+    )
+    def test_repeat_schedule_exclusive(self: Self):
+        class MyScript(ScriptBase):
+            def runJob(self: Self):
+                pass
+
+        with mock.patch("sys.stderr"), self.assertRaises(SystemExit):
+            MyScript()
+
 
 class TestScriptBaseTextfiles(TestCase):
     def setUp(self: Self):
@@ -289,3 +341,602 @@ class TestScriptBaseTextfiles(TestCase):
             my_job.run()
 
         self.assertTrue(os.path.isfile(self.prom_textfile))
+
+
+class TestScriptBaseShutdown(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.assertFalse(structlog.is_configured())
+
+    @mock.patch("sys.argv", ["script_name", "--repeat-interval", "1h"])
+    def test_sigterm_wakes_sleep(self: Self):
+        class MyScript(ScriptBase):
+            RUN_COUNT = 0
+
+            def runJob(self: Self):
+                self.RUN_COUNT += 1
+                os.kill(os.getpid(), signal.SIGTERM)
+
+        my_job = MyScript()
+
+        with mock.patch.object(my_job.healthcheck, "exit_status") as exit_status:
+            started = time.monotonic()
+            my_job.run()
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(my_job.RUN_COUNT, 1)
+        exit_status.assert_called_once_with(0)
+        self.assertIs(signal.getsignal(signal.SIGTERM), signal.SIG_DFL)
+
+    @mock.patch(
+        "sys.argv",
+        ["script_name", "--repeat-interval", "1h", "--shutdown-grace", "0.1s"],
+    )
+    def test_grace_expired(self: Self):
+        class MyScript(ScriptBase):
+            def runJob(self: Self):
+                os.kill(os.getpid(), signal.SIGTERM)
+                time.sleep(5)
+
+        my_job = MyScript()
+
+        with mock.patch.object(my_job.healthcheck, "exit_status") as exit_status:
+            with self.assertRaises(SystemExit) as exit_context:
+                my_job.run()
+
+        self.assertEqual(exit_context.exception.code, 128 + signal.SIGTERM)
+        exit_status.assert_called_once_with(128 + signal.SIGTERM)
+        self.assertEqual(my_job.prom_repeat_count.labels("fail")._value.get(), 1)
+
+    @mock.patch(
+        "sys.argv",
+        ["script_name", "--repeat-interval", "1h", "--shutdown-grace", "0.5s"],
+    )
+    def test_signal_before_job(self: Self):
+        class MyScript(ScriptBase):
+            def runJob(self: Self):
+                time.sleep(3)
+
+        my_job = MyScript()
+
+        def start(*args, **kwargs):
+            # arrives after the iteration started, before the job did
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        with mock.patch.object(my_job.healthcheck, "start", side_effect=start):
+            with mock.patch.object(my_job.healthcheck, "exit_status"):
+                started = time.monotonic()
+                with self.assertRaises(SystemExit) as exit_context:
+                    my_job.run()
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(exit_context.exception.code, 128 + signal.SIGTERM)
+
+
+class TestScriptBaseTriggers(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.assertFalse(structlog.is_configured())
+
+    @mock.patch("sys.argv", ["script_name", "--repeat-interval", "1h"])
+    def test_sighup_triggers_repeat(self: Self):
+        class MyScript(ScriptBase):
+            RUN_COUNT = 0
+
+            def runJob(self: Self):
+                self.RUN_COUNT += 1
+                if self.RUN_COUNT == 1:
+                    os.kill(os.getpid(), signal.SIGHUP)
+                else:
+                    os.kill(os.getpid(), signal.SIGTERM)
+
+        my_job = MyScript()
+        my_job.triggers.debounce_seconds = 0
+
+        started = time.monotonic()
+        my_job.run()
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(my_job.RUN_COUNT, 2)
+        self.assertEqual(
+            my_job.prom_registry.get_sample_value(
+                "scriptbase_trigger_latency_seconds_count", {"trigger": "sighup"}
+            ),
+            1,
+        )
+
+
+class TestScriptBaseLogLevel(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.assertFalse(structlog.is_configured())
+
+    @mock.patch("sys.argv", ["script_name"])
+    def test_log_level_gauge(self: Self):
+        class MyScript(ScriptBase):
+            def runJob(self: Self):
+                os.kill(os.getpid(), signal.SIGUSR1)
+                deferred_calls.flush()
+
+        my_job = MyScript()
+        self.assertEqual(
+            my_job.prom_registry.get_sample_value("scriptbase_log_level"), 20
+        )
+
+        my_job.run()
+
+        self.assertEqual(
+            my_job.prom_registry.get_sample_value("scriptbase_log_level"), 10
+        )
+        self.assertIs(signal.getsignal(signal.SIGUSR1), signal.SIG_DFL)
+
+
+class TestScriptBaseState(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.state_path = os.path.join(self.temp_dir.name, "state.sqlite")
+
+    def test_state_rollback_on_failure(self: Self):
+        class MyScript(ScriptBase):
+            def runJob(self: Self):
+                self.state["runs"] = self.state.get("runs", 0) + 1
+                if self.state["runs"] == 3:
+                    raise RuntimeError("third time unlucky")
+
+        argv = [
+            "script_name",
+            "--state-path",
+            self.state_path,
+            "--repeat-interval",
+            "0s",
+            "--repeat-max",
+            "2",
+        ]
+        with mock.patch("sys.argv", argv):
+            my_job = MyScript()
+            my_job.run()
+            self.assertEqual(my_job.state["runs"], 2)
+            my_job.state.close()
+
+            my_job = MyScript()
+            self.assertEqual(my_job.state["runs"], 2)
+            with self.assertRaises(RuntimeError):
+                my_job.run()
+            self.assertEqual(my_job.state["runs"], 2)
+            my_job.state.close()
+
+
+class TestScriptBaseCache(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.assertFalse(structlog.is_configured())
+
+    @mock.patch(
+        "sys.argv", ["script_name", "--repeat-interval", "0s", "--repeat-max", "3"]
+    )
+    def test_cached(self: Self):
+        class MyScript(ScriptBase):
+            FETCHES = 0
+
+            def fetch(self: Self, name: str) -> str:
+                self.FETCHES += 1
+                return name.upper()
+
+            def runJob(self: Self):
+                lookup = self.cached(ttl=60)(self.fetch)
+                self.assertEqual(lookup("abc"), "ABC")
+
+        my_job = MyScript()
+        my_job.assertEqual = self.assertEqual
+        my_job.run()
+
+        self.assertEqual(my_job.FETCHES, 1)
+
+
+class TestScriptBasePipeline(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.assertFalse(structlog.is_configured())
+
+    @mock.patch("sys.argv", ["script_name"])
+    def test_pipeline_failure_fails_run(self: Self):
+        def explode(items):
+            for item in items:
+                raise ValueError(item)
+                yield item
+
+        class MyScript(ScriptBase):
+            def runJob(self: Self):
+                self.pipeline("broken").stage(explode).drain(range(10))
+
+        my_job = MyScript()
+
+        with self.assertRaises(ValueError):
+            my_job.run()
+
+        self.assertEqual(my_job.prom_registry.get_sample_value("scriptbase_success"), 0)
+
+
+class TestScriptBaseMultiprocess(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.prom_textfile = os.path.join(self.temp_dir.name, "test.prom")
+
+    def test_worker_metrics_exported(self: Self):
+        def count_items(items):
+            for item in items:
+                MyScript.items_seen.inc()
+                yield item
+
+        class MyScript(ScriptBase):
+            PROM_MULTIPROCESS = True
+
+            def extraMetrics(self: Self):
+                MyScript.items_seen = PromCounter(
+                    "test_items_seen", "items", registry=self.prom_registry
+                )
+
+            def runJob(self: Self):
+                pipe = self.pipeline("count")
+                pipe.stage(count_items, workers=2, mode="process")
+                pipe.drain(range(50))
+
+        with mock.patch(
+            "sys.argv", ["script_name", "--prom-textfile", self.prom_textfile]
+        ):
+            my_job = MyScript()
+            self.addCleanup(my_job.prom_multiprocess.disable)
+            my_job.run()
+
+        with open(self.prom_textfile) as f:
+            textfile = f.read()
+
+        self.assertIn("test_items_seen_total 50.0", textfile)
+        self.assertIn("scriptbase_success 1.0", textfile)
+
+
+class TestScriptBaseTracing(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_spans(self: Self):
+        trace_file = os.path.join(self.temp_dir.name, "spans.jsonl")
+
+        class MyScript(ScriptBase):
+            def runJob(self: Self):
+                with self.span("fetch"):
+                    pass
+
+        with mock.patch("sys.argv", ["script_name", "--trace-file", trace_file]):
+            my_job = MyScript()
+            my_job.run()
+
+        self.assertEqual(
+            my_job.prom_registry.get_sample_value(
+                "scriptbase_span_duration_seconds_count", {"span": "fetch"}
+            ),
+            1,
+        )
+        with open(trace_file) as f:
+            (request,) = [json.loads(line) for line in f]
+        fetch, run_job = request["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        self.assertEqual(run_job["name"], "runJob")
+        self.assertEqual(fetch["parentSpanId"], run_job["spanId"])
+
+
+class TestScriptBaseLocking(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_lock_skips_run(self: Self):
+        lock_file = os.path.join(self.temp_dir.name, "job.lock")
+
+        class MyScript(ScriptBase):
+            RUN_COUNT = 0
+
+            def runJob(self: Self):
+                self.RUN_COUNT += 1
+
+        with mock.patch("sys.argv", ["script_name", "--lock-file", lock_file]):
+            holder = MyScript()
+            my_job = MyScript()
+
+        self.assertTrue(holder.instance_lock.acquire())
+        my_job.run()
+        self.assertEqual(my_job.RUN_COUNT, 0)
+        self.assertEqual(
+            my_job.prom_registry.get_sample_value("scriptbase_skipped_runs_total"), 1
+        )
+
+        holder.instance_lock.release()
+        my_job.run()
+        self.assertEqual(my_job.RUN_COUNT, 1)
+
+
+class TestScriptBaseIsolation(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.prom_textfile = os.path.join(self.temp_dir.name, "test.prom")
+
+    def test_isolated_iterations(self: Self):
+        class MyScript(ScriptBase):
+            def extraMetrics(self: Self):
+                self.items_seen = PromCounter(
+                    "test_items_seen", "items", registry=self.prom_registry
+                )
+
+            def runJob(self: Self):
+                self.items_seen.inc(10)
+                self.state["pids"] = self.state.get("pids", []) + [os.getpid()]
+                if len(self.state["pids"]) == 3:
+                    raise RuntimeError("third time unlucky")
+
+        argv = [
+            "script_name",
+            "--isolate-iterations",
+            "--repeat-interval",
+            "0s",
+            "--repeat-max",
+            "3",
+            "--prom-textfile",
+            self.prom_textfile,
+        ]
+        with mock.patch("sys.argv", argv):
+            my_job = MyScript()
+            self.addCleanup(my_job.prom_multiprocess.disable)
+            with self.assertRaises(IsolatedJobFailed):
+                my_job.run()
+
+        self.assertEqual(len(my_job.state["pids"]), 2)
+        self.assertNotIn(os.getpid(), my_job.state["pids"])
+        self.assertEqual(my_job.prom_repeat_count.labels("fail")._value.get(), 1)
+
+        with open(self.prom_textfile) as f:
+            textfile = f.read()
+        self.assertIn("test_items_seen_total 20.0", textfile)
+
+    def test_isolated_work_queue(self: Self):
+        class MyScript(ScriptBase):
+            def runJob(self: Self):
+                queue = self.work_queue("numbers")
+                for item in queue.claim(limit=2):
+                    self.state["seen"] = self.state.get("seen", []) + [item.payload]
+                    queue.ack(item)
+
+        argv = [
+            "script_name",
+            "--isolate-iterations",
+            "--repeat-interval",
+            "0s",
+            "--repeat-max",
+            "2",
+        ]
+        with mock.patch("sys.argv", argv):
+            my_job = MyScript()
+            self.addCleanup(my_job.prom_multiprocess.disable)
+            my_job.work_queue("numbers").put_many([1, 2, 3])
+            my_job.run()
+
+        # the children share the queue with the parent instead of a blank copy
+        self.assertEqual(my_job.state["seen"], [1, 2, 3])
+        self.assertEqual(
+            my_job.work_queue("numbers").depth(), {"ready": 0, "leased": 0}
+        )
+
+
+class TestScriptBaseStats(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.assertFalse(structlog.is_configured())
+
+    @mock.patch(
+        "sys.argv", ["script_name", "--repeat-interval", "0s", "--repeat-max", "3"]
+    )
+    def test_iteration_stats(self: Self):
+        class MyScript(ScriptBase):
+            STATS_SUMMARY_INTERVAL = 0
+
+            def runJob(self: Self):
+                self.add_items(5)
+
+        my_job = MyScript()
+        with capture_logs() as cap_logs:
+            my_job.run()
+
+        self.assertEqual(my_job.stats.total, 3)
+        self.assertEqual(list(my_job.stats.items[:3]), [5, 5, 5])
+        self.assertEqual(
+            my_job.prom_registry.get_sample_value(
+                "scriptbase_iteration_failure_streak"
+            ),
+            0,
+        )
+        summaries = [log for log in cap_logs if log["event"] == "Iteration summary"]
+        self.assertEqual(len(summaries), 3)
+        self.assertEqual(summaries[-1]["iterations"], 3)
+
+
+class TestScriptBaseWorkQueue(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_work_queue(self: Self):
+        work_queue_path = os.path.join(self.temp_dir.name, "work.sqlite")
+
+        class MyScript(ScriptBase):
+            def runJob(self: Self):
+                queue = self.work_queue("numbers")
+                for item in queue.claim(limit=2):
+                    self.add_items(item.payload)
+                    queue.ack(item)
+
+        argv = [
+            "script_name",
+            "--work-queue-path",
+            work_queue_path,
+            "--repeat-interval",
+            "0s",
+            "--repeat-max",
+            "2",
+        ]
+        with mock.patch("sys.argv", argv):
+            my_job = MyScript()
+            my_job.work_queue("numbers").put_many([1, 2, 3])
+            my_job.run()
+
+        self.assertEqual(sum(my_job.stats.items), 6)
+        self.assertEqual(
+            my_job.prom_registry.get_sample_value(
+                "scriptbase_work_queue_depth", {"queue": "numbers", "state": "ready"}
+            ),
+            0,
+        )
+
+    def test_work_queue_no_wal(self: Self):
+        with mock.patch("sys.argv", ["script_name"]):
+            self.assertTrue(ScriptBase().work_queue("numbers").wal)
+        work_queue_path = os.path.join(self.temp_dir.name, "work.sqlite")
+        argv = [
+            "script_name",
+            "--work-queue-path",
+            work_queue_path,
+            "--work-queue-no-wal",
+        ]
+        with mock.patch("sys.argv", argv):
+            my_job = ScriptBase()
+        queue = my_job.work_queue("numbers")
+        self.assertFalse(queue.wal)
+        mode = queue._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertNotEqual(mode, "wal")
+        self.assertTrue(my_job.work_queue("other", wal=True).wal)
+
+
+class TestScriptBaseBudget(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.assertFalse(structlog.is_configured())
+
+    @mock.patch(
+        "sys.argv", ["script_name", "--repeat-interval", "10s", "--repeat-max", "1"]
+    )
+    def test_budget_from_interval(self: Self):
+        class MyScript(ScriptBase):
+            def runJob(self: Self):
+                self.remaining = self.time_remaining()
+                self.deadline_left = self.deadline - time.monotonic()
+
+        my_job = MyScript()
+        self.assertIsNone(my_job.deadline)
+        my_job.run()
+
+        self.assertGreater(my_job.remaining, 8)
+        self.assertLessEqual(my_job.remaining, 9)
+        self.assertAlmostEqual(my_job.deadline_left, my_job.remaining, delta=0.5)
+
+    @mock.patch("sys.argv", ["script_name", "--job-budget", "0.1s"])
+    def test_iter_within_budget(self: Self):
+        class MyScript(ScriptBase):
+            def runJob(self: Self):
+                self.processed = []
+                self.checkpoints = []
+                numbers = self.iter_within_budget(
+                    range(100), checkpoint=self.checkpoints.append
+                )
+                for number in numbers:
+                    time.sleep(0.02)
+                    self.processed.append(number)
+
+        my_job = MyScript()
+        my_job.run()
+
+        self.assertGreater(len(my_job.processed), 0)
+        self.assertLess(len(my_job.processed), 10)
+        self.assertEqual(my_job.checkpoints, [my_job.processed[-1]])
+        self.assertEqual(
+            my_job.prom_registry.get_sample_value(
+                "scriptbase_job_budget_exhausted_total"
+            ),
+            1,
+        )
+
+
+class TestScriptBaseLabelLimits(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.assertFalse(structlog.is_configured())
+
+    @mock.patch("sys.argv", ["script_name"])
+    def test_label_set_limit(self: Self):
+        class MyScript(ScriptBase):
+            PROM_MAX_LABEL_SETS = 2
+
+            def extraMetrics(self: Self):
+                self.customers = PromCounter(
+                    "customers", "customers", ["customer"], registry=self.prom_registry
+                )
+
+            def runJob(self: Self):
+                for customer in ("a", "b", "c", "d"):
+                    self.customers.labels(customer).inc()
+
+        my_job = MyScript()
+        my_job.run()
+
+        self.assertEqual(
+            my_job.prom_registry.get_sample_value(
+                "customers_total", {"customer": "other"}
+            ),
+            2,
+        )
+        self.assertEqual(
+            my_job.prom_registry.get_sample_value(
+                "scriptbase_metric_label_sets", {"metric": "customers"}
+            ),
+            2,
+        )
+
+
+class TestScriptBaseStatus(TestCase):
+    def setUp(self: Self):
+        structlog.reset_defaults()
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_status_file(self: Self):
+        class MyScript(ScriptBase):
+            def runJob(self: Self):
+                self.seen = read_status(self.status.path)
+
+        argv = [
+            "script_name",
+            "--status-dir",
+            self.temp_dir.name,
+            "--repeat-interval",
+            "0s",
+            "--repeat-max",
+            "2",
+        ]
+        with mock.patch("sys.argv", argv):
+            my_job = MyScript()
+        self.addCleanup(my_job.status.close)
+        my_job.run()
+
+        self.assertEqual(my_job.seen["phase"], "running")
+        self.assertEqual(my_job.seen["iteration"], 2)
+        record = read_status(my_job.status.path)
+        self.assertEqual(record["name"], "script_name")
+        self.assertEqual(record["phase"], "done")
+        self.assertEqual(record["last_status"], "success")
+        self.assertEqual(record["iteration"], 2)
@@ -0,0 +1,65 @@
+import os
+import signal
+import time
+from typing import Self
+from unittest import TestCase
+
+from rv_script_lib.shutdown import ShutdownGraceExpired, ShutdownHandler
+
+
+class TestShutdownHandler(TestCase):
+    def setUp(self: Self):
+        self.handler = ShutdownHandler(grace_seconds=0.1)
+        self.handler.install()
+        self.addCleanup(self.handler.restore)
+
+    def test_wait_timeout(self: Self):
+        self.assertFalse(self.handler.wait(0.01))
+        self.assertEqual(self.handler.exit_code, 0)
+
+    def test_signal_wakes_wait(self: Self):
+        os.kill(os.getpid(), signal.SIGINT)
+
+        self.assertTrue(self.handler.wait(5))
+        self.assertEqual(self.handler.exit_code, 128 + signal.SIGINT)
+
+    def test_job_finishes_within_grace(self: Self):
+        with self.handler.job():
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        self.assertTrue(self.handler.requested.wait(5))
+        self.assertFalse(self.handler.in_job)
+
+        # the grace timer should have been cancelled with the job
+        time.sleep(0.2)
+
+    def test_job_exceeds_grace(self: Self):
+        with self.assertRaises(ShutdownGraceExpired) as context:
+            with self.handler.job():
+                os.kill(os.getpid(), signal.SIGTERM)
+                time.sleep(5)
+
+        self.assertEqual(context.exception.signum, signal.SIGTERM)
+
+    def test_signal_before_job(self: Self):
+        os.kill(os.getpid(), signal.SIGTERM)
+
+        started = time.monotonic()
+        with self.assertRaises(ShutdownGraceExpired):
+            with self.handler.job():
+                time.sleep(5)
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_second_signal_abandons_job(self: Self):
+        self.handler.grace_seconds = 60
+
+        with self.assertRaises(ShutdownGraceExpired):
+            with self.handler.job():
+                os.kill(os.getpid(), signal.SIGTERM)
+                os.kill(os.getpid(), signal.SIGTERM)
+                time.sleep(5)
+
+    def test_restore(self: Self):
+        self.handler.restore()
+        self.assertIs(signal.getsignal(signal.SIGTERM), signal.SIG_DFL)
+        self.assertIs(signal.getsignal(signal.SIGINT), signal.default_int_handler)
@@ -0,0 +1,65 @@
+import os
+from tempfile import TemporaryDirectory
+from typing import Self
+from unittest import TestCase
+
+from rv_script_lib.state import StateStore
+
+
+class TestStateStore(TestCase):
+    def setUp(self: Self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, "state.sqlite")
+
+    def test_memory_only(self: Self):
+        state = StateStore()
+        state["cursor"] = 5
+        state.commit()
+        state["cursor"] = 10
+        state.rollback()
+
+        self.assertEqual(state["cursor"], 5)
+
+    def test_persist(self: Self):
+        state = StateStore(path=self.path)
+        state["cursor"] = 5
+        state["seen"] = ["a", "b"]
+        self.assertEqual(state.commit(), 2)
+        self.assertEqual(state.commit(), 0)
+        state.close()
+
+        state = StateStore(path=self.path)
+        self.addCleanup(state.close)
+        self.assertEqual(dict(state), {"cursor": 5, "seen": ["a", "b"]})
+
+    def test_in_place_changes(self: Self):
+        state = StateStore(path=self.path)
+        self.addCleanup(state.close)
+        state["seen"] = ["a"]
+        state.commit()
+
+        state["seen"].append("b")
+        state.rollback()
+        self.assertEqual(state["seen"], ["a"])
+
+        state["seen"].append("c")
+        self.assertEqual(state.commit(), 1)
+        state.reload()
+        self.assertEqual(state["seen"], ["a", "c"])
+
+    def test_delete(self: Self):
+        state = StateStore(path=self.path)
+        self.addCleanup(state.close)
+        state["cursor"] = 1
+        state.commit()
+
+        del state["cursor"]
+        self.assertEqual(state.commit(), 1)
+        state.reload()
+        self.assertNotIn("cursor", state)
+
+    def test_bad_key(self: Self):
+        state = StateStore()
+        with self.assertRaises(TypeError):
+            state[1] = "one"
@@ -0,0 +1,56 @@
+from typing import Self
+from unittest import TestCase
+
+from prometheus_client import CollectorRegistry
+
+from rv_script_lib.stats import IterationStats, StatsMetrics
+
+
+class TestIterationStats(TestCase):
+    def test_empty(self: Self):
+        stats = IterationStats(size=4)
+        self.assertEqual(stats.percentile(0.5), 0)
+        self.assertEqual(stats.failure_ratio(), 0)
+        self.assertEqual(stats.items_per_second(), 0)
+
+    def test_window(self: Self):
+        stats = IterationStats(size=4)
+        for i in range(1, 11):
+            stats.record(start=i, duration=i, success=True, items=i * 10)
+
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(stats.total, 10)
+        self.assertEqual(sorted(stats.durations), [7, 8, 9, 10])
+        self.assertEqual(stats.percentile(0.5), 8)
+        self.assertEqual(stats.percentile(0.99), 10)
+        self.assertEqual(stats.items_per_second(), 10)
+
+    def test_failures(self: Self):
+        stats = IterationStats(size=4)
+        for success in (False, True, False, False):
+            stats.record(start=0, duration=1, success=success)
+
+        self.assertEqual(stats.failure_streak, 2)
+        self.assertEqual(stats.failure_ratio(), 0.75)
+        self.assertEqual(stats.summary()["p50_seconds"], 1)
+
+        stats.record(start=0, duration=1, success=True)
+        self.assertEqual(stats.failure_streak, 0)
+
+    def test_metrics(self: Self):
+        registry = CollectorRegistry()
+        metrics = StatsMetrics(registry=registry, prefix="test")
+        stats = IterationStats()
+        stats.record(start=0, duration=2, success=False, items=8)
+        metrics.update(stats)
+
+        self.assertEqual(
+            registry.get_sample_value(
+                "test_iteration_duration_seconds", {"quantile": "0.99"}
+            ),
+            2,
+        )
+        self.assertEqual(registry.get_sample_value("test_iteration_failure_streak"), 1)
+        self.assertEqual(
+            registry.get_sample_value("test_iteration_items_per_second"), 4
+        )
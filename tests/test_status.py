@@ -0,0 +1,95 @@
+import io
+import json
+import os
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from typing import Self
+from unittest import TestCase
+
+from rv_script_lib.status import StatusFile, main, read_status, read_status_dir
+
+DEAD_PID = 2**22 + 1
+
+
+class TestStatusFile(TestCase):
+    def setUp(self: Self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_round_trip(self: Self):
+        status = StatusFile(directory=self.temp_dir.name, name="my job")
+        self.addCleanup(status.close)
+        self.assertEqual(os.path.basename(status.path), f"my_job.{os.getpid()}.status")
+
+        status.update(phase="running", iteration=3)
+        status.update(last_duration=1.5, last_status="success", next_fire=1e9)
+
+        record = read_status(status.path)
+        self.assertEqual(record["name"], "my job")
+        self.assertEqual(record["pid"], os.getpid())
+        self.assertTrue(record["alive"])
+        self.assertEqual(record["iteration"], 3)
+        self.assertEqual(record["phase"], "running")
+        self.assertEqual(record["last_status"], "success")
+        self.assertEqual(record["last_duration"], 1.5)
+        self.assertEqual(record["next_fire"], 1e9)
+        self.assertGreaterEqual(record["updated"], record["started"])
+
+    def test_close_removes_file(self: Self):
+        status = StatusFile(directory=self.temp_dir.name)
+        status.close()
+        self.assertFalse(os.path.exists(status.path))
+        # updates after close are ignored
+        status.update(phase="late")
+
+    def test_anonymous(self: Self):
+        status = StatusFile()
+        status.update(phase="running")
+        self.assertIsNone(status.path)
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+        status.close()
+
+    def test_not_a_status_file(self: Self):
+        path = os.path.join(self.temp_dir.name, "junk.status")
+        with open(path, "wb") as f:
+            f.write(b"x" * 500)
+        self.assertIsNone(read_status(path))
+        self.assertEqual(read_status_dir(self.temp_dir.name), [])
+
+
+class TestStatusCommand(TestCase):
+    def setUp(self: Self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.live = StatusFile(directory=self.temp_dir.name, name="live")
+        self.addCleanup(self.live.close)
+        self.live.update(phase="sleeping", iteration=2, last_status="fail")
+
+        # a file left behind by a process that is gone
+        self.stale = StatusFile(directory=self.temp_dir.name, name="stale")
+        self.stale.update(pid=DEAD_PID)
+
+    def run_main(self: Self, *argv: str) -> str:
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(main(["--status-dir", self.temp_dir.name, *argv]), 0)
+        return output.getvalue()
+
+    def test_table(self: Self):
+        lines = self.run_main().splitlines()
+        self.assertEqual(lines[0].split()[:3], ["NAME", "PID", "ALIVE"])
+        self.assertEqual(len(lines), 3)
+        live = next(line for line in lines if line.startswith("live"))
+        self.assertEqual(
+            live.split()[:6], ["live", str(os.getpid()), "yes", "2", "sleeping", "fail"]
+        )
+
+    def test_json_and_prune(self: Self):
+        records = [json.loads(line) for line in self.run_main("--json").splitlines()]
+        self.assertEqual(
+            {r["name"]: r["alive"] for r in records}, {"live": True, "stale": False}
+        )
+
+        records = self.run_main("--json", "--prune").splitlines()
+        self.assertEqual([json.loads(r)["name"] for r in records], ["live"])
+        self.assertFalse(os.path.exists(self.stale.path))
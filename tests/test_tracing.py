@@ -0,0 +1,109 @@
+import json
+import os
+from tempfile import TemporaryDirectory
+from typing import Self
+from unittest import TestCase
+
+import structlog
+from prometheus_client import CollectorRegistry
+
+from rv_script_lib.tracing import (
+    SPAN_STATUS_ERROR,
+    SPAN_STATUS_OK,
+    Tracer,
+    current_span,
+    set_tracer,
+    span,
+)
+
+
+class TestTracer(TestCase):
+    def setUp(self: Self):
+        self.registry = CollectorRegistry()
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.trace_file = os.path.join(self.temp_dir.name, "spans.jsonl")
+        self.tracer = Tracer(
+            registry=self.registry,
+            prefix="test",
+            export_path=self.trace_file,
+            service_name="tests",
+        )
+
+    def span_count(self: Self, name: str) -> float:
+        return self.registry.get_sample_value(
+            "test_span_duration_seconds_count", {"span": name}
+        )
+
+    def read_spans(self: Self) -> list[dict]:
+        spans = []
+        with open(self.trace_file) as f:
+            for line in f:
+                request = json.loads(line)
+                for resource_spans in request["resourceSpans"]:
+                    for scope_spans in resource_spans["scopeSpans"]:
+                        spans.extend(scope_spans["spans"])
+        return spans
+
+    def test_nesting(self: Self):
+        with self.tracer.span("job") as outer:
+            with self.tracer.span("fetch", rows=3) as inner:
+                self.assertIs(current_span(), inner)
+                context = structlog.contextvars.get_contextvars()
+                self.assertEqual(context["span_id"], inner.span_id)
+            self.assertIs(current_span(), outer)
+
+        self.assertIsNone(current_span())
+        self.assertNotIn("span_id", structlog.contextvars.get_contextvars())
+        self.assertEqual(inner.trace_id, outer.trace_id)
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertEqual(self.span_count("job"), 1)
+        self.assertEqual(self.span_count("fetch"), 1)
+
+    def test_decorator(self: Self):
+        @self.tracer.span("step")
+        def step(x: int) -> int:
+            return current_span().name, x
+
+        self.assertEqual(step(1), ("step", 1))
+        self.assertEqual(step(2), ("step", 2))
+        self.assertEqual(self.span_count("step"), 2)
+
+    def test_export(self: Self):
+        with self.tracer.span("job"):
+            with self.assertRaises(ValueError):
+                with self.tracer.span("upload", target="s3", retries=2):
+                    raise ValueError("nope")
+
+        self.assertEqual(self.tracer.flush(), 2)
+        self.assertEqual(self.tracer.flush(), 0)
+
+        upload, job = self.read_spans()
+        self.assertEqual(upload["name"], "upload")
+        self.assertEqual(upload["parentSpanId"], job["spanId"])
+        self.assertEqual(upload["status"]["code"], SPAN_STATUS_ERROR)
+        self.assertIn(
+            {"key": "retries", "value": {"intValue": "2"}}, upload["attributes"]
+        )
+        self.assertEqual(job["status"]["code"], SPAN_STATUS_OK)
+        self.assertNotIn("parentSpanId", job)
+
+    def test_disabled(self: Self):
+        tracer = Tracer(enabled=False)
+        self.assertIs(tracer.span("a"), tracer.span("b", x=1))
+        with tracer.span("a") as disabled_span:
+            self.assertIsNone(disabled_span)
+            self.assertIsNone(current_span())
+
+    def test_module_span(self: Self):
+        @span("lazy")
+        def lazy():
+            return current_span()
+
+        set_tracer(None)
+        self.assertIsNone(lazy())
+
+        set_tracer(self.tracer)
+        self.addCleanup(set_tracer, None)
+        self.assertEqual(lazy().name, "lazy")
+        self.assertEqual(self.span_count("lazy"), 1)
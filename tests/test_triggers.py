@@ -0,0 +1,151 @@
+import os
+import signal
+import socket
+import threading
+import time
+from tempfile import TemporaryDirectory
+from typing import Self
+from unittest import TestCase
+
+import requests
+
+from rv_script_lib.triggers import (
+    FileWatchTrigger,
+    HttpControlTrigger,
+    SocketControlTrigger,
+    TriggerSet,
+    parse_host_port,
+    run_control_command,
+)
+
+
+class TestTriggerSet(TestCase):
+    def setUp(self: Self):
+        self.triggers = TriggerSet(debounce_seconds=0.05)
+
+    def test_timeout(self: Self):
+        started = time.monotonic()
+        self.assertEqual(self.triggers.wait(0.05), [])
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+    def test_coalesce(self: Self):
+        self.triggers.fire("file")
+        self.triggers.fire("socket")
+        self.triggers.fire("file")
+
+        triggered = self.triggers.wait(5)
+
+        self.assertEqual(
+            [reason for reason, _ in triggered], ["file", "socket", "file"]
+        )
+
+        # everything was drained in one wake-up
+        self.assertEqual(self.triggers.wait(0.01), [])
+
+    def test_fire_from_thread(self: Self):
+        timer = threading.Timer(0.05, self.triggers.fire, args=("test",))
+        timer.start()
+
+        started = time.monotonic()
+        triggered = self.triggers.wait(5)
+
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(triggered[0][0], "test")
+
+    def test_stop(self: Self):
+        self.triggers.fire("file")
+        self.triggers.stop.set()
+
+        self.assertEqual(self.triggers.wait(5), [])
+
+    def test_sighup(self: Self):
+        self.triggers.install_sighup()
+        self.addCleanup(self.triggers.restore_sighup)
+
+        os.kill(os.getpid(), signal.SIGHUP)
+
+        self.assertEqual(self.triggers.wait(5)[0][0], "sighup")
+
+
+class TestTriggerSources(TestCase):
+    def setUp(self: Self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.triggers = TriggerSet(debounce_seconds=0)
+        self.addCleanup(self.triggers.close)
+
+    def test_file_watch(self: Self):
+        self.triggers.add_source(
+            FileWatchTrigger(paths=[self.temp_dir.name], poll_seconds=0.02)
+        )
+        self.triggers.start()
+
+        with open(os.path.join(self.temp_dir.name, "new_file"), "w") as f:
+            f.write("hello")
+
+        self.assertEqual(self.triggers.wait(5)[0][0], "file")
+
+    def test_socket(self: Self):
+        path = os.path.join(self.temp_dir.name, "control.sock")
+        self.triggers.add_source(SocketControlTrigger(path=path))
+        self.triggers.start()
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(path)
+            client.sendall(b"kick\n")
+            self.assertEqual(client.recv(64), b"ok\n")
+
+        self.assertEqual(self.triggers.wait(5)[0][0], "socket")
+
+    def test_socket_path_safety(self: Self):
+        path = os.path.join(self.temp_dir.name, "control.sock")
+
+        # a regular file is never removed
+        with open(path, "w") as f:
+            f.write("keep me")
+        with self.assertRaises(FileExistsError):
+            SocketControlTrigger(path=path).start(self.triggers)
+        self.assertTrue(os.path.isfile(path))
+        os.remove(path)
+
+        # a live socket belongs to another instance
+        first = SocketControlTrigger(path=path)
+        first.start(self.triggers)
+        self.addCleanup(first.stop)
+        with self.assertRaises(OSError):
+            SocketControlTrigger(path=path).start(self.triggers)
+        first.stop()
+
+        # a socket nobody listens on is left over and replaced
+        leftover = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        leftover.bind(path)
+        leftover.close()
+        second = SocketControlTrigger(path=path)
+        second.start(self.triggers)
+        second.stop()
+        self.assertFalse(os.path.exists(path))
+
+    def test_http(self: Self):
+        source = HttpControlTrigger(host="127.0.0.1", port=0)
+        self.triggers.add_source(source)
+        self.triggers.start()
+
+        resp = requests.post(f"http://127.0.0.1:{source.port}/kick", timeout=5)
+        self.assertEqual(resp.status_code, 200)
+
+        resp = requests.post(f"http://127.0.0.1:{source.port}/nope", timeout=5)
+        self.assertEqual(resp.status_code, 400)
+
+        self.assertEqual(self.triggers.wait(5)[0][0], "http")
+
+
+class TestHelpers(TestCase):
+    def test_parse_host_port(self: Self):
+        self.assertEqual(parse_host_port("8080"), ("127.0.0.1", 8080))
+        self.assertEqual(parse_host_port("0.0.0.0:81"), ("0.0.0.0", 81))
+
+    def test_run_control_command(self: Self):
+        commands = {"echo": lambda args: " ".join(args)}
+
+        self.assertEqual(run_control_command(commands, "echo a b\n"), "a b")
+        self.assertTrue(run_control_command(commands, "nope").startswith("error"))
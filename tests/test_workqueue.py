@@ -0,0 +1,102 @@
+import multiprocessing
+import os
+import time
+from tempfile import TemporaryDirectory
+from typing import Self
+from unittest import TestCase
+
+from prometheus_client import CollectorRegistry
+
+from rv_script_lib.workqueue import WorkQueue, WorkQueueMetrics
+
+
+def drain_queue(path: str, results):
+    queue = WorkQueue(path, "jobs")
+    while items := queue.claim(limit=3):
+        for item in items:
+            results.put(item.payload)
+        queue.ack(*items)
+
+
+class TestWorkQueue(TestCase):
+    def setUp(self: Self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, "work.sqlite")
+        self.registry = CollectorRegistry()
+        self.metrics = WorkQueueMetrics(registry=self.registry, prefix="test")
+        self.queue = WorkQueue(self.path, "jobs", metrics=self.metrics)
+        self.addCleanup(self.queue.close)
+
+    def sample(self: Self, name: str, labels: dict) -> float:
+        return self.registry.get_sample_value(name, labels) or 0
+
+    def test_claim_ack(self: Self):
+        self.queue.put_many([{"n": i} for i in range(5)])
+        other = WorkQueue(self.path, "other")
+        self.addCleanup(other.close)
+        other.put("elsewhere")
+
+        items = self.queue.claim(limit=3)
+        self.assertEqual([item.payload["n"] for item in items], [0, 1, 2])
+        self.assertEqual(self.queue.depth(), {"ready": 2, "leased": 3})
+        self.assertEqual(
+            self.sample("test_work_queue_depth", {"queue": "jobs", "state": "leased"}),
+            3,
+        )
+
+        self.assertEqual(self.queue.ack(*items), 3)
+        self.assertEqual(len(self.queue.claim(limit=10)), 2)
+        self.assertEqual(self.queue.claim(), [])
+        self.assertEqual(
+            self.sample(
+                "test_work_queue_claim_latency_seconds_count", {"queue": "jobs"}
+            ),
+            3,
+        )
+
+    def test_lease_expiry(self: Self):
+        self.queue.put("slow")
+        (item,) = self.queue.claim(lease_seconds=0.1)
+        self.assertEqual(self.queue.claim(), [])
+
+        time.sleep(0.2)
+        second = WorkQueue(self.path, "jobs", metrics=self.metrics)
+        self.addCleanup(second.close)
+        (again,) = second.claim()
+        self.assertEqual(again.attempts, 2)
+        self.assertEqual(
+            self.sample("test_work_queue_redeliveries_total", {"queue": "jobs"}), 1
+        )
+
+        # the first lease is gone, so its ack does nothing
+        self.assertEqual(self.queue.ack(item), 0)
+        self.assertEqual(second.ack(again), 1)
+
+    def test_nack_and_extend(self: Self):
+        self.queue.put("retry")
+        (item,) = self.queue.claim(lease_seconds=0.1)
+        self.assertEqual(self.queue.extend(item, lease_seconds=60), 1)
+        time.sleep(0.2)
+        self.assertEqual(self.queue.claim(), [])
+
+        self.assertEqual(self.queue.nack(item, delay=60), 1)
+        self.assertEqual(self.queue.claim(), [])
+        self.assertEqual(self.queue.depth(), {"ready": 1, "leased": 0})
+
+    def test_processes_share_work(self: Self):
+        self.queue.put_many(range(30))
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        workers = [
+            context.Process(target=drain_queue, args=(self.path, results))
+            for _ in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        seen = [results.get(timeout=10) for _ in range(30)]
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(sorted(seen), list(range(30)))
+        self.assertEqual(self.queue.depth(), {"ready": 0, "leased": 0})